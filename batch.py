@@ -0,0 +1,217 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from damage_parameters import DamageParameters
+from knapsack import get_best_combination
+from manager import Manager
+from permutation_store import PermutationTrie
+from spell import Spell
+from spell_chain import SpellChains
+from stats import Stats
+
+
+JOB_MODES = ('dmg', 'dmgs')
+
+
+def load_jobs(filepath: str) -> List[Dict[str, Any]]:
+    """Load the jobs of a JSON file (a list of jobs or an object with a 'jobs' list) or of a JSONL file (one job per line)."""
+    with open(filepath, 'r', encoding='utf-8') as fi:
+        content = fi.read()
+
+    try:
+        json_data = json.loads(content)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in content.splitlines() if line.strip() != '']
+
+    if isinstance(json_data, dict):
+        if 'jobs' in json_data:
+            return json_data['jobs']
+        return [json_data]  # JSONL file with only one job
+
+    if not isinstance(json_data, list):
+        raise TypeError(f"Job file '{filepath}' should contain a list of jobs.")
+
+    return json_data
+
+
+def compute_job(mode: str, spell_list: List[Spell], stats: Stats, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None) -> Dict[str, Any]:
+    """Compute the damages of one job and return its structured result (without the job metadata)."""
+    start = time.perf_counter()
+
+    if mode == 'dmgs':
+        best_spells, max_damages = get_best_combination(spell_list, stats, parameters)
+        best_spells.sort(key=lambda spell: spell.get_pa(), reverse=True)
+        return {
+            'best_combination': [spell.get_short_name() for spell in best_spells],
+            'average_damages': max_damages,
+            'damages': None,
+            'combinations_count': None,
+            'timings': {'evaluation': time.perf_counter() - start}
+        }
+
+    spell_chain = SpellChains()
+    for spell in spell_list:
+        spell_chain.add_spell(spell)
+
+    damages = spell_chain.get_detailed_damages(stats, parameters, cache=cache)
+    best_combination = next(iter(damages), ())
+    average_damages, detailed_damages = damages.get(best_combination, (0.0, {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0}))
+
+    return {
+        'best_combination': list(best_combination),
+        'average_damages': average_damages,
+        'damages': detailed_damages,
+        'combinations_count': len(damages),
+        'timings': {'evaluation': time.perf_counter() - start}
+    }
+
+
+def _get_error_result(error: Exception) -> Dict[str, Any]:
+    if not isinstance(error, (KeyError, ValueError, TypeError)):
+        # Unexpected error of the computation (or of the worker process), not an invalid job
+        return {'status': 'error', 'error': f'{type(error).__name__}: {error}'}
+
+    # str() of a KeyError adds quotes around the message
+    return {'status': 'error', 'error': str(error.args[0]) if error.args else str(error)}
+
+
+def _compute_job_with_permutations(mode: str, spell_list: List[Spell], stats: Stats, parameters: DamageParameters, permutations_cache: Optional[Dict[str, PermutationTrie]]) -> Dict[str, Any]:
+    # Executed in the worker processes : the permutations computed by the main process are given as the cache
+    return compute_job(mode, spell_list, stats, parameters, cache=permutations_cache)
+
+
+class BatchRunner:
+    """Execute damages jobs headlessly on the data of a Manager.
+
+    Identical jobs (same spells, total stats and parameters) are only computed once, the permutations are computed once in the main process
+    and shared with the workers through the Manager cache."""
+
+    def __init__(self, manager: Manager, workers: int = 1) -> None:
+        self.manager: Manager = manager
+        self.workers: int = workers
+
+
+    def _prepare_job(self, job: Dict[str, Any]) -> Tuple[str, List[Spell], Stats, DamageParameters]:
+        mode = job.get('mode', 'dmg')
+        if not mode in JOB_MODES:
+            raise ValueError(f"Job mode should be one of {JOB_MODES} ('{mode}' given instead).")
+
+        if not 'spell_set' in job:
+            raise KeyError("Job does not contain a 'spell_set' key.")
+
+        spell_list, total_stats, damages_parameters = self.manager.get_damages_query(job['spell_set'], job.get('parameters', ''), job.get('stats', None))
+
+        return (mode, spell_list, total_stats, damages_parameters)
+
+
+    def run(self, jobs: List[Dict[str, Any]], executor: Executor = None) -> Iterator[Dict[str, Any]]:
+        """Yield the result of every job, in the same order as the jobs."""
+        prepared_jobs: List[Dict[str, Any]] = []
+        # Fingerprint -> index of the first job with this fingerprint
+        unique_jobs: Dict[str, int] = {}
+
+        for index, job in enumerate(jobs):
+            prepared_job = {'id': job.get('id', index), 'job': job, 'result': None, 'duplicate_of': None, 'permutations_time': 0.0}
+            prepared_jobs.append(prepared_job)
+
+            try:
+                mode, spell_list, total_stats, damages_parameters = self._prepare_job(job)
+            except (KeyError, ValueError, TypeError) as e:
+                prepared_job['result'] = _get_error_result(e)
+                continue
+
+            spell_chain = SpellChains()
+            for spell in spell_list:
+                spell_chain.add_spell(spell)
+
+            fingerprint = f'{mode}:{spell_chain.get_fingerprint(total_stats, damages_parameters)}'
+            if fingerprint in unique_jobs:
+                prepared_job['duplicate_of'] = unique_jobs[fingerprint]
+                continue
+            unique_jobs[fingerprint] = index
+
+            permutations_cache = None
+            if mode == 'dmg':
+                start = time.perf_counter()
+                permutations_cache = spell_chain.get_permutations_cache(damages_parameters, self.manager.cache)
+                prepared_job['permutations_time'] = time.perf_counter() - start
+
+            prepared_job['arguments'] = (mode, spell_list, total_stats, damages_parameters, permutations_cache)
+
+        # Computation of the unique jobs
+        pending = [prepared_job for prepared_job in prepared_jobs if 'arguments' in prepared_job]
+        if executor is None and self.workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                self._compute(pending, pool)
+        else:
+            self._compute(pending, executor)
+
+        for prepared_job in prepared_jobs:
+            job = prepared_job['job']
+            output = {'id': prepared_job['id'], 'spell_set': job.get('spell_set'), 'parameters': job.get('parameters', ''), 'stats': job.get('stats', None), 'mode': job.get('mode', 'dmg')}
+
+            if prepared_job['duplicate_of'] is not None:
+                original = prepared_jobs[prepared_job['duplicate_of']]
+                output.update(original['result'])
+                output['duplicate_of'] = original['id']
+            else:
+                output.update(prepared_job['result'])
+                if 'timings' in output:
+                    output['timings'] = {'permutations': prepared_job['permutations_time'], **output['timings']}
+
+            yield output
+
+
+    def _compute(self, pending: List[Dict[str, Any]], executor: Executor = None):
+        if executor is None:
+            for prepared_job in pending:
+                try:
+                    prepared_job['result'] = {'status': 'ok', **_compute_job_with_permutations(*prepared_job['arguments'])}
+                except Exception as e:
+                    prepared_job['result'] = _get_error_result(e)
+            return
+
+        futures = [executor.submit(_compute_job_with_permutations, *prepared_job['arguments']) for prepared_job in pending]
+        for prepared_job, future in zip(pending, futures):
+            try:
+                prepared_job['result'] = {'status': 'ok', **future.result()}
+            except Exception as e:
+                prepared_job['result'] = _get_error_result(e)
+
+
+def run_job_file(manager: Manager, jobs_filepath: str, output_filepath: str, workers: int = 1) -> int:
+    """Execute every job of the file and write the results as JSONL, return the number of failed jobs."""
+    jobs = load_jobs(jobs_filepath)
+    runner = BatchRunner(manager, workers=workers)
+
+    errors_count = 0
+    with open(output_filepath, 'w', encoding='utf-8') as fo:
+        for result in runner.run(jobs):
+            if result['status'] != 'ok':
+                errors_count += 1
+            fo.write(json.dumps(result) + '\n')
+
+    return errors_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Execute damages computations of a JSON or JSONL job file without the interactive prompt.')
+    parser.add_argument('jobs', help="JSON or JSONL file of jobs, each job having a 'spell_set' and optionally an 'id', a 'parameters' string, a 'stats' list and a 'mode' ('dmg' or 'dmgs')")
+    parser.add_argument('-o', '--output', default='results.jsonl', help='JSONL file where the results are written')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--save-cache', action='store_true', help='save the permutations cache after the jobs')
+    arguments = parser.parse_args()
+
+    batch_manager = Manager(lambda code, message: print(f"{'[ERROR] ' if code == 1 else ''}{message}", file=sys.stderr))
+    failed_jobs_count = run_job_file(batch_manager, arguments.jobs, arguments.output, workers=arguments.workers)
+
+    if arguments.save_cache:
+        batch_manager.save_cache()
+
+    if failed_jobs_count > 0:
+        print(f'{failed_jobs_count} job(s) failed, see {arguments.output}.', file=sys.stderr)
+        sys.exit(1)
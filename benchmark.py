@@ -0,0 +1,292 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from characteristics_damages import *
+from damage_parameters import DamageParameters
+from knapsack import get_best_combination
+from manager import Manager
+from spell import Spell, SpellBuff
+from spell_chain import SpellChains
+from spell_set import SpellSet
+from states import HUPPERMAGE_STATES
+from stats import Stats
+
+
+# (name, spell count, PA)
+SCENARIOS: List[Tuple[str, int, int]] = [
+    ('tiny', 4, 6),
+    ('small', 6, 8),
+    ('medium', 8, 10),
+    ('large', 10, 11),
+    ('huge', 12, 12),
+]
+
+# States of the generated buffs (not the Huppermage ones)
+GENERATED_STATES = ('st1', 'st2', 'st3', 'st4')
+
+# Modules which should only be imported when computing damages, not when starting the prompt
+DEFERRED_MODULES = ('distutils', 'tqdm', 'numpy', 'damage_distribution', 'sqlite3')
+
+# Startup of the prompt and a command which does not compute damages, in a new interpreter: prints the deferred modules which were imported
+STARTUP_SCRIPT = f'''
+import json, sys
+from manager import Manager
+manager = Manager(lambda code, message: None)
+manager.execute_command('i')
+print(json.dumps([module for module in {DEFERRED_MODULES!r} if module in sys.modules]))
+'''
+
+
+def generate_stats(rng: random.Random, short_name: str = 'bench') -> Stats:
+    stats = Stats()
+
+    for characteristic in range(CHARACTERISTICS_COUNT):
+        if characteristic != NEUTRAL:
+            stats.set_characteristic(characteristic, rng.randint(0, 1000))
+
+    for damage in (POWER, BASIC, CRIT, EARTH, FIRE, WATER, AIR, D_NEUTRAL):
+        stats.set_damage(damage, rng.randint(0, 150))
+
+    for damage in (SPELL, RANGE, MELEE, FINAL):
+        stats.set_damage(damage, rng.randint(0, 30))
+
+    stats.set_bonus_crit_chance(rng.randint(0, 40) / 100)
+    stats.set_name(f'Benchmark stats {short_name}')
+    stats.set_short_name(short_name)
+
+    return stats
+
+
+def generate_buff(rng: random.Random, spells_short_names: List[str]) -> SpellBuff:
+    buff = SpellBuff()
+    buff_type = rng.choice(('states', 'stats', 'parameters', 'huppermage'))
+
+    if buff_type == 'huppermage':
+        buff.set_huppermage_states(True)
+        for state in rng.sample(HUPPERMAGE_STATES, rng.randint(1, 2)):
+            buff.add_new_output_state(state)
+        return buff
+
+    if rng.random() < 0.5:
+        buff.add_trigger_state(rng.choice(GENERATED_STATES))
+    if rng.random() < 0.2:
+        buff.add_forbidden_state(rng.choice(GENERATED_STATES))
+    if rng.random() < 0.5:
+        buff.add_new_output_state(rng.choice(GENERATED_STATES))
+    if rng.random() < 0.3:
+        buff.add_removed_output_state(rng.choice(GENERATED_STATES))
+
+    if buff_type == 'states':
+        characteristic = rng.randrange(CHARACTERISTICS_COUNT)
+        buff.set_base_damages(characteristic, rng.randint(5, 30))
+        buff.add_additional_damaging_characteristic(characteristic)
+        buff.set_deactivate_damages(rng.random() < 0.05)
+
+    elif buff_type == 'stats':
+        stats = Stats()
+        stats.set_damage(POWER, rng.randint(10, 100))
+        stats.set_characteristic(rng.randrange(NEUTRAL), rng.randint(10, 200))
+        target = rng.choice(['__all__'] + spells_short_names)
+        buff.add_stats(stats, spell=target)
+
+    elif buff_type == 'parameters':
+        target = rng.choice(['__all__'] + spells_short_names)
+        parameters = DamageParameters.from_string(f'-v {rng.randint(5, 25)}')
+        buff.add_damage_parameters(parameters, spell=target)
+
+    return buff
+
+
+def generate_spell(rng: random.Random, short_name: str, spells_short_names: List[str], buff_probability: float = 0.5) -> Spell:
+    spell = Spell()
+    spell.set_name(f'Benchmark spell {short_name}')
+    spell.set_short_name(short_name)
+    spell.set_pa(rng.randint(2, 5))
+    spell.set_crit_chance(rng.randint(0, 30) / 100)
+    spell.set_uses_per_target(rng.choice((-1, 1, 2, 3)))
+    spell.set_uses_per_turn(rng.choice((-1, 2, 3, 4)))
+
+    min_po = rng.randint(0, 4)
+    spell.set_po(min_po=min_po, max_po=min_po + rng.randint(0, 8))
+
+    for characteristic in rng.sample(range(CHARACTERISTICS_COUNT), rng.randint(1, 2)):
+        minimum = rng.randint(5, 40)
+        maximum = minimum + rng.randint(0, 10)
+        spell.set_base_damages(characteristic, {'min': minimum, 'max': maximum, 'crit_min': int(1.2 * minimum), 'crit_max': int(1.2 * maximum)})
+        spell.add_damaging_characteristic(characteristic)
+
+    while rng.random() < buff_probability:
+        spell.add_buff(generate_buff(rng, spells_short_names))
+        buff_probability /= 2
+
+    return spell
+
+
+def generate_spell_set(rng: random.Random, spell_count: int, short_name: str = 'bench') -> SpellSet:
+    spells_short_names = [f'{short_name}_spell{index}' for index in range(spell_count)]
+
+    spell_set = SpellSet()
+    spell_set.set_name(f'Benchmark spell set {short_name}')
+    spell_set.set_short_name(short_name)
+    for spell_short_name in spells_short_names:
+        spell_set.add_spell(generate_spell(rng, spell_short_name, spells_short_names))
+
+    return spell_set
+
+
+def _get_spell_chain(spell_set: SpellSet, parameters: DamageParameters) -> SpellChains:
+    spell_chain = SpellChains()
+    for spell in spell_set.get_spell_list_single_target(parameters):
+        spell_chain.add_spell(spell)
+
+    return spell_chain
+
+
+def _time(function: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return {'times': times, 'min': min(times), 'mean': sum(times) / len(times)}
+
+
+def run_startup(directory: str = None) -> List[str]:
+    """Start the Manager in a new interpreter in the directory (current one by default), and return the deferred modules which were imported."""
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(path for path in (os.path.dirname(os.path.abspath(__file__)), environment.get('PYTHONPATH', '')) if path)
+    process = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True, check=True, cwd=directory, env=environment)
+    return json.loads(process.stdout)
+
+
+def run_chain_benchmarks(scenario: Tuple[str, int, int], seed: int, repeat: int) -> List[Dict[str, Any]]:
+    name, spell_count, pa = scenario
+    rng = random.Random(seed)
+
+    spell_set = generate_spell_set(rng, spell_count)
+    stats = generate_stats(rng)
+    parameters = DamageParameters.from_string(f'-pa {pa} -pomin 1 -pomax 6 -t mono')
+
+    results = list()
+
+    def get_detailed_damages_cold():
+        _get_spell_chain(spell_set, parameters).get_detailed_damages(stats, parameters, cache={})
+
+    warm_cache = {}
+    spell_chain = _get_spell_chain(spell_set, parameters)
+    spell_chain.get_detailed_damages(stats, parameters, cache=warm_cache)
+    permutations_count = sum(len(permutations) for permutations in warm_cache.values())
+
+    def get_detailed_damages_warm():
+        _get_spell_chain(spell_set, parameters).get_detailed_damages(stats, parameters, cache=warm_cache)
+
+    def best_combination():
+        get_best_combination(spell_set.get_spell_list_single_target(parameters), stats, parameters)
+
+    for benchmark, function in (('get_detailed_damages_cold_cache', get_detailed_damages_cold),
+                                ('get_detailed_damages_warm_cache', get_detailed_damages_warm),
+                                ('get_best_combination', best_combination)):
+        result = {'scenario': name, 'spell_count': spell_count, 'pa': pa, 'permutations': permutations_count, 'benchmark': benchmark}
+        result.update(_time(function, repeat))
+        results.append(result)
+
+    return results
+
+
+def run_manager_benchmarks(scenario: Tuple[str, int, int], seed: int, repeat: int) -> List[Dict[str, Any]]:
+    name, spell_count, pa = scenario
+    rng = random.Random(seed)
+    results = list()
+
+    current_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            manager = Manager(lambda code, message: None)
+
+            # Several spell sets and stats pages so that the workspace looks like a real one
+            for set_index in range(3):
+                spell_set = generate_spell_set(rng, spell_count, short_name=f'bench{set_index}')
+                for spell in spell_set:
+                    manager.spells[spell.get_short_name()] = spell
+                manager.spell_sets[spell_set.get_short_name()] = spell_set
+                stats = generate_stats(rng, short_name=f'bench{set_index}')
+                manager.stats[stats.get_short_name()] = stats
+
+            manager.parameters['bench'] = DamageParameters.from_string(f'-s bench0 -pa {pa} -pomin 1 -pomax 6 -t mono')
+            manager.default_parameters = 'bench'
+            manager.execute_command('dmg bench0')  # Fill the cache
+
+            def save():
+                manager.save(print_message=False, save_cache=True)
+
+            def load():
+                Manager(lambda code, message: None)
+
+            def load_cache():
+                manager.cache = {}
+                manager._load_cache()
+
+            def startup():
+                run_startup(directory)
+
+            save()
+            for benchmark, function in (('manager_save', save), ('manager_load', load), ('cache_load', load_cache), ('manager_startup', startup)):
+                result = {'scenario': name, 'spell_count': spell_count, 'pa': pa, 'benchmark': benchmark}
+                result.update(_time(function, repeat))
+                results.append(result)
+        finally:
+            os.chdir(current_directory)
+
+    return results
+
+
+def _get_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(scenarios: List[Tuple[str, int, int]], seed: int = 0, repeat: int = 3) -> Dict[str, Any]:
+    results = list()
+    for scenario in scenarios:
+        results.extend(run_chain_benchmarks(scenario, seed, repeat))
+        results.extend(run_manager_benchmarks(scenario, seed, repeat))
+
+    return {
+        'commit': _get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the damage optimizer benchmarks on synthetic spell sets.')
+    parser.add_argument('-o', '--output', default='bench_output.json', help='JSON file where the results are written')
+    parser.add_argument('-s', '--scenarios', nargs='+', choices=[scenario[0] for scenario in SCENARIOS], default=[scenario[0] for scenario in SCENARIOS[:3]], help='scenarios to run')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of times each benchmark is run')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data generator')
+    arguments = parser.parse_args()
+
+    selected_scenarios = [scenario for scenario in SCENARIOS if scenario[0] in arguments.scenarios]
+    benchmark_results = run_benchmarks(selected_scenarios, seed=arguments.seed, repeat=arguments.repeat)
+
+    with open(arguments.output, 'w', encoding='utf-8') as fo:
+        json.dump(benchmark_results, fo, indent=2)
+
+    for result in benchmark_results['results']:
+        print(f"{result['scenario']:<8}{result['benchmark']:<35}{1000 * result['min']:>10.2f} ms")
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+from typing import Dict, Iterable, Tuple
+
+from damage_parameters import DamageParameters
+from permutation_store import PermutationTrie
+from progress import ComputationProgress
+from spell_chain import SpellChains
+from stats import Stats
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+FIELDS = ('spells', 'pa', 'average', 'min', 'max', 'crit_min', 'crit_max')
+
+
+def get_export_format(filepath: str) -> str:
+    """Return the export format ('csv' or 'jsonl') from the extension of the file."""
+    extension = os.path.splitext(filepath)[1].lower().lstrip('.')
+    if extension == 'json':
+        extension = 'jsonl'
+    if not extension in EXPORT_FORMATS:
+        raise ValueError(f"Cannot export to '{filepath}': the file extension should be one of {['.' + export_format for export_format in EXPORT_FORMATS]}.")
+
+    return extension
+
+
+def write_chains(chains: Iterable[Tuple[Tuple[str], int, float, Dict[str, int]]], filepath: str, export_format: str = None, min_damages: float = None) -> int:
+    """Write every chain (combination, AP used, average damages and detailed damages) to the file as soon as it is given, and return the number of written chains.
+
+    In CSV, the spells of a chain are separated by spaces. If min_damages is given, only the chains with at least these average damages are written."""
+    if export_format is None:
+        export_format = get_export_format(filepath)
+    if not export_format in EXPORT_FORMATS:
+        raise ValueError(f"Export format should be one of {list(EXPORT_FORMATS)} ('{export_format}' given instead).")
+
+    count = 0
+    with open(filepath, 'w', encoding='utf-8', newline='') as fo:
+        if export_format == 'csv':
+            writer = csv.writer(fo)
+            writer.writerow(FIELDS)
+
+        for combination, used_pa, average_damages, damages in chains:
+            if min_damages is not None and average_damages < min_damages:
+                continue
+
+            if export_format == 'csv':
+                writer.writerow((' '.join(combination), used_pa, average_damages, damages['min'], damages['max'], damages['crit_min'], damages['crit_max']))
+            else:
+                fo.write(json.dumps({'spells': list(combination), 'pa': used_pa, 'average': average_damages, **damages}) + '\n')
+            count += 1
+
+    return count
+
+
+def export_chains(spell_chain: SpellChains, stats: Stats, parameters: DamageParameters, filepath: str, export_format: str = None, min_damages: float = None,
+                  max_length: int = None, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None) -> int:
+    """Compute every possible chain of the spells and stream it to a CSV or JSONL file (see write_chains), so that the memory used does not depend on
+    the number of chains. Return the number of written chains.
+
+    If max_length is given, the chains of more spells are not computed."""
+    if export_format is None:
+        export_format = get_export_format(filepath)
+
+    return write_chains(spell_chain.iter_chains(stats, parameters, cache=cache, progress=progress, max_length=max_length), filepath, export_format=export_format, min_damages=min_damages)
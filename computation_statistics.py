@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+COUNTERS = (
+    'permutations_generated',  # Permutations built by SpellChains._get_permutations (only one by sequence of spells)
+    'permutations_pruned',  # Permutations skipped because the spells ranges are not compatible
+    'permutations_evaluated',  # Permutations whose damages were computed
+    'prefix_reuse_hits',  # Permutations computed from the data of their prefix
+    'spells_reused',  # Spells evaluations avoided thanks to the prefix reuse
+    'spells_evaluated',
+    'buffs_checked',
+    'buffs_triggered',
+    'cache_hits',
+    'cache_misses',
+)
+
+PHASES = (
+    'permutations',
+    'trie',  # Sorting the permutations and building their trie
+    'range_filter',
+    'evaluation',
+    'buffs',
+    'sort',
+)
+
+
+class ComputationStatistics:
+    """Counters and per-phase wall time of the chain computations.
+
+    Instrumented functions take an optional instance and do nothing if it is None, so that there is no overhead when it is disabled."""
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {counter: 0 for counter in COUNTERS}
+        self.timings: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+
+
+    def increment(self, counter: str, value: int = 1):
+        self.counters[counter] += value
+
+    def add_time(self, phase: str, duration: float):
+        self.timings[phase] += duration
+
+    @contextmanager
+    def timer(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+
+    def reset(self):
+        for counter in self.counters:
+            self.counters[counter] = 0
+        for phase in self.timings:
+            self.timings[phase] = 0.0
+
+    def merge(self, other: 'ComputationStatistics'):
+        for counter in other.counters:
+            self.counters[counter] += other.counters[counter]
+        for phase in other.timings:
+            self.timings[phase] += other.timings[phase]
+
+
+    def to_dict(self) -> Dict:
+        return {
+            'counters': dict(self.counters),
+            'timings': dict(self.timings)
+        }
+
+    def to_string(self) -> str:
+        lines = ['=== Counters']
+        for counter, value in self.counters.items():
+            lines.append(f"{counter.replace('_', ' ').capitalize():.<30}{value}")
+
+        # 'range_filter' and 'buffs' are sub-phases of 'evaluation'
+        lines.append('\n=== Timings')
+        for phase, duration in self.timings.items():
+            lines.append(f"{phase.replace('_', ' ').capitalize():.<30}{1000 * duration:.2f} ms")
+
+        return '\n'.join(lines)
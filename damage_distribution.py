@@ -0,0 +1,392 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # The damage distributions require the 'numpy' module, the rest of the program works without it
+    np = None
+
+from damage_parameters import DamageParameters
+from permutation_store import PermutationTrie
+from progress import ComputationProgress
+from spell_chain import SpellChains, SpellRolls
+from stats import Stats
+
+
+DEFAULT_PERCENTILES = (1, 5, 10, 25, 50, 75, 90, 95, 99)
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError("The 'numpy' package is required to compute damage distributions.")
+
+
+class DamageDistribution:
+    """Distribution of the total damages of a combination, computed from sorted damages samples."""
+
+    def __init__(self, samples, percentiles: Sequence[float] = DEFAULT_PERCENTILES, bins: int = 20) -> None:
+        # Sorted damages of every trial
+        self.samples = np.sort(np.asarray(samples, dtype=np.int64))
+        self.trials: int = len(self.samples)
+        self.mean: float = float(self.samples.mean())
+        self.std: float = float(self.samples.std())
+        self.standard_error: float = self.std / math.sqrt(self.trials)
+        self.min: int = int(self.samples[0])
+        self.max: int = int(self.samples[-1])
+        self.percentiles: Dict[float, float] = {percentile: float(value) for percentile, value in zip(percentiles, np.percentile(self.samples, percentiles))}
+
+        counts, edges = np.histogram(self.samples, bins=bins)
+        # Number of trials in each bin, the bins being [edges[i], edges[i + 1]) (the last one includes its upper edge)
+        self.histogram: Tuple[List[int], List[float]] = (counts.tolist(), edges.tolist())
+
+
+    def get_probability_at_least(self, damages: float) -> float:
+        """Return the probability to deal at least the given damages."""
+        return (self.trials - int(np.searchsorted(self.samples, damages, side='left'))) / self.trials
+
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trials': self.trials,
+            'mean': self.mean,
+            'std': self.std,
+            'standard_error': self.standard_error,
+            'min': self.min,
+            'max': self.max,
+            'percentiles': {str(percentile): value for percentile, value in self.percentiles.items()},
+            'histogram': {'counts': self.histogram[0], 'edges': self.histogram[1]}
+        }
+
+
+def _sample_damages(rolls: List[SpellRolls], size: int, rng) -> Any:
+    totals = np.zeros(size, dtype=np.int64)
+
+    for spell_rolls in rolls:
+        if len(spell_rolls.lines) == 0:
+            continue
+
+        # One crit roll for the spell, shared by all its lines
+        is_crit = rng.random(size) < spell_rolls.crit_chance if 0.0 < spell_rolls.crit_chance < 1.0 else None
+
+        for damages, damages_crit in spell_rolls.lines:
+            if is_crit is None:
+                values = damages_crit if spell_rolls.crit_chance >= 1.0 else damages
+                totals += values[rng.integers(0, len(values), size)]
+            else:
+                totals += np.where(is_crit, damages_crit[rng.integers(0, len(damages_crit), size)], damages[rng.integers(0, len(damages), size)])
+
+    return totals
+
+
+def simulate_damages(rolls: List[SpellRolls], trials: int = None, seed: Optional[int] = None, batch_size: int = 100_000, tolerance: float = 1e-3,
+                     min_trials: int = 100_000, max_trials: int = 4_000_000, percentiles: Sequence[float] = DEFAULT_PERCENTILES, bins: int = 20) -> DamageDistribution:
+    """Return the damages distribution of a combination (see SpellChains.get_rolls) by Monte Carlo sampling of the rolls and crits of every spell.
+
+    If the number of trials is not given, batches are sampled until the standard error of the mean is below 'tolerance' times the mean
+    (with at least 'min_trials' and at most 'max_trials' trials). The same seed always gives the same distribution."""
+    _check_numpy()
+    if trials is not None and trials <= 0:
+        raise ValueError(f'Number of trials should be positive ({trials} given instead).')
+
+    rng = np.random.default_rng(seed)
+    # The tables of the rolls are converted once for all the batches
+    numpy_rolls = [SpellRolls(spell_rolls.short_name, spell_rolls.crit_chance, [(np.asarray(damages, dtype=np.int64), np.asarray(damages_crit, dtype=np.int64)) for damages, damages_crit in spell_rolls.lines])
+                   for spell_rolls in rolls]
+
+    target_trials = trials if trials is not None else max_trials
+    batches = []
+    count = 0
+    total = 0.0
+    total_squares = 0.0
+
+    while count < target_trials:
+        batch = _sample_damages(numpy_rolls, min(batch_size, target_trials - count), rng)
+        batches.append(batch)
+        count += len(batch)
+
+        if trials is None:
+            total += float(batch.sum())
+            total_squares += float(np.square(batch, dtype=np.float64).sum())
+            if count >= min_trials:
+                mean = total / count
+                variance = max(0.0, total_squares / count - mean * mean)
+                if math.sqrt(variance / count) <= tolerance * max(abs(mean), 1.0):
+                    break
+
+    return DamageDistribution(np.concatenate(batches), percentiles=percentiles, bins=bins)
+
+
+# Above this number of multiplications, the convolutions are done with a FFT
+FFT_THRESHOLD = 1 << 16
+
+# Probabilities of an integer random variable: the first one is the probability of the offset, the next ones of offset + 1, offset + 2, ...
+# The probabilities are a numpy array if numpy is installed, a list otherwise
+Probabilities = Tuple[int, Any]
+
+
+def _get_roll_probabilities(damages: List[int]) -> Probabilities:
+    offset = min(damages)
+    probabilities = [0.0] * (max(damages) - offset + 1)
+    for damage in damages:
+        probabilities[damage - offset] += 1 / len(damages)
+
+    return (offset, np.array(probabilities) if np is not None else probabilities)
+
+
+def _convolve(first: Probabilities, second: Probabilities) -> Probabilities:
+    """Return the probabilities of the sum of two independent variables."""
+    (first_offset, first_probabilities), (second_offset, second_probabilities) = first, second
+    offset = first_offset + second_offset
+    size = len(first_probabilities) + len(second_probabilities) - 1
+
+    if np is None:
+        probabilities = [0.0] * size
+        for i, first_probability in enumerate(first_probabilities):
+            if first_probability == 0.0:
+                continue
+            for j, second_probability in enumerate(second_probabilities):
+                probabilities[i + j] += first_probability * second_probability
+        return (offset, probabilities)
+
+    if len(first_probabilities) * len(second_probabilities) <= FFT_THRESHOLD:
+        return (offset, np.convolve(first_probabilities, second_probabilities))
+
+    fft_size = 1 << (size - 1).bit_length()
+    probabilities = np.fft.irfft(np.fft.rfft(first_probabilities, fft_size) * np.fft.rfft(second_probabilities, fft_size), fft_size)[:size]
+    # Remove the rounding errors of the FFT (tiny negative probabilities)
+    return (offset, np.clip(probabilities, 0.0, None))
+
+
+def _mix(first: Probabilities, second: Probabilities, second_weight: float) -> Probabilities:
+    """Return the probabilities of a variable equal to the second one with a probability of 'second_weight', to the first one otherwise."""
+    (first_offset, first_probabilities), (second_offset, second_probabilities) = first, second
+    offset = min(first_offset, second_offset)
+    size = max(first_offset + len(first_probabilities), second_offset + len(second_probabilities)) - offset
+
+    if np is None:
+        probabilities = [0.0] * size
+        for start, variable_probabilities, weight in ((first_offset - offset, first_probabilities, 1 - second_weight), (second_offset - offset, second_probabilities, second_weight)):
+            for index, probability in enumerate(variable_probabilities):
+                probabilities[start + index] += weight * probability
+        return (offset, probabilities)
+
+    probabilities = np.zeros(size)
+    probabilities[first_offset - offset:first_offset - offset + len(first_probabilities)] += (1 - second_weight) * first_probabilities
+    probabilities[second_offset - offset:second_offset - offset + len(second_probabilities)] += second_weight * second_probabilities
+    return (offset, probabilities)
+
+
+def _get_spell_probabilities(spell_rolls: SpellRolls) -> Probabilities:
+    probabilities = (0, np.ones(1) if np is not None else [1.0])
+    probabilities_crit = probabilities
+
+    for damages, damages_crit in spell_rolls.lines:
+        probabilities = _convolve(probabilities, _get_roll_probabilities(damages))
+        if spell_rolls.crit_chance > 0.0:
+            probabilities_crit = _convolve(probabilities_crit, _get_roll_probabilities(damages_crit))
+
+    if spell_rolls.crit_chance <= 0.0:
+        return probabilities
+    if spell_rolls.crit_chance >= 1.0:
+        return probabilities_crit
+
+    return _mix(probabilities, probabilities_crit, spell_rolls.crit_chance)
+
+
+class ExactDamageDistribution:
+    """Exact distribution of the total damages of a combination: probabilities[i] is the probability to deal exactly min + i damages."""
+
+    def __init__(self, probabilities: Probabilities) -> None:
+        self.min: int = probabilities[0]
+        self.probabilities: List[float] = [float(probability) for probability in probabilities[1]]
+        self.max: int = self.min + len(self.probabilities) - 1
+        self.mean: float = sum((self.min + index) * probability for index, probability in enumerate(self.probabilities))
+
+        # Probability to deal at least min + i damages
+        self._tail_probabilities: List[float] = [0.0] * len(self.probabilities)
+        tail_probability = 0.0
+        for index in range(len(self.probabilities) - 1, -1, -1):
+            tail_probability += self.probabilities[index]
+            self._tail_probabilities[index] = min(tail_probability, 1.0)
+
+
+    def get_probability_at_least(self, damages: float) -> float:
+        """Return the probability to deal at least the given damages."""
+        index = math.ceil(damages) - self.min
+        if index <= 0:
+            return 1.0
+        if index >= len(self._tail_probabilities):
+            return 0.0
+        return self._tail_probabilities[index]
+
+    def get_kill_probability(self, hp: int) -> float:
+        """Return the probability to kill an enemy with the given health points (to deal at least as many damages)."""
+        return self.get_probability_at_least(hp)
+
+    def get_percentile(self, percentile: float) -> int:
+        """Return the lowest damages dealt with a probability of at least 'percentile' % to deal at most these damages."""
+        cumulative_probability = 0.0
+        for index, probability in enumerate(self.probabilities):
+            cumulative_probability += probability
+            if cumulative_probability >= percentile / 100 - 1e-12:
+                return self.min + index
+        return self.max
+
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'probabilities': self.probabilities[::]
+        }
+
+
+def _get_rolls_key(spell_rolls: SpellRolls) -> Tuple:
+    return (spell_rolls.crit_chance, tuple((tuple(damages), tuple(damages_crit)) for damages, damages_crit in spell_rolls.lines))
+
+
+def _get_spell_moments(spell_rolls: SpellRolls) -> Tuple[float, float]:
+    """Return the exact mean and variance of the damages of a spell."""
+    mean, variance = 0.0, 0.0
+    mean_crit, variance_crit = 0.0, 0.0
+
+    for damages, damages_crit in spell_rolls.lines:
+        for values, is_crit in ((damages, False), (damages_crit, True)):
+            values_mean = sum(values) / len(values)
+            values_variance = sum((value - values_mean) ** 2 for value in values) / len(values)
+            if is_crit:
+                mean_crit += values_mean
+                variance_crit += values_variance
+            else:
+                mean += values_mean
+                variance += values_variance
+
+    crit_chance = min(spell_rolls.crit_chance, 1.0)
+    total_mean = (1 - crit_chance) * mean + crit_chance * mean_crit
+    total_variance = (1 - crit_chance) * (variance + mean * mean) + crit_chance * (variance_crit + mean_crit * mean_crit) - total_mean * total_mean
+
+    return (total_mean, max(0.0, total_variance))
+
+
+def _get_kill_probability_upper_bound(rolls: List[SpellRolls], hp: int, cache: Dict[Any, Tuple[float, float]]) -> float:
+    """Return an upper bound of the kill probability, from the exact mean and variance of the damages (Cantelli's inequality)."""
+    mean, variance = 0.0, 0.0
+    for spell_rolls in rolls:
+        if len(spell_rolls.lines) == 0:
+            continue
+
+        key = _get_rolls_key(spell_rolls)
+        if not key in cache:
+            cache[key] = _get_spell_moments(spell_rolls)
+        spell_mean, spell_variance = cache[key]
+        mean += spell_mean
+        variance += spell_variance
+
+    if hp <= mean or variance == 0.0:
+        return 1.0 if hp <= mean else 0.0
+
+    return variance / (variance + (hp - mean) ** 2)
+
+
+def get_exact_distribution(rolls: List[SpellRolls], cache: Dict[Any, Probabilities] = None) -> ExactDamageDistribution:
+    """Return the exact damages distribution of a combination (see SpellChains.get_rolls), by convolution of the distributions of its spells.
+
+    The distributions of the spells are stored in the cache (if given), so that the spells shared by many combinations are only computed once.
+    numpy is used if installed (with a FFT for the largest distributions), a slower pure Python computation otherwise."""
+    probabilities = (0, np.ones(1) if np is not None else [1.0])
+
+    for spell_rolls in rolls:
+        if len(spell_rolls.lines) == 0:
+            continue
+
+        if cache is None:
+            spell_probabilities = _get_spell_probabilities(spell_rolls)
+        else:
+            key = _get_rolls_key(spell_rolls)
+            if not key in cache:
+                cache[key] = _get_spell_probabilities(spell_rolls)
+            spell_probabilities = cache[key]
+
+        probabilities = _convolve(probabilities, spell_probabilities)
+
+    return ExactDamageDistribution(probabilities)
+
+
+def get_kill_probabilities(spell_chain: SpellChains, combinations: Iterable[Tuple[str, ...]], stats: Stats, parameters: DamageParameters, hp: int) -> Dict[Tuple[str, ...], float]:
+    """Return the exact kill probability of every possible combination (for example the best ones of SpellChains.get_detailed_damages), in the same order."""
+    cache: Dict[Any, Probabilities] = {}
+    kill_probabilities: Dict[Tuple[str, ...], float] = {}
+
+    for combination in combinations:
+        rolls = spell_chain.get_rolls(combination, stats, parameters)
+        if rolls is None:
+            continue
+        kill_probabilities[tuple(combination)] = get_exact_distribution(rolls, cache=cache).get_kill_probability(hp)
+
+    return kill_probabilities
+
+
+class KillProbabilityResult:
+
+    def __init__(self) -> None:
+        self.combination: Tuple[str, ...] = ()
+        self.kill_probability: float = 0.0
+        self.average_damages: float = 0.0
+        self.damages: Dict[str, int] = {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0}
+        self.combinations_count: int = 0
+        # Combinations whose exact distribution was computed, the other ones being decided by the bounds
+        self.exact_count: int = 0
+        self.pruned_count: int = 0
+
+
+def get_best_kill_probability(spell_chain: SpellChains, stats: Stats, parameters: DamageParameters, hp: int, cache: Dict[str, PermutationTrie] = None,
+                              progress: ComputationProgress = None) -> KillProbabilityResult:
+    """Return the combination with the highest probability to deal at least 'hp' damages (then with the highest average damages, then the shortest).
+
+    The exact distributions are only computed for the combinations that may be better than the best one found so far: the combinations are checked
+    by decreasing average damages, a combination whose highest possible damages (whichever spells are critical strikes) are below the HP cannot kill,
+    one whose lowest possible damages are above always kills, and the others are skipped if an upper bound of their kill probability (from the mean and variance of their damages) is not above the best one."""
+    if cache is None:
+        cache = {}
+
+    candidates = [(computation_data.average_damages, -len(computation_data.permutation), computation_data.permutation, computation_data.damages.copy(),
+                   computation_data.lowest_damages, computation_data.highest_damages)
+                  for computation_data in spell_chain.iter_detailed_damages(stats, parameters, cache=cache, progress=progress)]
+    # Same order as get_detailed_damages (the sort is stable)
+    candidates.sort(key=lambda candidate: candidate[:2], reverse=True)
+
+    result = KillProbabilityResult()
+    result.combinations_count = len(candidates)
+    best_key = None
+    distributions_cache: Dict[Any, Probabilities] = {}
+    moments_cache: Dict[Any, Tuple[float, float]] = {}
+
+    for average_damages, negative_length, combination, damages, lowest_damages, highest_damages in candidates:
+        if best_key is not None and best_key[0] >= 1.0:
+            # The next combinations cannot have a higher kill probability nor higher average damages
+            result.pruned_count += 1
+            continue
+
+        if highest_damages < hp:
+            kill_probability = 0.0
+        elif lowest_damages >= hp:
+            kill_probability = 1.0
+        else:
+            rolls = spell_chain.get_rolls(combination, stats, parameters)
+            if best_key is not None and _get_kill_probability_upper_bound(rolls, hp, moments_cache) <= best_key[0]:
+                result.pruned_count += 1
+                continue
+
+            kill_probability = get_exact_distribution(rolls, cache=distributions_cache).get_kill_probability(hp)
+            result.exact_count += 1
+
+        key = (kill_probability, average_damages, negative_length)
+        if best_key is None or key > best_key:
+            best_key = key
+            result.combination = combination
+            result.kill_probability = kill_probability
+            result.average_damages = average_damages
+            result.damages = damages
+
+    return result
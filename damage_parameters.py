@@ -1,10 +1,15 @@
 import re
-from typing import Dict, List, Literal, Set, Tuple, Union
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Set, Tuple, Union
 
 from characteristics_damages import *
 from stats import Stats
 
 
+_DASHES_PATTERN = re.compile(r'-+')
+_INTEGER_PATTERN = re.compile(r'^[+-]?\d+$')
+
+
 class DamageParameters:
 
     def __init__(self) -> None:
@@ -20,6 +25,10 @@ class DamageParameters:
         self.starting_states: Set[str] = set()
         # 'unspecified' indicates we do not care about the position
         self.position: Literal['unspecified', 'none', 'line', 'diag'] = 'unspecified'
+        # Maximum duration of the damages computation in milliseconds (0 means no limit)
+        self.timeout: int = 0
+        # Health points of the enemy, used for the kill probabilities (0 means unspecified)
+        self.hp: int = 0
 
 
     def get_min_po(self):
@@ -69,11 +78,61 @@ class DamageParameters:
 
 
     def to_string(self):
-        return f'-s {" ".join(self.stats)} -pa {self.pa} -pomin {self.get_min_po()} -pomax {self.get_max_po()} -t {self.type} -r {" ".join(map(str, self.resistances))} -d {self.distance} -v {self.vulnerability} -name {self.full_name} -bdmg {" ".join(map(str, self.base_damages))} -p {self.position}'
+        timeout = f' -timeout {self.timeout}' if self.timeout > 0 else ''
+        hp = f' -hp {self.hp}' if self.hp > 0 else ''
+        return f'-s {" ".join(self.stats)} -pa {self.pa} -pomin {self.get_min_po()} -pomax {self.get_max_po()} -t {self.type} -r {" ".join(map(str, self.resistances))} -d {self.distance} -v {self.vulnerability} -name {self.full_name} -bdmg {" ".join(map(str, self.base_damages))} -p {self.position}{timeout}{hp}'
 
     def to_compact_string(self):
         return f'-r {" ".join(map(str, self.resistances))} -v {self.vulnerability} -bdmg {" ".join(map(str, self.base_damages))}'
 
+    def to_dict(self) -> Dict:
+        return {
+            'full_name': self.full_name,
+            'stats': self.stats[::],
+            'pa': self.pa,
+            'po': list(self.po),
+            'type': self.type,
+            'resistances': self.resistances[::],
+            'distance': self.distance,
+            'vulnerability': self.vulnerability,
+            'base_damages': self.base_damages[::],
+            'starting_states': sorted(self.starting_states),
+            'position': self.position,
+            'timeout': self.timeout,
+            'hp': self.hp
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DamageParameters':
+        """Load parameters saved with to_dict, without any string parsing. Missing fields keep their default value."""
+        parameters = DamageParameters()
+
+        parameters.full_name = data.get('full_name', parameters.full_name)
+        parameters.stats = list(data.get('stats', parameters.stats))
+        parameters.pa = data.get('pa', parameters.pa)
+        parameters.po = tuple(data.get('po', parameters.po))
+        parameters.type = data.get('type', parameters.type)
+        parameters.resistances = list(data.get('resistances', parameters.resistances))
+        parameters.distance = data.get('distance', parameters.distance)
+        parameters.vulnerability = data.get('vulnerability', parameters.vulnerability)
+        parameters.base_damages = list(data.get('base_damages', parameters.base_damages))
+        parameters.starting_states = set(data.get('starting_states', parameters.starting_states))
+        parameters.position = data.get('position', parameters.position)
+        parameters.timeout = data.get('timeout', parameters.timeout)
+        parameters.hp = data.get('hp', parameters.hp)
+
+        parameters._assert_correct_parameters()
+
+        return parameters
+
+    @classmethod
+    def load(cls, data: Union[str, Dict]) -> 'DamageParameters':
+        """Load parameters saved either as a dict or as a string (older saves)."""
+        if isinstance(data, str):
+            return DamageParameters.from_string(data)
+
+        return DamageParameters.from_dict(data)
+
 
     def _assert_correct_parameters(self):
         if self.pa < 1:
@@ -82,6 +141,10 @@ class DamageParameters:
             raise ValueError(f"Minimum PO should be non negative ({self.get_min_po()} given instead).")
         if self.get_min_po() > self.get_max_po():
             raise ValueError(f"Minimum PO should be less than or equal to maximum PO ({self.get_min_po()} and {self.get_max_po()} given instead).")
+        if self.timeout < 0:
+            raise ValueError(f"Timeout should be non negative ({self.timeout} given instead).")
+        if self.hp < 0:
+            raise ValueError(f"HP should be non negative ({self.hp} given instead).")
 
 
     def copy(self):
@@ -101,105 +164,145 @@ class DamageParameters:
 
         for k, argument in enumerate(parameter[1:]):
             if argument_type == int:
-                if re.match("^[+-]?\d+$", argument) is None: # Check argument is an integer, maybe preceded by - or +
+                if _INTEGER_PATTERN.match(argument) is None: # Check argument is an integer, maybe preceded by - or +
                     raise ValueError(f"Argument {k + 1} to command '{parameter[0]}' should be an integer ('{argument}' given instead).")
             elif argument_type is None:
                 if not argument in literals:
                     raise ValueError(f"Argument {k + 1} to command '{parameter[0]}' should be one of {literals} ('{argument}' given instead).")
 
     @classmethod
-    def from_string(cls, string: str, default_parameters: 'DamageParameters' = None):
-        if default_parameters is None:
-            default_parameters = DamageParameters()
-
-        string = string.strip()
-        string = re.sub(r'-+', '-', string) # Replace repeating substring of - into only one
+    def _tokenize(cls, string: str) -> List[List[str]]:
+        """Split the string into a list of commands, each one being the lowercase command followed by its arguments."""
+        string = _DASHES_PATTERN.sub('-', string.strip()) # Replace repeating substring of - into only one
 
         if string == '':
-            # No command, so just return the default parameters
-            return default_parameters.copy()
+            return []
 
         if not string.startswith('-'):
             raise ValueError(f"Incorrect string to be parsed as parameters : does not start with a command ('{string}').")
 
-        arguments = string.split(' ')
         parameters: List[List[str]] = list()
-
-        for argument in arguments:
-            if re.match(r'^-[^\d]', argument.lower()) is not None: # Starts with a - but is not a negative number
+        for argument in string.split(' '):
+            # Starts with a - but is not a negative number
+            if len(argument) > 1 and argument[0] == '-' and not argument[1].isdecimal():
                 parameters.append([argument.lower()])
             else:
                 parameters[-1].append(argument)
 
-        damage_parameters = default_parameters.copy()
+        return parameters
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def _parse(cls, string: str) -> Tuple[Tuple[str, Any], ...]:
+        """Check and convert the arguments of every command of the string, return a tuple of (field, value) to apply on the default parameters.
+
+        The result is memoized as most strings (stored parameters, buffs parameters and commands) are parsed many times."""
+        operations: List[Tuple[str, Any]] = list()
 
-        for parameter in parameters:
+        for parameter in cls._tokenize(string):
             command = parameter[0]
             if command in ('-s', '-stats'):
-                for argument in parameter[1:]:
-                    if argument == '':continue
-                    if not argument.startswith('!'):
-                        damage_parameters.stats.append(argument)
-                    elif argument[1:] in damage_parameters.stats:
-                        damage_parameters.stats.remove(argument[1:])
+                operations.append(('stats', tuple(argument for argument in parameter[1:] if argument != '')))
 
             elif command == '-pa':
                 cls._check_parameter(parameter, 1, argument_type=int)
-                damage_parameters.pa = int(parameter[1])
+                operations.append(('pa', int(parameter[1])))
 
             elif command == '-po':
                 cls._check_parameter(parameter, 1, argument_type=int)
-                po = int(parameter[1])
-                damage_parameters.po = (po, po)
+                operations.append(('po', int(parameter[1])))
 
             elif command in ('-pomin', '-minpo'):
                 cls._check_parameter(parameter, 1, argument_type=int)
-                damage_parameters.po = (int(parameter[1]), damage_parameters.get_max_po())
+                operations.append(('min_po', int(parameter[1])))
 
             elif command in ('-pomax', '-maxpo'):
                 cls._check_parameter(parameter, 1, argument_type=int)
-                damage_parameters.po = (damage_parameters.get_min_po(), int(parameter[1]))
+                operations.append(('max_po', int(parameter[1])))
 
             elif command in ('-t', '-type'):
                 cls._check_parameter(parameter, 1, literals=['mono', 'multi', 'versa'])
-                damage_parameters.type = parameter[1]
+                operations.append(('type', parameter[1]))
 
             elif command in ('-r', '-res', '-resistances'):
                 cls._check_parameter(parameter, 5, argument_type=int)
-                damage_parameters.resistances = [int(parameter[i]) for i in range(1, 5 + 1)]
-                pass
+                operations.append(('resistances', tuple(int(parameter[i]) for i in range(1, 5 + 1))))
 
             elif command in ('-d', '-distance'):
                 cls._check_parameter(parameter, 1, literals=['melee', 'range'])
-                damage_parameters.distance = parameter[1]
+                operations.append(('distance', parameter[1]))
 
             elif command in ('-v', '-vulne', '-vulnerability'):
                 cls._check_parameter(parameter, 1, argument_type=int)
-                damage_parameters.vulnerability = int(parameter[1])
+                operations.append(('vulnerability', int(parameter[1])))
 
             elif command in ('-bdmg', '-bdamages', '-base-damages'):
                 cls._check_parameter(parameter, 5, argument_type=int)
-                damage_parameters.base_damages = [int(parameter[i]) for i in range(1, 5 + 1)]
+                operations.append(('base_damages', tuple(int(parameter[i]) for i in range(1, 5 + 1))))
 
             elif command in ('-state', '-states'):
-                damage_parameters.starting_states = {argument for argument in parameter[1:] if argument != ''}
+                operations.append(('starting_states', frozenset(argument for argument in parameter[1:] if argument != '')))
+
+            elif command in ('-timeout',):
+                cls._check_parameter(parameter, 1, argument_type=int)
+                operations.append(('timeout', int(parameter[1])))
+
+            elif command in ('-hp',):
+                cls._check_parameter(parameter, 1, argument_type=int)
+                operations.append(('hp', int(parameter[1])))
 
             elif command in ('-name',):
-                damage_parameters.full_name = ' '.join(parameter[1:])
+                operations.append(('full_name', ' '.join(parameter[1:])))
 
             elif command in ('-p', '-position'):
                 if len(parameter) == 2:  # This means only the string position was supplied
                     cls._check_parameter(parameter, 1, literals=['unspecified', 'none', 'line', 'diag'])
-                    damage_parameters.position = parameter[1]
+                    operations.append(('position', parameter[1]))
                 else:  # This means two coordinates were supplied
                     cls._check_parameter(parameter, 2, argument_type=int)
                     x, y = map(lambda x:abs(int(x)), parameter[1:3])  # Convert both coordinates to integers and take the absolute value
-                    damage_parameters.position = 'none'  # Default position if the coordinates are specified
+                    position = 'none'  # Default position if the coordinates are specified
                     if abs(x) == abs(y):
-                        damage_parameters.position = 'diag'
+                        position = 'diag'
                     elif x == 0 or y == 0:
-                        damage_parameters.position = 'line'
-                    damage_parameters.po = [abs(x) + abs(y), abs(x) + abs(y)]
+                        position = 'line'
+                    operations.append(('coordinates', (position, abs(x) + abs(y))))
+
+        return tuple(operations)
+
+    @classmethod
+    def from_string(cls, string: str, default_parameters: 'DamageParameters' = None):
+        if default_parameters is None:
+            default_parameters = DamageParameters()
+
+        if string.strip() == '':
+            # No command, so just return the default parameters
+            return default_parameters.copy()
+
+        damage_parameters = default_parameters.copy()
+
+        for field, value in cls._parse(string):
+            if field == 'stats':
+                for argument in value:
+                    if not argument.startswith('!'):
+                        damage_parameters.stats.append(argument)
+                    elif argument[1:] in damage_parameters.stats:
+                        damage_parameters.stats.remove(argument[1:])
+            elif field == 'po':
+                damage_parameters.po = (value, value)
+            elif field == 'min_po':
+                damage_parameters.po = (value, damage_parameters.get_max_po())
+            elif field == 'max_po':
+                damage_parameters.po = (damage_parameters.get_min_po(), value)
+            elif field in ('resistances', 'base_damages'):
+                setattr(damage_parameters, field, list(value))
+            elif field == 'starting_states':
+                damage_parameters.starting_states = set(value)
+            elif field == 'coordinates':
+                damage_parameters.position = value[0]
+                damage_parameters.po = [value[1], value[1]]
+            else:
+                setattr(damage_parameters, field, value)
 
         # If the specified PO is one, this means the enemy is in melee range
         # If the minimum PO is > 1, the enemy is not in melee range
@@ -226,5 +329,7 @@ class DamageParameters:
         parameters.distance = default_parameters.distance
         parameters.vulnerability = default_parameters.vulnerability
         parameters.base_damages = default_parameters.base_damages[::]
+        parameters.timeout = default_parameters.timeout
+        parameters.hp = default_parameters.hp
 
         return parameters
@@ -0,0 +1,122 @@
+from typing import Dict, List, Set, Tuple
+
+from damage_parameters import DamageParameters
+from spell import Spell
+from stats import Stats
+
+
+class DominatedSpell:
+    """Spell whose instances were (partly) removed from a spell list, because another spell is always at least as good."""
+
+    def __init__(self, spell: Spell, dominating_spell: Spell, pruned_count: int, kept_count: int) -> None:
+        self.spell: Spell = spell
+        self.dominating_spell: Spell = dominating_spell
+        self.pruned_count: int = pruned_count
+        self.kept_count: int = kept_count
+        # (average, min, max, crit min, crit max) of both spells
+        self.damages: Tuple[float, ...] = ()
+        self.dominating_damages: Tuple[float, ...] = ()
+
+    def get_reason(self) -> str:
+        spell, other = self.spell, self.dominating_spell
+        reason = (f"'{other.get_name()}' costs {other.get_pa()} PA (instead of {spell.get_pa()}), reaches PO {other.get_min_po()} - {other.get_max_po()} (instead of {spell.get_min_po()} - {spell.get_max_po()}) "
+                  f"and deals {self.dominating_damages[0]:.0f} dmg : {self.dominating_damages[1]} - {self.dominating_damages[2]} ({self.dominating_damages[3]} - {self.dominating_damages[4]}) "
+                  f"(instead of {self.damages[0]:.0f} dmg : {self.damages[1]} - {self.damages[2]} ({self.damages[3]} - {self.damages[4]}))")
+        if self.kept_count > 0:
+            reason += f", {self.kept_count} use{'s' if self.kept_count > 1 else ''} kept for when all its uses are taken"
+        return reason
+
+
+def _get_buffed_spells(spell_list: List[Spell]) -> Set[str]:
+    """Short names of the spells whose stats or parameters are changed by a buff of the list ('__all__' for every spell)."""
+    buffed_spells = set()
+    for spell in spell_list:
+        for buff in spell.buffs:
+            # The Huppermage states add power (and vulnerability) to every next spell
+            if buff.is_huppermage_states:
+                buffed_spells.add('__all__')
+            if buff.has_stats:
+                buffed_spells.update(buff.stats)
+            if buff.has_parameters:
+                buffed_spells.update(buff.damage_parameters)
+
+    return buffed_spells
+
+
+def _dominates(spell: Spell, other: Spell, damages: Tuple[float, ...], other_damages: Tuple[float, ...], is_first: bool) -> bool:
+    """Return True if the spell can replace the other one in any combination without lowering its damages (if they are identical, only the first one dominates)."""
+    if spell.get_pa() > other.get_pa() or spell.get_min_po() > other.get_min_po() or spell.get_max_po() < other.get_max_po():
+        return False
+    if any(value < other_value for value, other_value in zip(damages, other_damages)):
+        return False
+
+    is_identical = spell.get_pa() == other.get_pa() and spell.get_min_po() == other.get_min_po() and spell.get_max_po() == other.get_max_po() and damages == other_damages
+    return is_first or not is_identical
+
+
+def prune_dominated_spells(spell_list: List[Spell], stats: Stats, parameters: DamageParameters) -> Tuple[List[Spell], List[DominatedSpell]]:
+    """Remove from the spell list (as built by SpellSet.get_spell_list_*) the uses of the spells which are dominated by another spell, and return the new list
+    with the removed spells.
+
+    A spell dominates another one if it costs at most as many AP, its range contains the other one's range, and all its damages (average, min, max, crit min and
+    crit max with these stats and parameters) are at least as high. Only the spells without buffs, and whose stats and parameters are not changed by the buffs of
+    other spells, are compared, so that their damages do not depend on the combination. As a combination may use every use of the dominating spell, only the uses
+    of the dominated spell which cannot be used with all of them (because of the AP) are removed: the best combinations are kept."""
+    buffed_spells = _get_buffed_spells(spell_list)
+    if '__all__' in buffed_spells:
+        return (list(spell_list), [])
+
+    # First instance and uses count of every spell, in the order of the list
+    spells: Dict[str, Spell] = {}
+    uses: Dict[str, int] = {}
+    for spell in spell_list:
+        spells.setdefault(spell.get_short_name(), spell)
+        uses[spell.get_short_name()] = uses.get(spell.get_short_name(), 0) + 1
+
+    candidates = [short_name for short_name, spell in spells.items() if not spell.buffs and not short_name in buffed_spells]
+    damages: Dict[str, Tuple[float, ...]] = {}
+    for short_name in candidates:
+        spell = spells[short_name]
+        detailed_damages = spell.get_detailed_damages(stats, parameters).damages
+        damages[short_name] = (spell.get_average_damages(stats, parameters), detailed_damages['min'], detailed_damages['max'], detailed_damages['crit_min'], detailed_damages['crit_max'])
+
+    dominating: Dict[str, List[str]] = {short_name: [] for short_name in candidates}
+    for position, short_name in enumerate(candidates):
+        for other_position, other_short_name in enumerate(candidates):
+            if other_short_name != short_name and _dominates(spells[other_short_name], spells[short_name], damages[other_short_name], damages[short_name], other_position < position):
+                dominating[short_name].append(other_short_name)
+
+    # Only the spells which are not dominated are used to remove the others (the dominance is transitive, so every dominated spell is dominated by one of them),
+    # so that the uses of the dominating spell are all kept
+    kept_uses: Dict[str, int] = {}
+    dominated_spells: List[DominatedSpell] = []
+    for short_name in candidates:
+        best_kept_count, best_dominating_spell = uses[short_name], None
+        for other_short_name in dominating[short_name]:
+            if dominating[other_short_name]:
+                continue
+
+            # A combination using every use of the other spell can only use this many uses of the spell
+            other_spell, spell = spells[other_short_name], spells[short_name]
+            remaining_pa = parameters.pa - uses[other_short_name] * other_spell.get_pa()
+            kept_count = uses[short_name] if spell.get_pa() == 0 else min(uses[short_name], max(0, remaining_pa // spell.get_pa()))
+            if kept_count < best_kept_count:
+                best_kept_count, best_dominating_spell = kept_count, other_spell
+
+        if best_dominating_spell is not None:
+            kept_uses[short_name] = best_kept_count
+            dominated_spell = DominatedSpell(spells[short_name], best_dominating_spell, uses[short_name] - best_kept_count, best_kept_count)
+            dominated_spell.damages = damages[short_name]
+            dominated_spell.dominating_damages = damages[best_dominating_spell.get_short_name()]
+            dominated_spells.append(dominated_spell)
+
+    pruned_spell_list = []
+    for spell in spell_list:
+        short_name = spell.get_short_name()
+        if short_name in kept_uses:
+            if kept_uses[short_name] == 0:
+                continue
+            kept_uses[short_name] -= 1
+        pruned_spell_list.append(spell)
+
+    return (pruned_spell_list, dominated_spells)
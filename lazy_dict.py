@@ -0,0 +1,78 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, MutableMapping, Tuple
+
+
+class LazyDict(MutableMapping):
+    """Dictionary whose values are only loaded on their first access, from their key.
+
+    If a value cannot be loaded, 'on_error' is called with its key and the key is removed, as if it never existed."""
+
+    LOADING_ERRORS = (FileNotFoundError, KeyError, TypeError, ValueError)
+
+    def __init__(self, keys: Iterable[Any], loader: Callable[[Any], Any], on_error: Callable[[Any], Any] = None) -> None:
+        self._keys: Dict[Any, None] = dict.fromkeys(keys)  # Ordered set of the keys
+        self._values: Dict[Any, Any] = dict()
+        self._loader = loader
+        self._on_error = on_error
+
+    def __getitem__(self, key):
+        if key in self._values:
+            return self._values[key]
+
+        if not key in self._keys:
+            raise KeyError(key)
+
+        try:
+            value = self._loader(key)
+        except LazyDict.LOADING_ERRORS as e:
+            del self._keys[key]
+            if self._on_error is not None:
+                self._on_error(key)
+            raise KeyError(key) from e
+
+        self._values[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._keys[key] = None
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        del self._keys[key]
+        self._values.pop(key, None)
+
+    def __contains__(self, key):
+        # Loads the value, so a key 'in' the dictionary can always be accessed
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self) -> Iterator:
+        # Copy, as iterating on the values may remove the keys which cannot be loaded
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def values(self) -> List[Any]:
+        return [self._values[key] for key in self if key in self]
+
+    def items(self) -> List[Tuple[Any, Any]]:
+        return [(key, self._values[key]) for key in self if key in self]
+
+
+    def is_loaded(self, key) -> bool:
+        return key in self._values
+
+    def get_loaded(self) -> Dict[Any, Any]:
+        """Return the already loaded values by key, without loading the others."""
+        return {key: self._values[key] for key in self._keys if key in self._values}
+
+
+def get_loaded(mapping: MutableMapping) -> Dict[Any, Any]:
+    """Return the loaded values of a LazyDict, or all the values of any other mapping."""
+    if isinstance(mapping, LazyDict):
+        return mapping.get_loaded()
+
+    return dict(mapping)
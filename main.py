@@ -1,4 +1,7 @@
+import argparse
+
 from manager import Manager
+from storage import SqliteStorage
 
 def manager_print(code, message):
     print(f"{'[ERROR] ' if code == 1 else ''}{message}")
@@ -25,11 +28,17 @@ def command_loop(manager: Manager):
         print()
 
 if __name__ == '__main__':
-    manager = Manager(manager_print)
+    parser = argparse.ArgumentParser(description='Interactive prompt of the damages optimizer.')
+    parser.add_argument('-db', '--database', default=None, help='SQLite database where the data is stored (JSON files of the current folder by default)')
+    arguments = parser.parse_args()
+
+    manager = Manager(manager_print, storage=SqliteStorage(arguments.database) if arguments.database is not None else None)
 
     try:
         command_loop(manager)
     except (KeyboardInterrupt, EOFError):
         print('\nExiting...')
         manager.save(save_cache=True)
+    finally:
+        manager.storage.close()
 
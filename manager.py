@@ -1,43 +1,65 @@
-import distutils.util
-import json
 import math
 import os
 import re
 import sys
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Tuple
 
 from characteristics_damages import *
+from computation_statistics import ComputationStatistics
 from knapsack import get_best_combination
+from chain_export import export_chains, get_export_format
+from lazy_dict import LazyDict
+from permutation_store import PermutationTrie
+from progress import ComputationProgress, ConsoleProgressBar
 from damage_parameters import DamageParameters
+from dominance import prune_dominated_spells
 from spell import Spell, SpellBuff
 from spell_chain import SpellChains
 from spell_set import SpellSet
 from stats import Stats
+from storage import JsonStorage, Storage
+
+
+def _strtobool(value: str) -> int:
+    """Same as distutils.util.strtobool (deprecated, and slow to import): 1 for a true value ('y', 'yes', 't', 'true', 'on', '1'), 0 for a false one ('n', 'no', 'f', 'false', 'off', '0'), raise ValueError otherwise."""
+    value = value.lower()
+    if value in ('y', 'yes', 't', 'true', 'on', '1'):
+        return 1
+    if value in ('n', 'no', 'f', 'false', 'off', '0'):
+        return 0
+    raise ValueError(f"invalid truth value '{value}'")
 
 
 class Manager:
-    GENERAL_INSTRUCTIONS = ('s', 'q', 'i', 'cache')
+    GENERAL_INSTRUCTIONS = ('s', 'q', 'i', 'cache', 'perf')
     PARAMETERS_INSTRUCTION = ('p', 'param')
     STATS_INSTRUCTION = ('st',)
     SPELL_INSTRUCTION = ('sp',)
     SPELL_SET_INSTRUCTION = ('ss',)
-    DAMAGES_INSTRUCTION = ('dmg', 'dmgs', 'dmgc')
+    DAMAGES_INSTRUCTION = ('dmg', 'dmgs', 'dmgc', 'dmgpa', 'dmgdist', 'dmgmin', 'dmgexport')
 
     DIRECTORIES = ('stats', 'spells')
+    # 1: list of the permutations of every computation, 2: trie of the permutations (after a 'version:2' line)
+    CACHE_FILE_VERSION = 2
 
-    def __init__(self, print_method: Callable[[int, str], Any]) -> None:
+    def __init__(self, print_method: Callable[[int, str], Any], storage: Storage = None) -> None:
         self.print: Callable[[int, str], Any] = print_method
+        # JSON files in the current folder by default
+        self.storage: Storage = storage if storage is not None else JsonStorage()
         self.stats: Dict[str, Stats] = dict()
-        self.spells: Dict[str, Spell] = dict()
-        self.spell_sets: Dict[str, SpellSet] = dict()
+        # LazyDict once loaded from the storage
+        self.spells: MutableMapping[str, Spell] = dict()
+        self.spell_sets: MutableMapping[str, SpellSet] = dict()
         self.parameters: Dict[str, DamageParameters] = dict()
         self.default_parameters: str = ''
-        self.cache: Dict[int, List[Tuple[int, ...]]] = {}
+        # Only read from the cache file on its first use
+        self._cache: Optional[Dict[str, PermutationTrie]] = None
+        self.statistics_enabled: bool = False
+        self.last_statistics: Optional[ComputationStatistics] = None
 
         self._create_dirs()
         self._load_default()
-        self._load_from_file()
-        self._load_cache()
+        self._load_from_storage()
 
     def _create_dirs(self):
         for directory in Manager.DIRECTORIES:
@@ -45,7 +67,8 @@ class Manager:
                 os.mkdir(directory)
 
 
-    def _get_default_parameters(self):
+    def get_default_parameters(self) -> DamageParameters:
+        """Return the parameters used by default by the damages commands."""
         if self.default_parameters in self.parameters:
             return self.parameters[self.default_parameters]
 
@@ -56,64 +79,71 @@ class Manager:
         self.parameters['__default__'] = DamageParameters.from_string("-pa 1 -pomin 0 -pomax 2048 -t mono")
         self.default_parameters = '__default__'
 
-    def _load_from_file(self):
+    def _load_from_storage(self):
         try:
-            with open('manager.json', 'r', encoding='utf-8') as fi:
-                json_data = json.load(fi)
-
             # STATS
-            for stats_filepath in json_data['stats']:
-                try:
-                    stats = Stats.from_file(stats_filepath)
-                    self.stats[stats.get_short_name()] = stats
-                except (FileNotFoundError, KeyError, TypeError, ValueError):
-                    self.print(1, f"Could not open or read stats page '{stats_filepath}'.")
+            self.stats.update(self.storage.load_stats(lambda message: self.print(1, message)))
 
-            # SPELLS
-            for spell_filepath in json_data['spells']:
-                try:
-                    spell = Spell.from_file(spell_filepath)
-                    self.spells[spell.get_short_name()] = spell
-                except (FileNotFoundError, KeyError, TypeError, ValueError):
-                    self.print(1, f"Could not open or read spell '{spell_filepath}'.")
+            # SPELLS (loaded on their first use)
+            self.spells = LazyDict(self.storage.load_spells_index(lambda message: self.print(1, message)), self.storage.load_spell,
+                                   lambda short_name: self.print(1, f"Could not open or read spell '{short_name}'."))
 
-            # SPELL SETS
-            for spell_set_data in json_data['spell_sets']:
-                try:
-                    spell_set = SpellSet()
-                    for spell_short_name in spell_set_data['spells']:
-                        try:
-                            spell_set.add_spell(self.spells[spell_short_name])
-                        except KeyError:
-                            self.print(1, f"Cannot add spell '{spell_short_name}' to spell set '{spell_set_data['short_name']}': it does not exist.")
-
-                    spell_set.set_name(spell_set_data['name'])
-                    spell_set.set_short_name(spell_set_data['short_name'])
-                    self.spell_sets[spell_set.get_short_name()] = spell_set
-                except KeyError:
-                    self.print(1, f"Could not load spell set '{spell_set_data['name']}'.")
+            # SPELL SETS (loaded with their spells on their first use)
+            spell_sets_data = {spell_set_data['short_name']: spell_set_data for spell_set_data in self.storage.load_spell_sets()}
+            self.spell_sets = LazyDict(spell_sets_data, lambda short_name: self._load_spell_set(spell_sets_data[short_name]),
+                                       lambda short_name: self.print(1, f"Could not load spell set '{short_name}'."))
 
             # DEFAULT PARAMS
-            for parameters_name in json_data['parameters']:
+            parameters_data, default_parameters = self.storage.load_parameters()
+            for parameters_name in parameters_data:
                 try:
-                    self.parameters[parameters_name] = DamageParameters.from_string(json_data['parameters'][parameters_name])
-                except ValueError:
+                    self.parameters[parameters_name] = DamageParameters.load(parameters_data[parameters_name])
+                except (ValueError, TypeError, AttributeError):
                     self.print(1, f"Could not load parameters '{parameters_name}'.")
 
-            self.default_parameters = json_data['default_parameters']
+            self.default_parameters = default_parameters
 
         except (FileNotFoundError, KeyError, TypeError):
-            self.print(1, "'manager.json' file does not exist or is innaccessible, using default load only.")
+            self.print(1, f"{self.storage.description} does not exist or is innaccessible, using default load only.")
             return
 
 
+    def _load_spell_set(self, spell_set_data: Dict[str, Any]) -> SpellSet:
+        spell_set = SpellSet()
+        for spell_short_name in spell_set_data['spells']:
+            try:
+                spell_set.add_spell(self.spells[spell_short_name])
+            except KeyError:
+                self.print(1, f"Cannot add spell '{spell_short_name}' to spell set '{spell_set_data['short_name']}': it does not exist.")
+
+        spell_set.set_name(spell_set_data['name'])
+        spell_set.set_short_name(spell_set_data['short_name'])
+        return spell_set
+
+
+    @property
+    def cache(self) -> Dict[str, PermutationTrie]:
+        if self._cache is None:
+            self._load_cache()
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: Dict[str, PermutationTrie]):
+        self._cache = cache
+
     def _load_cache(self) -> None:
+        self._cache = {}
         try:
             with open('cache.txt', 'r', encoding='ascii') as fi:
+                version = 1
                 for line in fi:
-                    computation_hash, permutations = line.split(':')
-                    permutations = [tuple(map(int, permutation.split(','))) if permutation != '' else tuple() for permutation in permutations.split(';')]
-                    self.cache[computation_hash] = permutations
+                    computation_hash, permutations = line.strip().split(':')
+                    if computation_hash == 'version':
+                        version = int(permutations)
+                    elif version == 1:  # List of the permutations
+                        self._cache[computation_hash] = PermutationTrie(tuple(map(int, permutation.split(','))) if permutation != '' else tuple() for permutation in permutations.split(';'))
+                    else:
+                        self._cache[computation_hash] = PermutationTrie.from_string(permutations)
         except FileNotFoundError:  # File does not exist, do nothing
             pass
         except (ValueError, TypeError):  # Error while unpacking or splitting
@@ -121,57 +151,34 @@ class Manager:
 
 
     def save(self, print_message=True, save_cache=False):
-        stats_filepaths = list()
-        for stats in self.stats.values():
-            filepath = f'stats\\{stats.get_safe_name()}.json'
-            stats.save_to_file(filepath)
-            stats_filepaths.append(filepath)
-
-        spells_filepaths = list()
-        for spell in self.spells.values():
-            filepath = f'spells\\{spell.get_safe_name()}.json'
-            spell.save_to_file(filepath)
-            spells_filepaths.append(filepath)
-
-        spell_sets = list()
-        for spell_set in self.spell_sets.values():
-            spell_sets.append({
-                'spells': [spell.get_short_name() for spell in spell_set],
-                'name': spell_set.get_name(),
-                'short_name': spell_set.get_short_name()
-            })
-
-        string_parameters = dict()
-        for parameters_name in self.parameters:
-            string_parameters[parameters_name] = self.parameters[parameters_name].to_string()
-
-        json_valid_data = {
-            'stats': stats_filepaths,
-            'spells': spells_filepaths,
-            'spell_sets': spell_sets,
-            'parameters': string_parameters,
-            'default_parameters': self.default_parameters
-        }
-
-        with open('manager.json', 'w', encoding='utf-8') as fo:
-            json.dump(json_valid_data, fo)
+        self.storage.save(self.stats, self.spells, self.spell_sets, self.parameters, self.default_parameters)
 
         if save_cache:
-            with open('cache.txt', 'w', encoding='ascii') as fo:
-                for computation_hash in self.cache:
-                    fo.write(f'{computation_hash}:{";".join(",".join(map(str, permutation)) for permutation in self.cache[computation_hash])}\n')
+            self.save_cache()
 
         if print_message:
             self.print(0, 'Data successfully saved!')
 
 
+    def save_cache(self):
+        # The cache file is unchanged if the cache was never used
+        if self._cache is None:
+            return
+
+        with open('cache.txt', 'w', encoding='ascii') as fo:
+            fo.write(f'version:{Manager.CACHE_FILE_VERSION}\n')
+            for computation_hash in self.cache:
+                fo.write(f'{computation_hash}:{self.cache[computation_hash].to_string()}\n')
+
+
     def _print_infos(self):
         # TODO: redo the printing of params and infos
-        self.print(0, self._get_default_parameters().to_string())
+        self.print(0, self.get_default_parameters().to_string())
 
 
     def _print_cache(self):
         self.print(0, f'Cache entries count: {len(self.cache)}')
+        self.print(0, f'Memory size of cache: {sum(permutations.get_memory_size() for permutations in self.cache.values()) / 1024 / 1024:.2f} MB')
         try:
             total_size = f"{os.path.getsize('cache.txt') / 1024 / 1024:.2f} MB"
         except OSError:
@@ -179,6 +186,26 @@ class Manager:
         self.print(0, f'Total size of cache file: {total_size}')
 
 
+    def _execute_performance_command(self, args: List[str]):
+        if len(args) == 0 or args[0] == 'show':
+            if not self.statistics_enabled:
+                self.print(0, "Performance statistics are disabled, use 'perf on' to enable them.")
+            elif self.last_statistics is None:
+                self.print(0, 'No damages computation since the performance statistics were enabled.')
+            else:
+                self.print(0, '===== Performance statistics of the last damages computation\n')
+                self.print(0, self.last_statistics.to_string())
+        elif args[0] == 'on':
+            self.statistics_enabled = True
+            self.print(0, 'Performance statistics enabled.')
+        elif args[0] == 'off':
+            self.statistics_enabled = False
+            self.last_statistics = None
+            self.print(0, 'Performance statistics disabled.')
+        else:
+            self.print(1, f"Unknown action '{args[0]}' for performance commands.")
+
+
     def _execute_general_command(self, instr, args: List[str]):
         if instr == 's':
             self.save(save_cache=True)
@@ -186,6 +213,8 @@ class Manager:
             self._print_infos()
         elif instr == 'cache':
             self._print_cache()
+        elif instr == 'perf':
+            self._execute_performance_command(args)
 
 
     def _execute_parameters_command(self, instr, args: List[str]):
@@ -206,7 +235,7 @@ class Manager:
                 self.print(1, f"Parameters '{parameters_name}' already exist.")
                 return
 
-            self.parameters[parameters_name] = DamageParameters.from_existing(self._get_default_parameters())
+            self.parameters[parameters_name] = DamageParameters.from_existing(self.get_default_parameters())
             self.save(False)
             self.print(0, f"Parameters '{parameters_name}' successfully created from current ones.")
 
@@ -228,7 +257,7 @@ class Manager:
         elif command_action.startswith('-'):
             command = ' '.join(args)
 
-            current_parameters = self._get_default_parameters()
+            current_parameters = self.get_default_parameters()
 
             try:
                 current_parameters = DamageParameters.from_string(command, current_parameters)
@@ -470,7 +499,7 @@ class Manager:
         is_huppermage_states = input(f'Is Huppermage states ({buff.is_huppermage_states}) (0/1)? ')
         if is_huppermage_states:
             try:
-                buff.is_huppermage_states = distutils.util.strtobool(is_huppermage_states)
+                buff.set_huppermage_states(_strtobool(is_huppermage_states))
             except ValueError:  # if the value cannot be converted to a boolean, do as if nothing was input
                 pass
 
@@ -532,7 +561,7 @@ class Manager:
         deactivate_damages = input(f'\nDoes trigger deactivates spell damages ({buff.deactivate_damages}) (0/1)? ')
         if deactivate_damages:
             try:
-                buff.deactivate_damages = distutils.util.strtobool(deactivate_damages)
+                buff.set_deactivate_damages(_strtobool(deactivate_damages))
             except ValueError:  # if the value cannot be converted to a boolean, do as if nothing was input
                 pass
 
@@ -554,7 +583,7 @@ class Manager:
                 break
 
             try:
-                damaging = distutils.util.strtobool(damaging) if damaging else default_damaging
+                damaging = _strtobool(damaging) if damaging else default_damaging
             except ValueError:  # if the valeur cannot be converted to a boolean, do as if False was input
                 damaging = False
 
@@ -576,7 +605,7 @@ class Manager:
             spell = input(f"\nSpell name (or '__all__') to add another stats page to (ENTER to skip)? ")
             if spell:
                 try:
-                    buff.stats[spell] = self._create_stats(buff.stats.get(spell, None), no_name=True)
+                    buff.set_stats(self._create_stats(buff.stats.get(spell, None), no_name=True), spell)
                 except KeyboardInterrupt:
                     self.print(0, f"\n\nCancelled page creation for spell '{spell}'.")
             else:
@@ -616,7 +645,7 @@ class Manager:
         is_weapon = input(f'Weapon ({spell.parameters.is_weapon}) (0/1): ')
         if is_weapon:
             try:
-                spell.set_weapon(distutils.util.strtobool(is_weapon))
+                spell.set_weapon(_strtobool(is_weapon))
             except ValueError:  # if the valeur cannot be converted to a boolean, do as if nothing was input
                 pass
 
@@ -647,7 +676,7 @@ class Manager:
                     continue
 
                 try:
-                    damaging = distutils.util.strtobool(damaging) if damaging else default_damaging
+                    damaging = _strtobool(damaging) if damaging else default_damaging
                 except ValueError:  # if the valeur cannot be converted to a boolean, do as if False was input
                     damaging = False
 
@@ -897,7 +926,7 @@ class Manager:
 
             command = ' '.join(args[2:])
             try:
-                damages_parameters = DamageParameters.from_string(command, self._get_default_parameters())
+                damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
             except ValueError as e:
                 self.print(1, f'Cannot parse parameters: {str(e)}')
                 return
@@ -1089,6 +1118,68 @@ class Manager:
             self.print(1, f"Unknown action '{command_action}' for spell commands.")
 
 
+    def _get_spell_list(self, spell_set: SpellSet, damages_parameters: DamageParameters) -> List[Spell]:
+        spell_list = list()
+        if damages_parameters.type == 'mono':
+            spell_list = spell_set.get_spell_list_single_target(damages_parameters)
+        elif damages_parameters.type == 'multi':
+            spell_list = spell_set.get_spell_list_multiple_targets(damages_parameters)
+        elif damages_parameters.type == 'versa':
+            spell_list = spell_set.get_spell_list_versatile(damages_parameters)
+
+        return spell_list
+
+
+    def _prune_spell_list(self, spell_list: List[Spell], total_stats: Stats, damages_parameters: DamageParameters) -> List[Spell]:
+        """Remove the uses of the dominated spells (which cannot improve the best combination) and print why."""
+        spell_list, dominated_spells = prune_dominated_spells(spell_list, total_stats, damages_parameters)
+        if dominated_spells:
+            self.print(0, 'Dominated spells removed before the computation:')
+            for dominated_spell in dominated_spells:
+                self.print(0, f" - {dominated_spell.spell.get_name()} ({dominated_spell.pruned_count} use{'s' if dominated_spell.pruned_count > 1 else ''}): {dominated_spell.get_reason()}")
+            self.print(0, '')
+
+        return spell_list
+
+    def get_damages_query(self, spell_set_short_name: str, command: str = '', stats_short_names: List[str] = None) -> Tuple[List[Spell], Stats, DamageParameters]:
+        """Return the spells, the total stats and the parameters of a damages computation on a spell set, as done by the 'dmg' command.
+
+        If stats_short_names is not None, it replaces the stats pages of the parameters."""
+        if not spell_set_short_name in self.spell_sets:
+            raise KeyError(f"Spell set '{spell_set_short_name}' does not exist.")
+
+        damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
+        if stats_short_names is not None:
+            damages_parameters.stats = list(stats_short_names)
+
+        spell_list = self._get_spell_list(self.spell_sets[spell_set_short_name], damages_parameters)
+        total_stats = damages_parameters.get_total_stats(self.stats)
+
+        return (spell_list, total_stats, damages_parameters)
+
+
+    def _get_spell_chain(self, spell_list: List[Spell]) -> SpellChains:
+        statistics = None
+        if self.statistics_enabled:
+            statistics = ComputationStatistics()
+            self.last_statistics = statistics
+
+        spell_chain = SpellChains(statistics=statistics)
+        for spell in spell_list:
+            spell_chain.add_spell(spell)
+
+        return spell_chain
+
+
+    def _get_progress(self) -> ComputationProgress:
+        return ComputationProgress(callback=ConsoleProgressBar())
+
+    def _print_cancelled_progress(self, progress: ComputationProgress):
+        if progress.cancelled:
+            progress.callback.close()
+            self.print(0, f"Damages computation {'interrupted' if progress.cancel_reason == 'interrupted' else 'stopped'} after {progress.processed} of {progress.total} combinations, showing the best result found so far.\n")
+
+
     def _execute_damages_command(self, args: List[str], simple: bool = False):
         if len(args) < 1:
             self.print(1, 'Missing spell set.')
@@ -1104,18 +1195,16 @@ class Manager:
 
         command = ' '.join(args[1:])
         try:
-            damages_parameters = DamageParameters.from_string(command, self._get_default_parameters())
+            damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
         except ValueError as e:
             self.print(1, f'Cannot parse parameters: {str(e)}')
             return
 
-        spell_list = list()
-        if damages_parameters.type == 'mono':
-            spell_list = spell_set.get_spell_list_single_target(damages_parameters)
-        elif damages_parameters.type == 'multi':
-            spell_list = spell_set.get_spell_list_multiple_targets(damages_parameters)
-        elif damages_parameters.type == 'versa':
-            spell_list = spell_set.get_spell_list_versatile(damages_parameters)
+        if not simple and damages_parameters.hp > 0 and damages_parameters.timeout > 0:
+            self.print(1, 'The -hp and -timeout parameters cannot be used together: the kill probability search has no time limit.')
+            return
+
+        spell_list = self._get_spell_list(spell_set, damages_parameters)
 
         total_stats = damages_parameters.get_total_stats(self.stats)
 
@@ -1128,17 +1217,75 @@ class Manager:
             self.print(0, 'Using: ')
             for spell in best_spells:
                 self.print(0, f" - {spell.get_name()} ({int(spell.get_average_damages(total_stats, damages_parameters)):.0f} dmg)")
+        elif damages_parameters.hp > 0:
+            spell_chain = self._get_spell_chain(spell_list)
+
+            from damage_distribution import get_best_kill_probability
+
+            progress = self._get_progress()
+            try:
+                result = get_best_kill_probability(spell_chain, total_stats, damages_parameters, damages_parameters.hp, cache=self.cache, progress=progress)
+            except KeyboardInterrupt:
+                self.print(0, 'Cancelled damages computation.')
+                return
+
+            self._print_cancelled_progress(progress)
+            if len(result.combination) == 0:
+                self.print(0, 'No possible combination of spells.')
+                return
+
+            self.print(0, f"Maximum kill probability ('{self.default_parameters}' ; PA = {damages_parameters.pa} ; PO = {damages_parameters.get_min_po()} - {damages_parameters.get_max_po()} ; type = {damages_parameters.type} ; position = {damages_parameters.position} ; distance = {damages_parameters.distance} ; HP = {damages_parameters.hp}) is:\n")
+            self.print(0, f" => {100 * result.kill_probability:.2f} % : {result.average_damages:.0f} dmg : {result.damages['min']} - {result.damages['max']} ({result.damages['crit_min']} - {result.damages['crit_max']})\n")
+            self.print(0, 'Using, in this order: ')
+            for spell_short_name in result.combination:
+                self.print(0, f" - {self.spells[spell_short_name].get_name()}")
+
+            self.print(0, f"\n{result.combinations_count} possible combinations, {result.exact_count} exact distributions computed, {result.pruned_count} combinations pruned.")
+
+        elif damages_parameters.timeout > 0:
+            spell_list = self._prune_spell_list(spell_list, total_stats, damages_parameters)
+            spell_chain = self._get_spell_chain(spell_list)
+
+            # Without callback: the number of combinations to explore is not known in advance
+            progress = ComputationProgress()
+            try:
+                result = spell_chain.get_best_damages_anytime(total_stats, damages_parameters, timeout=damages_parameters.timeout / 1000, progress=progress)
+            except KeyboardInterrupt:
+                self.print(0, 'Cancelled damages computation.')
+                return
+
+            if progress.cancelled:
+                self.print(0, f"Damages computation {'interrupted' if progress.cancel_reason == 'interrupted' else 'stopped'} before the timeout, showing the best result found so far.\n")
+
+            if len(result.combination) == 0:
+                self.print(0, 'No possible combination of spells.')
+                return
+
+            self.print(0, f"Maximum average damages ('{self.default_parameters}' ; PA = {damages_parameters.pa} ; PO = {damages_parameters.get_min_po()} - {damages_parameters.get_max_po()} ; type = {damages_parameters.type} ; position = {damages_parameters.position} ; distance = {damages_parameters.distance} ; timeout = {damages_parameters.timeout} ms) is:\n")
+            self.print(0, f" => {result.average_damages:.0f} dmg : {result.damages['min']} - {result.damages['max']} ({result.damages['crit_min']} - {result.damages['crit_max']})\n")
+            self.print(0, 'Using, in this order: ')
+            for spell_short_name in result.combination:
+                self.print(0, f" - {self.spells[spell_short_name].get_name()}")
+
+            optimality = 'proven optimal' if result.is_optimal else 'best found before the timeout, not proven optimal'
+            self.print(0, f"\n{result.explored_count} combinations explored in {1000 * result.elapsed_time:.0f} ms ({optimality}).")
+
         else:
-            spell_chain = SpellChains()
-            for spell in spell_list:
-                spell_chain.add_spell(spell)
+            spell_list = self._prune_spell_list(spell_list, total_stats, damages_parameters)
+            spell_chain = self._get_spell_chain(spell_list)
 
+            progress = self._get_progress()
             try:
-                damages = spell_chain.get_detailed_damages(total_stats, damages_parameters, cache=self.cache)
+                damages = spell_chain.get_detailed_damages(total_stats, damages_parameters, cache=self.cache, progress=progress)
             except KeyboardInterrupt:
                 self.print(0, 'Cancelled damages computation.')
                 return
 
+            self._print_cancelled_progress(progress)
+            if len(damages) == 0:
+                self.print(0, 'No possible combination of spells.')
+                return
+
             best_combination = next(iter(damages))
             average_damages, detailed_damages = damages[best_combination]
             self.print(0, f"Maximum average damages ('{self.default_parameters}' ; PA = {damages_parameters.pa} ; PO = {damages_parameters.get_min_po()} - {damages_parameters.get_max_po()} ; type = {damages_parameters.type} ; position = {damages_parameters.position} ; distance = {damages_parameters.distance}) is:\n")
@@ -1158,11 +1305,199 @@ class Manager:
                 self.print(0, f" - {', '.join(self.spells[spell_short_name].get_name() for spell_short_name in combination)}")
 
 
-    def _execute_damages_combination_command(self, args: List[str]):
+    def _execute_damages_by_pa_command(self, args: List[str]):
         if len(args) < 1:
-            self.print(1, 'Missing spells.')
+            self.print(1, 'Missing spell set.')
+            return
+
+        spell_set_short_name = args[0]
+
+        if not spell_set_short_name in self.spell_sets:
+            self.print(1, f"Spell set '{spell_set_short_name}' does not exist.")
+            return
+
+        spell_set = self.spell_sets[spell_set_short_name]
+
+        command = ' '.join(args[1:])
+        try:
+            damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
+        except ValueError as e:
+            self.print(1, f'Cannot parse parameters: {str(e)}')
+            return
+
+        spell_list = self._get_spell_list(spell_set, damages_parameters)
+        total_stats = damages_parameters.get_total_stats(self.stats)
+        spell_list = self._prune_spell_list(spell_list, total_stats, damages_parameters)
+
+        spell_chain = self._get_spell_chain(spell_list)
+
+        progress = self._get_progress()
+        try:
+            best_damages_by_pa = spell_chain.get_best_damages_by_pa(total_stats, damages_parameters, cache=self.cache, progress=progress)
+        except KeyboardInterrupt:
+            self.print(0, 'Cancelled damages computation.')
+            return
+
+        self._print_cancelled_progress(progress)
+
+        self.print(0, f"Maximum average damages by PA ('{self.default_parameters}' ; PO = {damages_parameters.get_min_po()} - {damages_parameters.get_max_po()} ; type = {damages_parameters.type} ; position = {damages_parameters.position} ; distance = {damages_parameters.distance}):\n")
+        for pa, best_damages in best_damages_by_pa.items():
+            if best_damages is None:
+                self.print(0, f" - {pa:>2} PA => no possible combination")
+                continue
+
+            combination, average_damages, detailed_damages = best_damages
+            self.print(0, f" - {pa:>2} PA => {average_damages:.0f} dmg : {detailed_damages['min']} - {detailed_damages['max']} ({detailed_damages['crit_min']} - {detailed_damages['crit_max']}) using {', '.join(self.spells[spell_short_name].get_name() for spell_short_name in combination)}")
+
+
+    def _execute_min_pa_damages_command(self, args: List[str]):
+        if len(args) < 1:
+            self.print(1, 'Missing spell set.')
+            return
+
+        if len(args) < 2:
+            self.print(1, 'Missing damages threshold.')
+            return
+
+        spell_set_short_name = args[0]
+
+        if not spell_set_short_name in self.spell_sets:
+            self.print(1, f"Spell set '{spell_set_short_name}' does not exist.")
+            return
+
+        spell_set = self.spell_sets[spell_set_short_name]
+
+        if re.match(r'^\d+$', args[1]) is None:
+            self.print(1, f"Damages threshold should be a non negative integer ('{args[1]}' given instead).")
+            return
+        threshold = int(args[1])
+
+        criterion = 'average'
+        parameters_start = 2
+        if len(args) > 2 and not args[2].startswith('-'):
+            if not args[2] in ('avg', 'min'):
+                self.print(1, f"Criterion should be one of ['avg', 'min'] ('{args[2]}' given instead).")
+                return
+            criterion = 'average' if args[2] == 'avg' else 'min'
+            parameters_start = 3
+
+        command = ' '.join(args[parameters_start:])
+        try:
+            damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
+        except ValueError as e:
+            self.print(1, f'Cannot parse parameters: {str(e)}')
+            return
+
+        spell_list = self._get_spell_list(spell_set, damages_parameters)
+        total_stats = damages_parameters.get_total_stats(self.stats)
+        spell_list = self._prune_spell_list(spell_list, total_stats, damages_parameters)
+
+        spell_chain = self._get_spell_chain(spell_list)
+
+        try:
+            result = spell_chain.get_min_pa_combination(total_stats, damages_parameters, threshold, criterion=criterion)
+        except KeyboardInterrupt:
+            self.print(0, 'Cancelled damages computation.')
+            return
+
+        criterion_name = 'average damages' if criterion == 'average' else 'minimum damages'
+        if result is None:
+            self.print(0, f"No combination of at most {damages_parameters.pa} PA reaches {threshold} {criterion_name}.")
+            return
+
+        combination, pa, average_damages, detailed_damages = result
+        self.print(0, f"Minimum PA to reach {threshold} {criterion_name} ('{self.default_parameters}' ; PO = {damages_parameters.get_min_po()} - {damages_parameters.get_max_po()} ; type = {damages_parameters.type} ; position = {damages_parameters.position} ; distance = {damages_parameters.distance}) is: {pa} PA\n")
+        self.print(0, f" => {average_damages:.0f} dmg : {detailed_damages['min']} - {detailed_damages['max']} ({detailed_damages['crit_min']} - {detailed_damages['crit_max']})\n")
+        self.print(0, 'Using, in this order: ')
+        for spell_short_name in combination:
+            self.print(0, f" - {self.spells[spell_short_name].get_name()}")
+
+
+    def _execute_damages_export_command(self, args: List[str]):
+        if len(args) < 1:
+            self.print(1, 'Missing spell set.')
+            return
+
+        if len(args) < 2:
+            self.print(1, 'Missing export file.')
+            return
+
+        spell_set_short_name, filepath = args[0], args[1]
+
+        if not spell_set_short_name in self.spell_sets:
+            self.print(1, f"Spell set '{spell_set_short_name}' does not exist.")
+            return
+
+        spell_set = self.spell_sets[spell_set_short_name]
+
+        # A path without extension is the directory of a result store
+        export_format = 'store'
+        if os.path.splitext(filepath)[1] != '':
+            try:
+                export_format = get_export_format(filepath)
+            except ValueError as e:
+                self.print(1, str(e))
+                return
+
+        # Optional minimum average damages, then maximum number of spells, before the parameters
+        filters = []
+        parameters_start = 2
+        while parameters_start < len(args) and len(filters) < 2 and not args[parameters_start].startswith('-'):
+            if re.match(r'^\d+$', args[parameters_start]) is None:
+                self.print(1, f"{'Minimum damages' if len(filters) == 0 else 'Maximum length'} should be a non negative integer ('{args[parameters_start]}' given instead).")
+                return
+            filters.append(int(args[parameters_start]))
+            parameters_start += 1
+        min_damages = filters[0] if len(filters) > 0 else None
+        max_length = filters[1] if len(filters) > 1 else None
+
+        command = ' '.join(args[parameters_start:])
+        try:
+            damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
+        except ValueError as e:
+            self.print(1, f'Cannot parse parameters: {str(e)}')
             return
 
+        spell_list = self._get_spell_list(spell_set, damages_parameters)
+        total_stats = damages_parameters.get_total_stats(self.stats)
+
+        spell_chain = self._get_spell_chain(spell_list)
+
+        progress = self._get_progress()
+        try:
+            if export_format == 'store':
+                # Imported on first use, as it imports numpy (if installed) which is slow to import
+                from result_store import ResultStore
+                store = ResultStore(filepath)
+                run = store.add_run(spell_chain, total_stats, damages_parameters, spell_set=spell_set_short_name, name=self.default_parameters, min_damages=min_damages,
+                                    max_length=max_length, cache=self.cache, progress=progress)
+                count = store.runs[run]['count']
+            else:
+                count = export_chains(spell_chain, total_stats, damages_parameters, filepath, export_format=export_format, min_damages=min_damages, max_length=max_length,
+                                      cache=self.cache, progress=progress)
+        except (ImportError, ValueError) as e:
+            self.print(1, str(e))
+            return
+        except OSError as e:
+            self.print(1, f"Cannot write export file '{filepath}': {str(e)}")
+            return
+        except KeyboardInterrupt:
+            self.print(0, 'Cancelled damages computation.')
+            return
+
+        if progress.cancelled:
+            progress.callback.close()
+            self.print(0, f"Damages computation {'interrupted' if progress.cancel_reason == 'interrupted' else 'stopped'} after {progress.processed} of {progress.total} combinations, the file only contains the combinations computed so far.")
+
+        self.print(0, f"{count} combinations written to '{filepath}'.")
+
+
+    def _parse_combination_args(self, args: List[str]) -> Optional[Tuple[List[Spell], DamageParameters]]:
+        """Return the spells (until the first parameter) and the parameters of a combination command, or None if they are invalid."""
+        if len(args) < 1:
+            self.print(1, 'Missing spells.')
+            return None
+
         spell_list: List[Spell] = list()
 
         for index, spell_short_name in enumerate(args):
@@ -1172,22 +1507,29 @@ class Manager:
 
             if not spell_short_name in self.spells:
                 self.print(1, f"Spell '{spell_short_name}' does not exist.")
-                return
+                return None
             
             spell_list.append(self.spells[spell_short_name])
 
         command = ' '.join(args[index + 1:])
         try:
-            damages_parameters = DamageParameters.from_string(command, self._get_default_parameters())
+            damages_parameters = DamageParameters.from_string(command, self.get_default_parameters())
         except ValueError as e:
             self.print(1, f'Cannot parse parameters: {str(e)}')
+            return None
+
+        return (spell_list, damages_parameters)
+
+
+    def _execute_damages_combination_command(self, args: List[str]):
+        parsed_args = self._parse_combination_args(args)
+        if parsed_args is None:
             return
+        spell_list, damages_parameters = parsed_args
 
         total_stats = damages_parameters.get_total_stats(self.stats)
 
-        spell_chain = SpellChains()
-        for spell in spell_list:
-            spell_chain.add_spell(spell)
+        spell_chain = self._get_spell_chain(spell_list)
 
         permutation = list(range(len(spell_list)))  # Permutation of all specified spells in the specified order
         computation_data = spell_chain._get_detailed_damages_of_permutation(permutation, total_stats, damages_parameters)
@@ -1195,6 +1537,50 @@ class Manager:
         self.print(0, f"Damages of the given combination (parameters : '{self.default_parameters}' ; total PA : {sum(spell.get_pa() for spell in spell_list)} ; initial states: ({','.join(sorted(damages_parameters.starting_states))})) is:\n")
         self.print(0, f" => {computation_data.average_damages:.0f} dmg : {computation_data.damages['min']} - {computation_data.damages['max']} ({computation_data.damages['crit_min']} - {computation_data.damages['crit_max']})")
 
+        if damages_parameters.hp > 0:
+            from damage_distribution import get_exact_distribution
+            distribution = get_exact_distribution(spell_chain.get_rolls([spell.get_short_name() for spell in spell_list], total_stats, damages_parameters))
+            self.print(0, f"\nKill probability ({damages_parameters.hp} HP): {100 * distribution.get_kill_probability(damages_parameters.hp):.2f} %")
+
+
+    def _execute_damages_distribution_command(self, args: List[str]):
+        # Imported on first use, as it imports numpy (if installed) which is slow to import
+        from damage_distribution import get_exact_distribution, simulate_damages
+
+        parsed_args = self._parse_combination_args(args)
+        if parsed_args is None:
+            return
+        spell_list, damages_parameters = parsed_args
+
+        total_stats = damages_parameters.get_total_stats(self.stats)
+
+        spell_chain = self._get_spell_chain(spell_list)
+        rolls = spell_chain.get_rolls([spell.get_short_name() for spell in spell_list], total_stats, damages_parameters)
+        if rolls is None:
+            self.print(1, 'The spells cannot be used together (incompatible ranges).')
+            return
+
+        try:
+            distribution = simulate_damages(rolls)
+        except ImportError as e:
+            self.print(1, str(e))
+            return
+
+        self.print(0, f"Damages distribution of the given combination (parameters : '{self.default_parameters}' ; total PA : {sum(spell.get_pa() for spell in spell_list)} ; initial states: ({','.join(sorted(damages_parameters.starting_states))}) ; {distribution.trials} trials):\n")
+        self.print(0, f" => {distribution.mean:.0f} dmg (standard deviation : {distribution.std:.0f}) : {distribution.min} - {distribution.max}\n")
+        self.print(0, 'Percentiles:')
+        for percentile, value in distribution.percentiles.items():
+            self.print(0, f" - {percentile:>2} % : {value:.0f}")
+
+        if damages_parameters.hp > 0:
+            self.print(0, f"\nKill probability ({damages_parameters.hp} HP): {100 * get_exact_distribution(rolls).get_kill_probability(damages_parameters.hp):.2f} % (exact)")
+
+        self.print(0, '\nHistogram:')
+        counts, edges = distribution.histogram
+        max_count = max(counts)
+        for count, low, high in zip(counts, edges, edges[1:]):
+            self.print(0, f" {low:>7.0f} - {high:>7.0f} | {'#' * round(40 * count / max_count)} {100 * count / distribution.trials:.1f} %")
+
 
     def execute_command(self, command: str):
         if command == '':
@@ -1225,6 +1611,14 @@ class Manager:
         elif instr in Manager.DAMAGES_INSTRUCTION:
             if instr == 'dmgc':
                 self._execute_damages_combination_command(args)
+            elif instr == 'dmgpa':
+                self._execute_damages_by_pa_command(args)
+            elif instr == 'dmgdist':
+                self._execute_damages_distribution_command(args)
+            elif instr == 'dmgmin':
+                self._execute_min_pa_damages_command(args)
+            elif instr == 'dmgexport':
+                self._execute_damages_export_command(args)
             else:
                 self._execute_damages_command(args, simple=(instr=='dmgs'))
             return
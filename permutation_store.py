@@ -0,0 +1,156 @@
+from array import array
+from typing import Iterable, Iterator, List, Sequence, Set, Tuple
+
+
+class PermutationTrie:
+    """Sequence of permutations (tuples of spell indices) stored as a prefix trie, so that the common prefixes are stored (and evaluated) only once.
+
+    The nodes are stored in preorder in flat arrays: the spell index and the depth of every node (the root, node 0, is the empty permutation),
+    and whether it is a permutation of the sequence or only the prefix of other ones. The permutations are the terminal nodes, in preorder."""
+
+    def __init__(self, permutations: Iterable[Sequence[int]] = ()) -> None:
+        self.spells: array = array('H', [0])
+        self.depths: array = array('B', [0])
+        self.terminals: array = array('B', [0])
+        self.permutations_count: int = 0
+
+        # Path from the root to the last node, and spell indices of the children of its nodes (the other nodes cannot have new children)
+        self._path: List[int] = []
+        self._path_children: List[Set[int]] = [set()]
+        # Index of the node of every permutation, and parent of every node, only built if the permutations are accessed by index
+        self._terminal_nodes: array = None
+        self._parents: array = None
+
+        for permutation in permutations:
+            self.append(permutation)
+
+    def append(self, permutation: Sequence[int]):
+        """Add a permutation, which must be given after all the permutations sharing a longer prefix with it (for example in lexicographic order)."""
+        permutation = list(permutation)
+        common_length = 0
+        while common_length < min(len(permutation), len(self._path)) and permutation[common_length] == self._path[common_length]:
+            common_length += 1
+
+        # Already a node, which can only be the root before any other permutation, or a node which is not on the path of the last one
+        if (common_length == len(permutation) and (len(permutation) > 0 or len(self.depths) > 1 or self.terminals[0])) or \
+                (common_length < len(permutation) and permutation[common_length] in self._path_children[common_length]):
+            raise ValueError(f'Permutation {tuple(permutation)} is already present or is not given after the ones sharing a longer prefix with it.')
+
+        if common_length == len(permutation):
+            self.terminals[0] = 1
+        else:
+            del self._path_children[common_length + 1:]
+            for depth in range(common_length, len(permutation)):
+                self.spells.append(permutation[depth])
+                self.depths.append(depth + 1)
+                self.terminals.append(1 if depth == len(permutation) - 1 else 0)
+                self._path_children[depth].add(permutation[depth])
+                self._path_children.append(set())
+
+        self._path = permutation
+        self.permutations_count += 1
+        self._terminal_nodes = None
+        self._parents = None
+
+    def iter_nodes(self) -> Iterator[Tuple[int, int, bool]]:
+        """Yield the spell index, the depth and the terminal flag of every node but the root, in preorder."""
+        spells, depths, terminals = self.spells, self.depths, self.terminals
+        for node in range(1, len(depths)):
+            yield spells[node], depths[node], terminals[node]
+
+
+    def _build_index(self):
+        terminal_nodes = array('I')
+        parents = array('I', [0])
+        # Last node of each depth
+        last_nodes = [0]
+        for node in range(len(self.depths)):
+            depth = self.depths[node]
+            if node > 0:
+                parents.append(last_nodes[depth - 1])
+                del last_nodes[depth:]
+                last_nodes.append(node)
+            if self.terminals[node]:
+                terminal_nodes.append(node)
+
+        self._terminal_nodes = terminal_nodes
+        self._parents = parents
+
+    def _get_node(self, index: int) -> int:
+        if index < 0:
+            index += self.permutations_count
+        if not 0 <= index < self.permutations_count:
+            raise IndexError('Permutation index out of range.')
+
+        if self._terminal_nodes is None:
+            self._build_index()
+        return self._terminal_nodes[index]
+
+    def get_length(self, index: int) -> int:
+        """Length of the permutation, without building it."""
+        return self.depths[self._get_node(index)]
+
+
+    def get_memory_size(self) -> int:
+        """Size in bytes of the stored data."""
+        return sum(values.itemsize * len(values) for values in (self.spells, self.depths, self.terminals, self._terminal_nodes, self._parents) if values is not None)
+
+
+    def to_string(self) -> str:
+        """Nodes separated by ';', as 'depth,spell' for the terminal ones and 'depth,spell,0' for the others (without the root)."""
+        return f"{self.terminals[0]}|" + ';'.join(f'{depth},{spell}' if terminal else f'{depth},{spell},0' for spell, depth, terminal in self.iter_nodes())
+
+    @classmethod
+    def from_string(cls, string: str) -> 'PermutationTrie':
+        root_terminal, nodes = string.split('|')
+        trie = PermutationTrie()
+        trie.terminals[0] = int(root_terminal)
+        path, path_children = trie._path, trie._path_children
+        for node in nodes.split(';') if nodes else []:
+            values = list(map(int, node.split(',')))
+            depth = values[0]
+            if not 1 <= depth <= trie.depths[-1] + 1:
+                raise ValueError(f"Invalid depth in node '{node}'.")
+            trie.spells.append(values[1])
+            trie.depths.append(depth)
+            trie.terminals.append(values[2] if len(values) > 2 else 1)
+            del path[depth - 1:]
+            path.append(values[1])
+            del path_children[depth:]
+            path_children[depth - 1].add(values[1])
+            path_children.append(set())
+
+        trie.permutations_count = sum(trie.terminals)
+        return trie
+
+
+    def __len__(self) -> int:
+        return self.permutations_count
+
+    def __getitem__(self, index: int) -> Tuple[int, ...]:
+        node = self._get_node(index)
+        permutation = []
+        while node > 0:
+            permutation.append(self.spells[node])
+            node = self._parents[node]
+
+        return tuple(reversed(permutation))
+
+    def __iter__(self) -> Iterator[Tuple[int, ...]]:
+        if self.terminals[0]:
+            yield tuple()
+
+        path: List[int] = []
+        for spell, depth, terminal in self.iter_nodes():
+            del path[depth - 1:]
+            path.append(spell)
+            if terminal:
+                yield tuple(path)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PermutationTrie):
+            return NotImplemented
+        return self.spells == other.spells and self.depths == other.depths and self.terminals == other.terminals
+
+    def __repr__(self) -> str:
+        return f'PermutationTrie({list(self)})'
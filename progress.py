@@ -0,0 +1,135 @@
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+
+@lru_cache(maxsize=None)
+def _get_tqdm() -> Optional[Callable]:
+    """Import tqdm on the first progress bar displayed (it is slow to import), or return None if it is not installed (a simple text progress bar is used instead)."""
+    try:
+        from tqdm import tqdm
+        return tqdm
+    except ImportError:
+        return None
+
+
+class CancellationToken:
+    """Thread-safe flag used to ask a running computation to stop."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class ComputationProgress:
+    """Progress reporting and cancellation of a long computation.
+
+    The callback is called with the number of processed items, the total number of items and the estimated remaining time in seconds (None if unknown).
+    The computation stops as soon as possible when the cancellation token is cancelled or when the time budget (in seconds) is exceeded,
+    and returns the best result found so far."""
+
+    def __init__(self, callback: Callable[[int, int, Optional[float]], Any] = None, cancellation_token: CancellationToken = None, time_budget: float = None, update_interval: int = 256) -> None:
+        self.callback: Optional[Callable[[int, int, Optional[float]], Any]] = callback
+        self.cancellation_token: CancellationToken = cancellation_token if cancellation_token is not None else CancellationToken()
+        self.time_budget: Optional[float] = time_budget
+        self.update_interval: int = update_interval
+
+        self.processed: int = 0
+        self.total: int = 0
+        self.start_time: float = 0.0
+        self.cancelled: bool = False
+        # One of 'cancelled', 'timeout' or 'interrupted' if the computation was stopped early
+        self.cancel_reason: Optional[str] = None
+
+
+    def start(self, total: int):
+        self.processed = 0
+        self.total = total
+        self.start_time = time.perf_counter()
+        self.cancelled = False
+        self.cancel_reason = None
+
+        if self.callback is not None:
+            self.callback(0, total, None)
+
+    def get_elapsed_time(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def get_eta(self) -> Optional[float]:
+        if self.processed == 0:
+            return None
+
+        return self.get_elapsed_time() / self.processed * (self.total - self.processed)
+
+    def update(self, processed: int) -> bool:
+        """Update the number of processed items and return True if the computation should stop."""
+        self.processed = processed
+
+        if self.callback is not None:
+            self.callback(processed, self.total, self.get_eta())
+
+        if self.cancellation_token.is_cancelled():
+            self.cancel('cancelled')
+        elif self.time_budget is not None and self.get_elapsed_time() > self.time_budget:
+            self.cancel('timeout')
+
+        return self.cancelled
+
+    def cancel(self, reason: str = 'cancelled'):
+        self.cancelled = True
+        self.cancel_reason = reason
+
+    def finish(self):
+        if self.callback is not None and not self.cancelled:
+            self.callback(self.total, self.total, 0.0)
+
+
+class ConsoleProgressBar:
+    """Progress callback displaying a progress bar in the console (with tqdm if installed) for computations with at least 'minimum_total' items."""
+
+    def __init__(self, minimum_total: int = 20000, width: int = 40) -> None:
+        self.minimum_total: int = minimum_total
+        self.width: int = width
+        self._bar = None
+        self._last_processed: int = 0
+        self._is_displayed: bool = False
+
+    def __call__(self, processed: int, total: int, eta: Optional[float]):
+        if total < self.minimum_total:
+            return
+
+        tqdm = _get_tqdm()
+        if tqdm is not None:
+            if self._bar is None or processed == 0:
+                self._bar = tqdm(total=total, leave=False)
+                self._last_processed = 0
+            self._bar.update(processed - self._last_processed)
+            self._last_processed = processed
+            if processed >= total:
+                self._bar.close()
+                self._bar = None
+            return
+
+        filled = self.width * processed // total
+        eta_text = f' ETA {eta:.0f} s' if eta is not None else ''
+        end = '\n' if processed >= total else ''
+        self._is_displayed = (processed < total)
+        sys.stderr.write(f"\r[{'#' * filled}{' ' * (self.width - filled)}] {100 * processed // total:>3} %{eta_text}    {end}")
+        sys.stderr.flush()
+
+    def close(self):
+        """Clear the progress bar if the computation stopped before the end."""
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+        elif self._is_displayed:
+            self._is_displayed = False
+            sys.stderr.write('\n')
+            sys.stderr.flush()
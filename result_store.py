@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # The result store requires the 'numpy' module, the rest of the program works without it
+    np = None
+
+from damage_parameters import DamageParameters
+from permutation_store import PermutationTrie
+from progress import ComputationProgress
+from spell import Spell
+from spell_chain import SpellChains
+from stats import Stats
+
+
+METADATA_FILE = 'metadata.json'
+STORE_VERSION = 1
+# Value of the spells column after the last spell of a chain
+NO_SPELL = 0xFFFF
+# Number of chains written or read at once, so that the memory used does not depend on the number of chains
+CHUNK_SIZE = 1 << 16
+# The spells column has one column per spell of the longest chain of the run (indices in the spells of the run metadata)
+COLUMNS = {'spells': 'uint16', 'length': 'uint8', 'pa': 'uint16', 'min_po': 'int16', 'max_po': 'int16',
+           'average': 'float64', 'min': 'int64', 'max': 'int64', 'crit_min': 'int64', 'crit_max': 'int64'}
+CRITERIA = ('average', 'min', 'max', 'crit_min', 'crit_max')
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError("The 'numpy' package is required to use the result store.")
+
+
+class StoredChain:
+    """Chain read from a result store, with the run it comes from."""
+
+    def __init__(self, run: int, combination: Tuple[str], pa: int, po: Tuple[int, int], average_damages: float, damages: Dict[str, int]) -> None:
+        self.run: int = run
+        self.combination: Tuple[str] = combination
+        self.pa: int = pa
+        # Range at which every spell of the chain can be used
+        self.po: Tuple[int, int] = po
+        self.average_damages: float = average_damages
+        self.damages: Dict[str, int] = damages
+
+    def __repr__(self) -> str:
+        return f'StoredChain(run={self.run}, combination={self.combination}, pa={self.pa}, po={self.po}, average_damages={self.average_damages}, damages={self.damages})'
+
+
+class ResultStore:
+    """Columnar store of computed chains, to query them without computing them again.
+
+    Every run (the chains of a spell set with some stats and parameters) is a directory of NumPy .npy files, one per column and with one row per chain,
+    and the metadata file of the store describes every run (spell set, parameters, stats and spells). The columns are memory-mapped when queried."""
+
+    def __init__(self, directory: str) -> None:
+        _check_numpy()
+        self.directory: str = directory
+        self.runs: List[Dict[str, Any]] = []
+
+        metadata_path = os.path.join(directory, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r', encoding='utf-8') as fi:
+                metadata = json.load(fi)
+            if metadata.get('version') != STORE_VERSION:
+                raise ValueError(f"Result store '{directory}' has version {metadata.get('version')} (expected {STORE_VERSION}).")
+            self.runs = metadata['runs']
+
+    def _save_metadata(self):
+        with open(os.path.join(self.directory, METADATA_FILE), 'w', encoding='utf-8') as fo:
+            json.dump({'version': STORE_VERSION, 'runs': self.runs}, fo, indent=4)
+
+
+    def add_run(self, spell_chain: SpellChains, stats: Stats, parameters: DamageParameters, spell_set: str = None, name: str = None, min_damages: float = None,
+                max_length: int = None, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None) -> int:
+        """Compute every possible chain of the spells and write it as a new run (see write_run), and return the index of the run.
+
+        If max_length is given, the chains of more spells are not computed."""
+        metadata = {'name': name, 'spell_set': spell_set, 'parameters': parameters.to_dict(), 'stats': stats.to_dict()}
+        max_chain_length = len(spell_chain.spells) if max_length is None else min(max_length, len(spell_chain.spells))
+        chains = spell_chain.iter_chains(stats, parameters, cache=cache, progress=progress, max_length=max_length)
+
+        return self.write_run(chains, list({spell.get_short_name(): spell for spell in spell_chain.spells}.values()), max_chain_length, metadata, min_damages=min_damages)
+
+    def write_run(self, chains: Iterable[Tuple[Tuple[str], int, float, Dict[str, int]]], spells: Sequence[Spell], max_chain_length: int, metadata: Dict[str, Any],
+                  min_damages: float = None) -> int:
+        """Write the chains (combination, AP used, average damages and detailed damages, as yielded by SpellChains.iter_chains) as a new run
+        described by the metadata, and return the index of the run. The chains are written by chunks, so they are never all in memory.
+
+        The spells are the spells the chains can use, and max_chain_length the number of spells of the longest possible chain.
+        If min_damages is given, only the chains with at least these average damages are written."""
+        indexes = {spell.get_short_name(): index for index, spell in enumerate(spells)}
+        if len(indexes) >= NO_SPELL:
+            raise ValueError(f'A run can use at most {NO_SPELL - 1} different spells ({len(indexes)} given).')
+        po = [(spell.get_min_po(), spell.get_max_po()) for spell in spells]
+
+        run = len(self.runs)
+        run_directory = f'run_{run}'
+        path = os.path.join(self.directory, run_directory)
+        os.makedirs(path, exist_ok=True)
+
+        try:
+            # The chunks are appended to raw files, converted to .npy files once the number of chains is known
+            raw_files = {column: open(os.path.join(path, f'{column}.raw'), 'wb') for column in COLUMNS}
+            try:
+                count, width = 0, 0
+                chunk: List[Tuple[Tuple[str], int, float, Dict[str, int]]] = []
+                for chain in chains:
+                    if min_damages is not None and chain[2] < min_damages:
+                        continue
+                    chunk.append(chain)
+                    width = max(width, len(chain[0]))
+                    if len(chunk) == CHUNK_SIZE:
+                        self._write_chunk(raw_files, chunk, indexes, po, max_chain_length)
+                        count += len(chunk)
+                        chunk = []
+
+                if chunk:
+                    self._write_chunk(raw_files, chunk, indexes, po, max_chain_length)
+                    count += len(chunk)
+            finally:
+                for raw_file in raw_files.values():
+                    raw_file.close()
+
+            for column, dtype in COLUMNS.items():
+                raw_path = os.path.join(path, f'{column}.raw')
+                shape = (count, width) if column == 'spells' else (count,)
+                array = np.lib.format.open_memmap(os.path.join(path, f'{column}.npy'), mode='w+', dtype=dtype, shape=shape)
+                if count > 0:
+                    raw_shape = (count, max_chain_length) if column == 'spells' else (count,)
+                    raw_array = np.memmap(raw_path, dtype=dtype, mode='r', shape=raw_shape)
+                    for start in range(0, count, CHUNK_SIZE):
+                        array[start:start + CHUNK_SIZE] = raw_array[start:start + CHUNK_SIZE, :width] if column == 'spells' else raw_array[start:start + CHUNK_SIZE]
+                    del raw_array
+                array.flush()
+                del array
+                os.remove(raw_path)
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+
+        self.runs.append({**metadata, 'directory': run_directory, 'spells': list(indexes), 'count': count, 'created': time.time()})
+        self._save_metadata()
+        return run
+
+    def _write_chunk(self, raw_files: Dict[str, Any], chunk: List[Tuple[Tuple[str], int, float, Dict[str, int]]], indexes: Dict[str, int], po: List[Tuple[int, int]],
+                     max_chain_length: int):
+        spells = np.full((len(chunk), max_chain_length), NO_SPELL, dtype=COLUMNS['spells'])
+        min_po, max_po = [], []
+        for row, (combination, _, _, _) in enumerate(chunk):
+            spell_indexes = [indexes[short_name] for short_name in combination]
+            spells[row, :len(spell_indexes)] = spell_indexes
+            min_po.append(max((po[index][0] for index in spell_indexes), default=0))
+            max_po.append(min((po[index][1] for index in spell_indexes), default=0))
+
+        spells.tofile(raw_files['spells'])
+        np.array([len(chain[0]) for chain in chunk], dtype=COLUMNS['length']).tofile(raw_files['length'])
+        np.array([chain[1] for chain in chunk], dtype=COLUMNS['pa']).tofile(raw_files['pa'])
+        np.array(min_po, dtype=COLUMNS['min_po']).tofile(raw_files['min_po'])
+        np.array(max_po, dtype=COLUMNS['max_po']).tofile(raw_files['max_po'])
+        np.array([chain[2] for chain in chunk], dtype=COLUMNS['average']).tofile(raw_files['average'])
+        for column in ('min', 'max', 'crit_min', 'crit_max'):
+            np.array([chain[3][column] for chain in chunk], dtype=COLUMNS[column]).tofile(raw_files[column])
+
+
+    def get_columns(self, run: int) -> Dict[str, Any]:
+        """Return the memory-mapped columns of the run, by name."""
+        path = os.path.join(self.directory, self.runs[run]['directory'])
+        return {column: np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r') for column in COLUMNS}
+
+    def find_runs(self, **values) -> List[int]:
+        """Return the indices of the runs whose metadata, or parameters, have all these values (for example find_runs(spell_set='set', distance='melee'))."""
+        runs = []
+        for run, metadata in enumerate(self.runs):
+            if all((metadata[key] if key in metadata else metadata.get('parameters', {}).get(key)) == value for key, value in values.items()):
+                runs.append(run)
+
+        return runs
+
+    def _iter_chunks(self, spell: Optional[str], po: Optional[int], max_pa: Optional[int], max_length: Optional[int], min_damages: Optional[float],
+                     runs: Optional[Iterable[int]]) -> Iterator[Tuple[int, Dict[str, Any], int, Any]]:
+        """Yield the run, its columns, the first row of the chunk and the mask of the rows of the chunk matching the filters."""
+        for run in (range(len(self.runs)) if runs is None else runs):
+            spells = self.runs[run]['spells']
+            if spell is not None and not spell in spells:
+                continue
+            spell_index = spells.index(spell) if spell is not None else None
+
+            columns = self.get_columns(run)
+            for start in range(0, self.runs[run]['count'], CHUNK_SIZE):
+                end = start + CHUNK_SIZE
+                mask = np.ones(len(columns['pa'][start:end]), dtype=bool)
+                if spell_index is not None:
+                    mask &= (columns['spells'][start:end] == spell_index).any(axis=1)
+                if po is not None:
+                    mask &= (columns['min_po'][start:end] <= po) & (po <= columns['max_po'][start:end])
+                if max_pa is not None:
+                    mask &= columns['pa'][start:end] <= max_pa
+                if max_length is not None:
+                    mask &= columns['length'][start:end] <= max_length
+                if min_damages is not None:
+                    mask &= columns['average'][start:end] >= min_damages
+
+                if mask.any():
+                    yield run, columns, start, mask
+
+    def _get_chain(self, run: int, columns: Dict[str, Any], row: int) -> StoredChain:
+        spells = self.runs[run]['spells']
+        combination = tuple(spells[index] for index in columns['spells'][row][:columns['length'][row]])
+        return StoredChain(run, combination, int(columns['pa'][row]), (int(columns['min_po'][row]), int(columns['max_po'][row])), float(columns['average'][row]),
+                           {column: int(columns[column][row]) for column in ('min', 'max', 'crit_min', 'crit_max')})
+
+    def iter_chains(self, spell: str = None, po: int = None, max_pa: int = None, max_length: int = None, min_damages: float = None,
+                    runs: Iterable[int] = None) -> Iterator[StoredChain]:
+        """Yield the stored chains, of the given runs (or all of them), which use the spell, can be used at the range po, use at most max_pa AP and
+        max_length spells, and deal at least min_damages average damages (every filter is optional)."""
+        for run, columns, start, mask in self._iter_chunks(spell, po, max_pa, max_length, min_damages, runs):
+            for row in np.flatnonzero(mask):
+                yield self._get_chain(run, columns, start + int(row))
+
+    def get_best_chain(self, spell: str = None, po: int = None, max_pa: int = None, max_length: int = None, min_damages: float = None,
+                       runs: Iterable[int] = None, criterion: str = 'average') -> Optional[StoredChain]:
+        """Return the stored chain matching the filters (see iter_chains) with the highest damages according to the criterion (then the shortest one,
+        then the first one), or None if no chain matches them. The criterion is the average damages or one of the detailed damages."""
+        if not criterion in CRITERIA:
+            raise ValueError(f"Criterion should be one of {list(CRITERIA)} ('{criterion}' given instead).")
+
+        best, best_key = None, None
+        for run, columns, start, mask in self._iter_chunks(spell, po, max_pa, max_length, min_damages, runs):
+            rows = np.flatnonzero(mask) + start
+            values = columns[criterion][rows]
+            # Shortest chain among the ones with the highest damages (np.argmin returns the first one)
+            rows = rows[values == values.max()]
+            row = int(rows[np.argmin(columns['length'][rows])])
+            key = (float(columns[criterion][row]), -int(columns['length'][row]))
+            if best_key is None or key > best_key:
+                best, best_key = (run, columns, row), key
+
+        if best is None:
+            return None
+        return self._get_chain(*best)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Return the best chain stored in a result store matching the given filters.')
+    parser.add_argument('directory', help='directory of the result store')
+    parser.add_argument('--spell', help='short name of a spell the chain must use')
+    parser.add_argument('--po', type=int, help='range at which every spell of the chain must be usable')
+    parser.add_argument('--pa', type=int, help='maximum number of AP used by the chain')
+    parser.add_argument('--length', type=int, help='maximum number of spells of the chain')
+    parser.add_argument('--spell-set', help='short name of the spell set of the runs')
+    parser.add_argument('--criterion', default='average', choices=CRITERIA, help='damages to maximize')
+    arguments = parser.parse_args()
+
+    store = ResultStore(arguments.directory)
+    selected_runs = store.find_runs(spell_set=arguments.spell_set) if arguments.spell_set is not None else None
+    best_chain = store.get_best_chain(spell=arguments.spell, po=arguments.po, max_pa=arguments.pa, max_length=arguments.length, runs=selected_runs, criterion=arguments.criterion)
+    if best_chain is None:
+        print('No stored chain matches the filters.')
+    else:
+        run_metadata = store.runs[best_chain.run]
+        print(f"{best_chain.average_damages:.0f} dmg : {best_chain.damages['min']} - {best_chain.damages['max']} ({best_chain.damages['crit_min']} - {best_chain.damages['crit_max']}) "
+              f"using {', '.join(best_chain.combination)} ({best_chain.pa} PA ; PO = {best_chain.po[0]} - {best_chain.po[1]} ; run {best_chain.run} : spell set '{run_metadata['spell_set']}')")
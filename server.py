@@ -0,0 +1,254 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from batch import JOB_MODES, compute_job
+from damage_distribution import get_exact_distribution
+from damage_parameters import DamageParameters
+from manager import Manager
+from single_flight import SingleFlight
+from spell import Spell
+from spell_chain import SpellChains
+
+
+class OptimizationService:
+    """Damages computations on the data of a Manager loaded once, shared by every request.
+
+    The permutations cache of the Manager and a cache of the results (keyed by the computation fingerprint) are shared between the requests,
+    concurrent identical requests wait for the same computation and the computations are done in a process pool if there is more than one worker."""
+
+    def __init__(self, manager: Manager, workers: int = 1, results_cache_size: int = 1024) -> None:
+        self.manager: Manager = manager
+        self.workers: int = workers
+        self.results_cache_size: int = results_cache_size
+        self.results_cache: Dict[str, Dict[str, Any]] = dict()
+        # The Manager (and its cache) is not thread-safe
+        self.lock = threading.Lock()
+        self.single_flight = SingleFlight()
+        self.executor: Optional[ProcessPoolExecutor] = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+    def _prepare_damages_query(self, query: Dict[str, Any]) -> Tuple[str, List[Spell], Any, DamageParameters, str, SpellChains]:
+        mode = query.get('mode', 'dmg')
+        if not mode in JOB_MODES:
+            raise ValueError(f"Mode should be one of {JOB_MODES} ('{mode}' given instead).")
+
+        if not 'spell_set' in query:
+            raise KeyError("Query does not contain a 'spell_set' key.")
+
+        with self.lock:
+            spell_list, total_stats, damages_parameters = self.manager.get_damages_query(query['spell_set'], query.get('parameters', ''), query.get('stats', None))
+
+        spell_chain = SpellChains()
+        for spell in spell_list:
+            spell_chain.add_spell(spell)
+
+        fingerprint = f'{mode}:{spell_chain.get_fingerprint(total_stats, damages_parameters)}'
+
+        return (mode, spell_list, total_stats, damages_parameters, fingerprint, spell_chain)
+
+
+    def _compute_damages(self, mode: str, spell_list: List[Spell], total_stats, damages_parameters: DamageParameters, spell_chain: SpellChains) -> Dict[str, Any]:
+        cache = None
+        permutations_time = 0.0
+        if mode == 'dmg':
+            start = time.perf_counter()
+            with self.lock:
+                cache = spell_chain.get_permutations_cache(damages_parameters, self.manager.cache)
+            permutations_time = time.perf_counter() - start
+
+        if self.executor is not None:
+            result = self.executor.submit(compute_job, mode, spell_list, total_stats, damages_parameters, cache).result()
+        else:
+            result = compute_job(mode, spell_list, total_stats, damages_parameters, cache)
+
+        result['timings'] = {'permutations': permutations_time, **result['timings']}
+
+        return result
+
+
+    def _store_result(self, fingerprint: str, result: Dict[str, Any]):
+        with self.lock:
+            if len(self.results_cache) >= self.results_cache_size:
+                # Remove the oldest result (dictionaries keep the insertion order)
+                del self.results_cache[next(iter(self.results_cache))]
+            self.results_cache[fingerprint] = result
+
+
+    def damages(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Best combination of a spell set, as the 'dmg' (or 'dmgs') command, for a query with a 'spell_set' and optionally 'parameters', 'stats' and 'mode'."""
+        mode, spell_list, total_stats, damages_parameters, fingerprint, spell_chain = self._prepare_damages_query(query)
+
+        with self.lock:
+            cached_result = self.results_cache.get(fingerprint, None)
+
+        if cached_result is not None:
+            return {**cached_result, 'cached': True, 'coalesced': False}
+
+        def compute() -> Dict[str, Any]:
+            # The result may have been stored by a computation which finished after the first check
+            with self.lock:
+                cached_result = self.results_cache.get(fingerprint, None)
+            if cached_result is not None:
+                return cached_result
+
+            result = self._compute_damages(mode, spell_list, total_stats, damages_parameters, spell_chain)
+            self._store_result(fingerprint, result)
+            return result
+
+        result, is_coalesced = self.single_flight.do(fingerprint, compute)
+
+        return {**result, 'cached': False, 'coalesced': is_coalesced}
+
+
+    def combination(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Damages of a combination of spells in the given order, as the 'dmgc' command, for a query with 'spells' and optionally 'parameters' and 'stats'."""
+        if not 'spells' in query or not isinstance(query['spells'], list):
+            raise KeyError("Query does not contain a 'spells' list.")
+
+        with self.lock:
+            spell_list = list()
+            for spell_short_name in query['spells']:
+                if not spell_short_name in self.manager.spells:
+                    raise KeyError(f"Spell '{spell_short_name}' does not exist.")
+                spell_list.append(self.manager.spells[spell_short_name])
+
+            damages_parameters = DamageParameters.from_string(query.get('parameters', ''), self.manager.get_default_parameters())
+            if 'stats' in query:
+                damages_parameters.stats = list(query['stats'])
+            total_stats = damages_parameters.get_total_stats(self.manager.stats)
+
+        spell_chain = SpellChains()
+        for spell in spell_list:
+            spell_chain.add_spell(spell)
+
+        computation_data = spell_chain.get_combination_damages(query['spells'], total_stats, damages_parameters)
+        if computation_data is None:
+            raise ValueError('The spells cannot be used together (incompatible ranges or no spell).')
+
+        result = {
+            'combination': list(computation_data.permutation),
+            'pa': sum(spell.get_pa() for spell in spell_list),
+            'average_damages': computation_data.average_damages,
+            'damages': computation_data.damages
+        }
+
+        if damages_parameters.hp > 0:
+            distribution = get_exact_distribution(spell_chain.get_rolls(computation_data.permutation, total_stats, damages_parameters))
+            result['kill_probability'] = distribution.get_kill_probability(damages_parameters.hp)
+
+        return result
+
+
+    def get_spell_sets(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'spell_sets': {short_name: [spell.get_short_name() for spell in spell_set] for short_name, spell_set in self.manager.spell_sets.items()}}
+
+
+class OptimizationRequestHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP interface of the OptimizationService of the server."""
+
+    POST_ROUTES = {'/damages': 'damages', '/combination': 'combination'}
+    GET_ROUTES = {'/health': None, '/spell_sets': 'get_spell_sets'}
+
+    def _send_json(self, code: int, data: Dict[str, Any]):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, code: int, message: str):
+        self._send_json(code, {'status': 'error', 'error': message})
+
+
+    def do_GET(self):
+        if not self.path in OptimizationRequestHandler.GET_ROUTES:
+            self._send_error_json(404, f"Unknown path '{self.path}'.")
+            return
+
+        method_name = OptimizationRequestHandler.GET_ROUTES[self.path]
+        if method_name is None:
+            self._send_json(200, {'status': 'ok'})
+            return
+
+        self._send_json(200, {'status': 'ok', **getattr(self.server.service, method_name)()})
+
+    def do_POST(self):
+        if not self.path in OptimizationRequestHandler.POST_ROUTES:
+            self._send_error_json(404, f"Unknown path '{self.path}'.")
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode('utf-8')) if length > 0 else {}
+            if not isinstance(query, dict):
+                raise TypeError('The request body should be a JSON object.')
+        except (ValueError, TypeError) as e:
+            self._send_error_json(400, f'Invalid request body: {e}')
+            return
+
+        try:
+            result = getattr(self.server.service, OptimizationRequestHandler.POST_ROUTES[self.path])(query)
+        except (KeyError, ValueError, TypeError) as e:
+            # str() of a KeyError adds quotes around the message
+            self._send_error_json(400, str(e.args[0]) if e.args else str(e))
+            return
+        except Exception as e:
+            self._send_error_json(500, f'Internal error: {type(e).__name__}: {e}')
+            return
+
+        self._send_json(200, {'status': 'ok', **result})
+
+    def log_message(self, format: str, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class OptimizationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: OptimizationService, quiet: bool = False) -> None:
+        super().__init__(address, OptimizationRequestHandler)
+        self.service: OptimizationService = service
+        self.quiet: bool = quiet
+
+    def server_close(self):
+        super().server_close()
+        self.service.close()
+
+
+def create_server(manager: Manager, host: str = '127.0.0.1', port: int = 8000, workers: int = 1, quiet: bool = False) -> OptimizationServer:
+    """Create the server (port 0 chooses a free port, available in server.server_address), use serve_forever() to start it."""
+    return OptimizationServer((host, port), OptimizationService(manager, workers=workers), quiet=quiet)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the damages computations as JSON over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (localhost only by default)')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes')
+    arguments = parser.parse_args()
+
+    server_manager = Manager(lambda code, message: print(f"{'[ERROR] ' if code == 1 else ''}{message}", file=sys.stderr))
+    server = create_server(server_manager, host=arguments.host, port=arguments.port, workers=arguments.workers)
+    print(f'Serving on http://{server.server_address[0]}:{server.server_address[1]}', file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server_manager.save_cache()
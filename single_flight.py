@@ -0,0 +1,53 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key : only the first one executes the function, the others wait for it and receive its result
+    (or its exception). The key is forgotten as soon as the call finishes, so later calls execute the function again."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = dict()
+
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return the result of the function and True if it was computed by another call."""
+        with self._lock:
+            call = self._calls.get(key, None)
+            if call is not None:
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return (call.result, True)
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return (call.result, False)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
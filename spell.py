@@ -1,13 +1,16 @@
 import json
 import os
 import re
-from typing import Dict, List, Literal, Set, Tuple
+import time
+from typing import Dict, List, Literal, Optional, Set, Tuple, Union
 from uuid import uuid1
 
 from characteristics_damages import *
+from computation_statistics import ComputationStatistics
 # from damages import compute_damage
 from damages import compute_damages
 from damage_parameters import DamageParameters
+from states import HUPPERMAGE_ELEMENTS, HUPPERMAGE_MASK, STATES, get_huppermage_buff_transitions
 from stats import Stats
 
 
@@ -17,7 +20,8 @@ class SpellOutput:
         self.damages: Dict[str, int] = {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0}
         self.stats: Dict[str, Stats] = {'__all__': Stats()}
         self.parameters: Dict[str, DamageParameters] = {'__all__': DamageParameters()}
-        self.states: Set[str] = set()
+        # Mask of the states (see states.StateRegistry)
+        self.states: int = 0
         self.average_damage: float = 0.0
         self.average_damage_crit: float = 0.0
 
@@ -67,6 +71,9 @@ class SpellParameters:
 
 class SpellBuff:
     def __init__(self) -> None:
+        # Incremented by every method modifying the buff, so that the compiled spells using it know they need to be compiled again
+        self.version: int = 0
+
         self.trigger_states: Set[str] = set()
         self.forbidden_states: Set[str] = set()
         self.base_damages: List[int] = [0] * CHARACTERISTICS_COUNT
@@ -84,35 +91,76 @@ class SpellBuff:
 
         self.deactivate_damages: bool = False
 
+        # Masks of the states sets above, kept up to date by the methods modifying them
+        self.trigger_mask: int = 0
+        self.forbidden_mask: int = 0
+        self.new_output_mask: int = 0
+        self.removed_output_mask: int = 0
+        # Bits of the Huppermage elements states to apply, in the alphabetical order of the new output states
+        self.huppermage_bits: List[int] = []
+        # (new state, power bonus, vulnerability bonus) for every Huppermage state, see states.get_huppermage_buff_transitions
+        self.huppermage_transitions: Tuple[Tuple[int, int, int], ...] = get_huppermage_buff_transitions(())
+
+
+    def _update_masks(self):
+        self.trigger_mask = STATES.to_mask(self.trigger_states)
+        self.forbidden_mask = STATES.to_mask(self.forbidden_states)
+        self.new_output_mask = STATES.to_mask(self.new_output_states)
+        self.removed_output_mask = STATES.to_mask(self.removed_output_states)
+        # Huppermage state is of the form r"h:\w" or r"h:\d\w" but the eventual digit is not kept
+        self.huppermage_bits = [STATES.get_bit(f'h:{state[-1]}') for state in sorted(self.new_output_states) if state[-1] in HUPPERMAGE_ELEMENTS]
+        self.huppermage_transitions = get_huppermage_buff_transitions(tuple(self.huppermage_bits))
+        self.version += 1
+
+    def __getstate__(self):
+        # Bits positions depend on the registry of the process, so the masks are computed again when unpickled
+        state = self.__dict__.copy()
+        for name in ('trigger_mask', 'forbidden_mask', 'new_output_mask', 'removed_output_mask', 'huppermage_bits', 'huppermage_transitions'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._update_masks()
+
 
     def add_trigger_state(self, state: str):
         self.trigger_states.add(state)
+        self._update_masks()
 
     def add_trigger_states(self, states: Set[str]):
         self.trigger_states.update(states)
+        self._update_masks()
 
     def remove_trigger_state(self, state: str):
         self.trigger_states -= {state,}
+        self._update_masks()
 
     def add_forbidden_state(self, state: str):
         self.forbidden_states.add(state)
+        self._update_masks()
 
     def add_forbidden_states(self, states: Set[str]):
         self.forbidden_states.update(states)
+        self._update_masks()
 
     def remove_forbidden_state(self, state: str):
         self.forbidden_states -= {state,}
+        self._update_masks()
 
     def set_base_damages(self, characteristic: int, base_damages: int):
         self.base_damages[characteristic] = base_damages
+        self.version += 1
 
     def add_additional_damaging_characteristic(self, characteristic: int):
         if not characteristic in self.additional_damaging_characteristics:
             self.additional_damaging_characteristics.append(characteristic)
+            self.version += 1
 
     def remove_additional_damaging_characteristic(self, characteristic: int):
         if characteristic in self.additional_damaging_characteristics:
             self.additional_damaging_characteristics.remove(characteristic)
+            self.version += 1
 
     def has_additional_damaging_characteristic(self, characteristic: int):
         return characteristic in self.additional_damaging_characteristics
@@ -120,33 +168,56 @@ class SpellBuff:
     def add_stats(self, stats: Stats, spell: str = '__all__'):
         self.has_stats = True
         self.stats[spell] = self.stats.get(spell, Stats()) + stats
+        self.version += 1
+
+    def set_stats(self, stats: Stats, spell: str = '__all__'):
+        self.has_stats = True
+        self.stats[spell] = stats
+        self.version += 1
 
     def add_damage_parameters(self, damage_parameters: DamageParameters, spell: str = '__all__'):
         self.has_parameters = True
         self.damage_parameters[spell] = self.damage_parameters.get(spell, DamageParameters()) + damage_parameters
+        self.version += 1
+
+    def set_huppermage_states(self, is_huppermage_states: bool):
+        self.is_huppermage_states = bool(is_huppermage_states)
+        self.version += 1
+
+    def set_deactivate_damages(self, deactivate_damages: bool):
+        self.deactivate_damages = bool(deactivate_damages)
+        self.version += 1
 
     def add_new_output_state(self, state: str):
         self.new_output_states.add(state)
+        self._update_masks()
 
     def add_new_output_states(self, states: Set[str]):
         self.new_output_states.update(states)
+        self._update_masks()
 
     def remove_new_output_state(self, state: str):
         self.new_output_states -= {state,}
+        self._update_masks()
 
     def add_removed_output_state(self, state: str):
         self.removed_output_states.add(state)
+        self._update_masks()
 
     def add_removed_output_states(self, states: Set[str]):
         self.removed_output_states.update(states)
+        self._update_masks()
 
     def remove_removed_output_state(self, state: str):
         self.removed_output_states -= {state,}
+        self._update_masks()
+
+    def trigger(self, states: Union[int, Set[str]]) -> bool:
+        """Return True if every trigger state and no forbidden state is in the states (a mask or a set of names)."""
+        if not isinstance(states, int):
+            states = STATES.to_mask(states)
 
-    def trigger(self, states: Set[str]) -> bool:
-        # Operator '&' is set intersection, so the test returns true if there is no intersection between the sets
-        # It is slightly faster than .intersection
-        return states.issuperset(self.trigger_states) and not (states & self.forbidden_states)
+        return (states & self.trigger_mask) == self.trigger_mask and not (states & self.forbidden_mask)
 
 
     def to_compact_string(self, only_states=False):
@@ -163,7 +234,7 @@ class SpellBuff:
             'base_damages': self.base_damages,
             'additional_damaging_characteristics': self.additional_damaging_characteristics,
             'stats': {spell: stats.to_dict() for spell, stats in self.stats.items()},
-            'damage_parameters': {spell: damage_parameters.to_string() for spell, damage_parameters in self.damage_parameters.items()},
+            'damage_parameters': {spell: damage_parameters.to_dict() for spell, damage_parameters in self.damage_parameters.items()},
             'new_output_states': list(self.new_output_states),
             'removed_output_states': list(self.removed_output_states),
             'is_huppermage_states': self.is_huppermage_states,
@@ -192,7 +263,7 @@ class SpellBuff:
             spell_buff.add_stats(Stats.from_dict(data['stats'][spell]), spell=spell)
 
         for spell in data.get('damage_parameters', []):
-            spell_buff.add_damage_parameters(DamageParameters.from_string(data['damage_parameters'][spell]), spell=spell)
+            spell_buff.add_damage_parameters(DamageParameters.load(data['damage_parameters'][spell]), spell=spell)
 
         for state in data.get('new_output_states', []):
             spell_buff.add_new_output_state(state)
@@ -200,20 +271,83 @@ class SpellBuff:
         for state in data.get('removed_output_states', []):
             spell_buff.add_removed_output_state(state)
 
-        spell_buff.is_huppermage_states = data.get('is_huppermage_states', False)
+        spell_buff.set_huppermage_states(data.get('is_huppermage_states', False))
         spell_buff.has_stats = data.get('has_stats', False)
         spell_buff.has_parameters = data.get('has_parameters', False)
-        spell_buff.deactivate_damages = data.get('deactivate_damages', False)
+        spell_buff.set_deactivate_damages(data.get('deactivate_damages', False))
 
         return spell_buff
 
 
+# Layout of the flat vectors used by the compiled spells : characteristics, damages then bonus crit chance for the stats,
+# vulnerability, resistances then base damages (in the order of DamageParameters) for the parameters
+STATS_VECTOR_LENGTH = CHARACTERISTICS_COUNT + DAMAGES_COUNT + 1
+BONUS_CRIT_CHANCE_INDEX = CHARACTERISTICS_COUNT + DAMAGES_COUNT
+PARAMETERS_VECTOR_LENGTH = 1 + 5 + 5
+RESISTANCES_INDEX = 1
+BASE_DAMAGES_INDEX = 6
+
+
+def stats_to_vector(stats: Stats) -> List[float]:
+    return stats.characteristics + stats.damages + [stats.bonus_crit_chance]
+
+def parameters_to_vector(parameters: DamageParameters) -> List[int]:
+    return [parameters.vulnerability] + parameters.resistances + parameters.base_damages
+
+
+class CompiledBuff:
+    """Buff reduced to the data used by the chain evaluator : states masks and pre-summed stats and parameters vectors by target spell."""
+
+    __slots__ = ('trigger_mask', 'forbidden_mask', 'new_output_mask', 'removed_output_mask', 'is_huppermage_states', 'huppermage_transitions',
+                 'base_damages', 'additional_damaging_characteristics', 'deactivate_damages', 'stats', 'parameters')
+
+    def __init__(self, buff: 'SpellBuff') -> None:
+        self.trigger_mask: int = buff.trigger_mask
+        self.forbidden_mask: int = buff.forbidden_mask
+        self.new_output_mask: int = buff.new_output_mask
+        self.removed_output_mask: int = buff.removed_output_mask
+        self.is_huppermage_states: bool = buff.is_huppermage_states
+        self.huppermage_transitions: Tuple[Tuple[int, int, int], ...] = buff.huppermage_transitions
+
+        # Reordered as the base damages of the parameters (NEUTRAL first), None if there are none
+        base_damages = [0] * 5
+        for characteristic in range(CHARACTERISTICS_COUNT):
+            base_damages[characteristic + 1 if characteristic != 4 else 0] += buff.base_damages[characteristic]
+        self.base_damages: Optional[Tuple[int, ...]] = tuple(base_damages) if any(base_damages) else None
+        self.additional_damaging_characteristics: Tuple[int, ...] = tuple(buff.additional_damaging_characteristics)
+        self.deactivate_damages: bool = buff.deactivate_damages
+
+        self.stats: Tuple[Tuple[str, List[float]], ...] = tuple((spell, stats_to_vector(stats)) for spell, stats in buff.stats.items()) if buff.has_stats else ()
+        self.parameters: Tuple[Tuple[str, List[int]], ...] = tuple((spell, parameters_to_vector(parameters)) for spell, parameters in buff.damage_parameters.items()) if buff.has_parameters else ()
+
+
+class CompiledSpell:
+    """Spell and its buffs reduced to flat tuples, built by Spell.get_compiled() and evaluated by SpellChains."""
+
+    __slots__ = ('short_name', 'crit_chance', 'is_weapon', 'damaging_characteristics', 'base_damages', 'buffs')
+
+    def __init__(self, spell: 'Spell') -> None:
+        self.short_name: str = spell.short_name
+        self.crit_chance: float = spell.parameters.crit_chance
+        self.is_weapon: bool = spell.parameters.is_weapon
+        self.damaging_characteristics: Tuple[int, ...] = tuple(sorted(set(spell.parameters.damaging_characteristics)))
+        # (min, max, crit_min, crit_max) of every characteristic, None if they are not defined
+        self.base_damages: Tuple[Optional[Tuple[int, int, int, int]], ...] = tuple(
+            (base_damages['min'], base_damages['max'], base_damages['crit_min'], base_damages['crit_max']) if len(base_damages) == 4 else None
+            for base_damages in spell.parameters.base_damages
+        )
+        self.buffs: Tuple[CompiledBuff, ...] = tuple(CompiledBuff(buff) for buff in spell.buffs)
+
+
 class Spell():
     def __init__(self, from_scratch=True) -> None:
         self.parameters = SpellParameters()
         self.buffs: List[SpellBuff] = list()
         self.name = ''
         self.short_name = ''
+        self._compiled: Optional[CompiledSpell] = None
+        # Buffs and their version when the spell was compiled
+        self._compiled_buffs: List[Tuple[SpellBuff, int]] = []
 
         if from_scratch:
             for characteristic in range(CHARACTERISTICS_COUNT):
@@ -221,6 +355,26 @@ class Spell():
             self.set_short_name('')
 
 
+    def get_compiled(self) -> CompiledSpell:
+        """Return the compiled form of the spell, compiled again only if the spell or a buff was modified."""
+        buffs = [(buff, buff.version) for buff in self.buffs]
+        if self._compiled is None or buffs != self._compiled_buffs:
+            self._compiled = CompiledSpell(self)
+            self._compiled_buffs = buffs
+
+        return self._compiled
+
+    def invalidate_compiled(self):
+        self._compiled = None
+
+    def __getstate__(self):
+        # The compiled spell contains states masks which depend on the registry of the process
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        state['_compiled_buffs'] = []
+        return state
+
+
     def get_detailed_damages(self, stats: Stats, parameters: DamageParameters, additional_damaging_characteristics: List[int] = None):
         spell_output = SpellOutput()
 
@@ -265,38 +419,34 @@ class Spell():
         return self.get_damages_and_buffs_with_states(stats, damage_parameters, damage_parameters.starting_states)
 
 
-    def get_damages_and_buffs_with_states(self, stats: Stats, damage_parameters: DamageParameters, states: Set[str]) -> SpellOutput:
+    def get_damages_and_buffs_with_states(self, stats: Stats, damage_parameters: DamageParameters, states: Union[int, Set[str]], statistics: ComputationStatistics = None) -> SpellOutput:
+        """Compute the damages of the spell and the effects of its buffs, the states are a mask (or a set of names) and the output states are a mask."""
         output = SpellOutput()
 
+        if statistics is not None:
+            start = time.perf_counter()
+            statistics.increment('buffs_checked', len(self.buffs))
+
+        if not isinstance(states, int):
+            states = STATES.to_mask(states)
+
         computation_parameters = DamageParameters.from_existing(damage_parameters)
         computation_stats = Stats.from_existing(stats)
-        output.states.update(states)
+        output_states = states
         additional_damaging_characteristics = []
         does_compute_damage = True
 
         for buff in self.buffs:
-            if buff.trigger(states):
+            if (states & buff.trigger_mask) == buff.trigger_mask and not (states & buff.forbidden_mask):
+                if statistics is not None:
+                    statistics.increment('buffs_triggered')
+
                 if buff.is_huppermage_states:
-                    # Huppermage state is one of 'h:a', 'h:e', 'h:f', 'h:w' (respectively air, earth, fire and water)
-                    for huppermage_state in sorted(buff.new_output_states):  # sorted() returns a list
-                        huppermage_state = f'h:{huppermage_state[-1]}'  # State is of the form r"h:\w" or r"h:\d\w" but the eventual digit is not kept
-                        current_huppermage_state = next((state for state in output.states if state.startswith('h:')), None)
-                        if current_huppermage_state is None:
-                            output.states.add(huppermage_state)
-                        elif current_huppermage_state != huppermage_state: # If element has already been applied, do nothing
-                            output.states -= {current_huppermage_state,}
-                            # Concatenate the letter after the 'h:' in alphabetical order
-                            if current_huppermage_state < huppermage_state:
-                                combined = f'H:{current_huppermage_state[-1]}{huppermage_state[-1]}'
-                            else:
-                                combined = f'H:{huppermage_state[-1]}{current_huppermage_state[-1]}'
-                            # If the combination has not been seen yet, add 50 power.
-                            # If it is a fire/earth combination, also add 15% vulnerability
-                            if not combined in output.states:
-                                output.states.add(combined)
-                                output.stats['__all__'].damages[POWER] += 50
-                                if combined == 'H:ef':
-                                    output.parameters['__all__'].vulnerability += 15
+                    # Huppermage state is one of 'h:a', 'h:e', 'h:f', 'h:w' (respectively air, earth, fire and water), plus the combinations already done
+                    huppermage_state, power_bonus, vulnerability_bonus = buff.huppermage_transitions[output_states & HUPPERMAGE_MASK]
+                    output_states = (output_states & ~HUPPERMAGE_MASK) | huppermage_state
+                    output.stats['__all__'].damages[POWER] += power_bonus
+                    output.parameters['__all__'].vulnerability += vulnerability_bonus
                 else:
                     computation_parameters.add_base_damages(buff.base_damages)
                     additional_damaging_characteristics.extend(buff.additional_damaging_characteristics)
@@ -310,8 +460,12 @@ class Spell():
                     if buff.has_parameters:
                         output.update_parameters(buff.damage_parameters)
 
-                    output.states -= buff.removed_output_states
-                    output.states.update(buff.new_output_states)
+                    output_states = (output_states & ~buff.removed_output_mask) | buff.new_output_mask
+
+        output.states = output_states
+
+        if statistics is not None:
+            statistics.add_time('buffs', time.perf_counter() - start)
 
         if does_compute_damage:
             simple_output = self.get_detailed_damages(computation_stats, computation_parameters, additional_damaging_characteristics)
@@ -370,6 +524,7 @@ class Spell():
 
     def add_buff(self, buff: SpellBuff):
         self.buffs.append(buff)
+        self.invalidate_compiled()
 
 
     def get_pa(self):
@@ -404,6 +559,7 @@ class Spell():
                 raise TypeError(f"Field '{field}' is not an int ('{base_damages[field]}' of type '{type(base_damages[field])}' given instead).")
 
         self.parameters.base_damages[characteristic] = base_damages
+        self.invalidate_compiled()
 
 
     def add_damaging_characteristic(self, characteristic: int):
@@ -412,6 +568,7 @@ class Spell():
 
         if not characteristic in self.parameters.damaging_characteristics:
             self.parameters.damaging_characteristics.append(characteristic)
+            self.invalidate_compiled()
 
     def remove_damaging_characteristic(self, characteristic: int):
         if not isinstance(characteristic, int) or characteristic >= CHARACTERISTICS_COUNT:
@@ -419,6 +576,7 @@ class Spell():
 
         if characteristic in self.parameters.damaging_characteristics:
             self.parameters.damaging_characteristics.remove(characteristic)
+            self.invalidate_compiled()
 
     def does_damage_in_characteristic(self, characteristic: int):
         if not isinstance(characteristic, int) or characteristic >= CHARACTERISTICS_COUNT:
@@ -438,6 +596,7 @@ class Spell():
             raise ValueError(f"Crit chance should be between 0 and 1 inclusive ('{crit_chance}' given instead).")
 
         self.parameters.crit_chance = float(crit_chance)
+        self.invalidate_compiled()
 
 
     def get_uses_per_target(self):
@@ -469,6 +628,7 @@ class Spell():
             raise TypeError(f"is_weapon is not a bool ('{is_weapon}' of type '{type(is_weapon)}' given instead).")
 
         self.parameters.is_weapon = bool(is_weapon)
+        self.invalidate_compiled()
 
 
     def get_min_po(self):
@@ -521,6 +681,7 @@ class Spell():
             short_name = str(uuid1())
 
         self.short_name = str(short_name)
+        self.invalidate_compiled()
 
 
     def __repr__(self) -> str:
@@ -538,7 +699,10 @@ class Spell():
 
     @classmethod
     def from_json_string(cls, json_string):
-        json_data = json.loads(json_string)
+        return Spell.from_dict(json.loads(json_string))
+
+    @classmethod
+    def from_dict(cls, json_data):
         Spell.check_json_validity(json_data)
 
         spell = Spell(from_scratch=False)
@@ -1,17 +1,170 @@
 from hashlib import sha1
-from typing import Dict, List, Set, Tuple
-
-try:
-    from tqdm import tqdm as progress_bar
-except ImportError:  # If the 'tqdm' module is not installed, define the progress bar as the identity function
-    def progress_bar(iterator, *args, **kwargs): return iterator
+import json
+import math
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
+from characteristics_damages import *
+from computation_statistics import ComputationStatistics
 from damage_parameters import DamageParameters
-from spell import Spell
+from permutation_store import PermutationTrie
+from progress import ComputationProgress
+from spell import BASE_DAMAGES_INDEX, BONUS_CRIT_CHANCE_INDEX, RESISTANCES_INDEX, CompiledSpell, Spell, parameters_to_vector, stats_to_vector
 from spell_set import SpellSet
+from states import HUPPERMAGE_MASK, STATES
 from stats import Stats
 
 
+MIN_PA_CRITERIA = ('average', 'min')
+
+
+def _get_damage_multipliers(stats: List[float], characteristic: int, resistance: int, vulnerability: int, distance: str, is_weapon: bool) -> Tuple[float, float, float, float, float, float]:
+    # Same computation as damages.compute_damages, on the vectors of the compiled spells
+    power = stats[CHARACTERISTICS_COUNT + POWER]
+    if is_weapon:
+        power += stats[CHARACTERISTICS_COUNT + WEAPON_POWER]
+
+    characteristic_multiplier = max(1, 1 + (stats[characteristic] + power) / 100)
+    flat_damages = stats[CHARACTERISTICS_COUNT + BASIC] + stats[CHARACTERISTICS_COUNT + characteristic + 3]
+
+    final_multiplier = 1.0 + stats[CHARACTERISTICS_COUNT + FINAL] / 100
+    if is_weapon:
+        final_multiplier += stats[CHARACTERISTICS_COUNT + WEAPON] / 100
+    else:
+        final_multiplier += stats[CHARACTERISTICS_COUNT + SPELL] / 100
+
+    if distance == 'range':
+        final_multiplier += stats[CHARACTERISTICS_COUNT + RANGE] / 100
+    elif distance == 'melee':
+        final_multiplier += stats[CHARACTERISTICS_COUNT + MELEE] / 100
+
+    resistance_multiplier = max(0, 1.0 - resistance / 100)
+    vulnerability_multiplier = max(0, 1.0 + vulnerability / 100)
+    crit_damages = stats[CHARACTERISTICS_COUNT + CRIT]
+
+    return (characteristic_multiplier, flat_damages, crit_damages, final_multiplier, vulnerability_multiplier, resistance_multiplier)
+
+
+def _compute_damages(base_damages: Tuple[int, int, int, int], stats: List[float], characteristic: int, additional_base_damages: int, resistance: int, vulnerability: int, distance: str, is_weapon: bool) -> List[int]:
+    characteristic_multiplier, flat_damages, crit_damages, final_multiplier, vulnerability_multiplier, resistance_multiplier = _get_damage_multipliers(stats, characteristic, resistance, vulnerability, distance, is_weapon)
+
+    results = []
+    for field, base_damage in enumerate(base_damages):
+        base_damage += additional_base_damages
+        if base_damage <= 0:
+            results.append(0)
+        elif field < 2:
+            results.append(int(int(int(int(base_damage * characteristic_multiplier + flat_damages) * final_multiplier) * vulnerability_multiplier) * resistance_multiplier))
+        else:
+            results.append(int(int(int(int(base_damage * characteristic_multiplier + flat_damages + crit_damages) * final_multiplier) * vulnerability_multiplier) * resistance_multiplier))
+
+    return results
+
+
+def _get_roll_damages(base_damages: Tuple[int, int, int, int], stats: List[float], characteristic: int, additional_base_damages: int, resistance: int, vulnerability: int, distance: str, is_weapon: bool) -> Tuple[List[int], List[int]]:
+    """Return the damages of every base damages roll, from min to max and from crit_min to crit_max (same computation as _compute_damages)."""
+    characteristic_multiplier, flat_damages, crit_damages, final_multiplier, vulnerability_multiplier, resistance_multiplier = _get_damage_multipliers(stats, characteristic, resistance, vulnerability, distance, is_weapon)
+
+    min_damage, max_damage, min_damage_crit, max_damage_crit = (base_damage + additional_base_damages for base_damage in base_damages)
+
+    damages = [int(int(int(int(base_damage * characteristic_multiplier + flat_damages) * final_multiplier) * vulnerability_multiplier) * resistance_multiplier) if base_damage > 0 else 0
+               for base_damage in range(min_damage, max(min_damage, max_damage) + 1)]
+    damages_crit = [int(int(int(int(base_damage * characteristic_multiplier + flat_damages + crit_damages) * final_multiplier) * vulnerability_multiplier) * resistance_multiplier) if base_damage > 0 else 0
+                    for base_damage in range(min_damage_crit, max(min_damage_crit, max_damage_crit) + 1)]
+
+    return (damages, damages_crit)
+
+
+def _evaluate_compiled_spell(compiled_spell: CompiledSpell, stats: List[float], parameters: List[int], distance: str, states: int, statistics: Optional[ComputationStatistics],
+                             rolls: Optional[List[Tuple[List[int], List[int]]]] = None):
+    """Same computation as Spell.get_damages_and_buffs_with_states on a compiled spell.
+
+    Return the damages (min, max, crit_min, crit_max), the average damages without and with crit, the output states mask,
+    and the stats and parameters vectors given by the buffs to the next spells.
+    If a rolls list is given, the damages of every roll (see _get_roll_damages) of each damaging characteristic are appended to it."""
+    if statistics is not None:
+        start = time.perf_counter()
+        statistics.increment('buffs_checked', len(compiled_spell.buffs))
+
+    output_states = states
+    output_stats: Dict[str, List[float]] = {}
+    output_parameters: Dict[str, List[int]] = {}
+    base_damages = parameters[BASE_DAMAGES_INDEX:]
+    characteristics = compiled_spell.damaging_characteristics
+    does_compute_damage = True
+
+    for buff in compiled_spell.buffs:
+        if (states & buff.trigger_mask) != buff.trigger_mask or states & buff.forbidden_mask:
+            continue
+
+        if statistics is not None:
+            statistics.increment('buffs_triggered')
+
+        if buff.is_huppermage_states:
+            huppermage_state, power_bonus, vulnerability_bonus = buff.huppermage_transitions[output_states & HUPPERMAGE_MASK]
+            output_states = (output_states & ~HUPPERMAGE_MASK) | huppermage_state
+            if power_bonus:
+                power_vector = [0] * len(stats)
+                power_vector[CHARACTERISTICS_COUNT + POWER] = power_bonus
+                output_stats['__all__'] = [value + buff_value for value, buff_value in zip(output_stats['__all__'], power_vector)] if '__all__' in output_stats else power_vector
+            if vulnerability_bonus:
+                vulnerability_vector = [0] * len(parameters)
+                vulnerability_vector[0] = vulnerability_bonus
+                output_parameters['__all__'] = [value + buff_value for value, buff_value in zip(output_parameters['__all__'], vulnerability_vector)] if '__all__' in output_parameters else vulnerability_vector
+            continue
+
+        if buff.base_damages is not None:
+            base_damages = [value + buff_value for value, buff_value in zip(base_damages, buff.base_damages)]
+        if buff.additional_damaging_characteristics:
+            characteristics = tuple(sorted(set(characteristics + buff.additional_damaging_characteristics)))
+        if buff.deactivate_damages:
+            does_compute_damage = False
+
+        for name, vector in buff.stats:
+            output_stats[name] = [value + buff_value for value, buff_value in zip(output_stats[name], vector)] if name in output_stats else vector
+        for name, vector in buff.parameters:
+            output_parameters[name] = [value + buff_value for value, buff_value in zip(output_parameters[name], vector)] if name in output_parameters else vector
+
+        output_states = (output_states & ~buff.removed_output_mask) | buff.new_output_mask
+
+    if statistics is not None:
+        statistics.add_time('buffs', time.perf_counter() - start)
+
+    damages = [0, 0, 0, 0]
+    average_damage = 0.0
+    average_damage_crit = 0.0
+
+    if does_compute_damage:
+        vulnerability = parameters[0]
+        for characteristic in characteristics:
+            spell_base_damages = compiled_spell.base_damages[characteristic]
+            if spell_base_damages is None:
+                raise ValueError(f"Spell '{compiled_spell.short_name}' has no base damages for the characteristic {CHARACTERISTICS_NAMES[characteristic]} it damages with.")
+
+            parameters_index = characteristic + 1 if characteristic != 4 else 0
+            min_damage, max_damage, min_damage_crit, max_damage_crit = _compute_damages(spell_base_damages, stats, characteristic, base_damages[parameters_index],
+                                                                                        parameters[RESISTANCES_INDEX + parameters_index], vulnerability, distance, compiled_spell.is_weapon)
+
+            # If the spell cannot do a critical strike, the crit damages are set to the normal damages
+            if compiled_spell.crit_chance <= 0:
+                min_damage_crit = min_damage
+                max_damage_crit = max_damage
+
+            if rolls is not None:
+                roll_damages, roll_damages_crit = _get_roll_damages(spell_base_damages, stats, characteristic, base_damages[parameters_index],
+                                                                    parameters[RESISTANCES_INDEX + parameters_index], vulnerability, distance, compiled_spell.is_weapon)
+                rolls.append((roll_damages, roll_damages if compiled_spell.crit_chance <= 0 else roll_damages_crit))
+
+            average_damage += (min_damage + max_damage) / 2
+            average_damage_crit += (min_damage_crit + max_damage_crit) / 2
+            damages[0] += min_damage
+            damages[1] += max_damage
+            damages[2] += min_damage_crit
+            damages[3] += max_damage_crit
+
+    return (damages, average_damage, average_damage_crit, output_states, output_stats, output_parameters)
+
+
 class ComputationData:
 
     def __init__(self) -> None:
@@ -19,15 +172,45 @@ class ComputationData:
         self.already_computed_count: int = 0
         self.damages: Dict[str, int] = {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0}
         self.average_damages: float = 0.0
-        self.stats: Dict[str, Stats] = {'__all__': Stats()}
-        self.parameters: Dict[str, DamageParameters] = {'__all__': DamageParameters()}
-        self.states: Set[str] = set()
+        # Lowest and highest possible damages, whichever spells are critical strikes
+        self.lowest_damages: int = 0
+        self.highest_damages: int = 0
+        # Stats and parameters buffs (as vectors, see spell.stats_to_vector) by target spell, '__all__' being every spell
+        self.stats: Dict[str, List[float]] = {}
+        self.parameters: Dict[str, List[int]] = {}
+        # Mask of the states (see states.StateRegistry)
+        self.states: int = 0
 
 
-class SpellChains:
+class SpellRolls:
+    """Damages of every possible roll of one spell of a combination, once the buffs of the previous spells are applied."""
+
+    def __init__(self, short_name: str, crit_chance: float, lines: List[Tuple[List[int], List[int]]]) -> None:
+        self.short_name: str = short_name
+        # Final crit chance of the spell (with the bonus crit chance of the stats), between 0 and 1
+        self.crit_chance: float = crit_chance
+        # For each damaging characteristic, the damages of every base damages roll (all equally likely), without and with crit
+        self.lines: List[Tuple[List[int], List[int]]] = lines
+
+
+class AnytimeResult:
+
     def __init__(self) -> None:
+        self.combination: Tuple[str] = ()
+        self.average_damages: float = 0.0
+        self.damages: Dict[str, int] = {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0}
+        # True if the whole search space was explored (or pruned) before the time budget expired
+        self.is_optimal: bool = False
+        self.explored_count: int = 0
+        self.elapsed_time: float = 0.0
+
+
+class SpellChains:
+    def __init__(self, statistics: ComputationStatistics = None) -> None:
         self.spells: List[Spell] = list()
         self.indexes: Dict[str, int] = dict()
+        # If not None, the computations update its counters and timings
+        self.statistics: Optional[ComputationStatistics] = statistics
 
 
     def add_spell(self, spell: Spell):
@@ -35,37 +218,55 @@ class SpellChains:
         self.spells.append(spell)
 
 
-    def _get_permutations(self, parameters: DamageParameters) -> List[int]:
-        """Generate a list of list containing the indices of the spells."""
+    def _iter_permutations_by_pa(self, parameters: DamageParameters) -> Iterator[Tuple[int, List[Tuple[int, ...]]]]:
+        """Yield, for every AP count from 0 to parameters.pa, the permutations using exactly this AP count (tuples of indices of the spells).
+
+        Only one permutation is built for each sequence of short names: the instances of a "spell family" (identical spell present multiple times)
+        are always used in increasing order, which is checked with the bitmask of the instances used by the permutation."""
         max_used_pa = parameters.pa
 
-        # Associate a unique integer by "spell family" (indentical spell present multiple times)
-        spells_short_names_unique_id = {short_name: k for k, short_name in enumerate(set([spell.get_short_name() for spell in self.spells]))}
+        # Bitmask of the instances of the same family before each spell
+        previous_instances_masks = []
+        families_masks: Dict[str, int] = {}
+        for spell_index, spell in enumerate(self.spells):
+            previous_instances_masks.append(families_masks.get(spell.get_short_name(), 0))
+            families_masks[spell.get_short_name()] = previous_instances_masks[-1] | (1 << spell_index)
 
-        spells = [(i, spell.get_pa(), spells_short_names_unique_id[spell.get_short_name()]) for i, spell in enumerate(self.spells)] # Assign a unique index for each spell (so the algorithm works on integers)
+        spells = [(i, spell.get_pa(), previous_instances_masks[i]) for i, spell in enumerate(self.spells)] # Assign a unique index for each spell (so the algorithm works on integers)
+
+        statistics = self.statistics
+
+        all_permutations = {0: [tuple()]}
+        all_masks = {0: [0]}
+        yield 0, all_permutations[0]
 
-        all_permutations = {0: [[]]}
         for pa in range(1, max_used_pa + 1):
             pa_permutations = []
-            for spell_index, spell_pa, _ in spells:
+            pa_masks = []
+            for spell_index, spell_pa, previous_instances_mask in spells:
                 if pa >= spell_pa:
-                    previous_permutations = all_permutations[pa - spell_pa]
-                    pa_permutations.extend(permutation + [spell_index] for permutation in previous_permutations if spell_index not in permutation)
+                    spell_mask = 1 << spell_index
+                    # The spell can be added if it is not used yet, and all the previous instances of its family are
+                    checked_mask = previous_instances_mask | spell_mask
+                    for permutation, mask in zip(all_permutations[pa - spell_pa], all_masks[pa - spell_pa]):
+                        if mask & checked_mask == previous_instances_mask:
+                            pa_permutations.append(permutation + (spell_index,))
+                            pa_masks.append(mask | spell_mask)
 
-            all_permutations[pa] = []
-            permutations_already_seen = set()
-            # Remove "identical" permutation : permutation where the same spell is present at the same index but it is not the same instance
-            for permutation in pa_permutations:
-                unique_permutation_tuple = tuple(spells[spell_index][2] for spell_index in permutation)
-                if not unique_permutation_tuple in permutations_already_seen:
-                    permutations_already_seen.add(unique_permutation_tuple)
-                    all_permutations[pa].append(permutation)
+            all_permutations[pa] = pa_permutations
+            all_masks[pa] = pa_masks
 
-            # all_permutations[pa] = pa_permutations
+            if statistics is not None:
+                statistics.increment('permutations_generated', len(pa_permutations))
 
+            yield pa, pa_permutations
+
+
+    def _get_permutations(self, parameters: DamageParameters) -> List[Tuple[int, ...]]:
+        """Generate a list of tuples containing the indices of the spells."""
         all_permutations_list = list()
-        for pa in all_permutations:
-            all_permutations_list.extend(all_permutations[pa])
+        for _, pa_permutations in self._iter_permutations_by_pa(parameters):
+            all_permutations_list.extend(pa_permutations)
 
         return all_permutations_list
 
@@ -74,54 +275,114 @@ class SpellChains:
         return sha1(str(sorted(spell.short_name for spell in self.spells) + [parameters.pa]).encode('ascii')).hexdigest()
 
 
+    def get_permutations_cache(self, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None) -> Dict[str, PermutationTrie]:
+        """Return a cache holding only the permutations of the computations with these parameters, taken from the given cache (or computed and added to it).
+
+        It can be given to the computations of another process instead of the whole cache."""
+        if cache is None:
+            cache = {}
+
+        return {self._get_computation_hash(parameters): self._get_unique_permutations(parameters, cache)}
+
+
+    def get_fingerprint(self, stats: Stats, parameters: DamageParameters) -> str:
+        """Return a hash identifying the result of a computation: two computations with the same fingerprint give the same damages."""
+        stats_data = [stats.characteristics, stats.damages, stats.bonus_crit_chance]
+        parameters_data = [parameters.pa, list(parameters.po), parameters.type, parameters.resistances, parameters.distance, parameters.vulnerability, parameters.base_damages, sorted(parameters.starting_states), parameters.position]
+        spells_data = [spell.to_dict() for spell in self.spells]
+
+        return sha1(json.dumps([spells_data, stats_data, parameters_data], sort_keys=True).encode('utf-8')).hexdigest()
+
+
     def _is_combination_possible(self, spells: List[Spell]) -> bool:
         # First member is the minimum of the maximum range of the spells, and inversely for the second member
         return min(spell.parameters.po[1] for spell in spells) >= max(spell.parameters.po[0] for spell in spells)
 
 
-    def _get_detailed_damages_of_permutation(self, permutation: List[int], stats: Stats, parameters: DamageParameters, previous_data: ComputationData = None) -> ComputationData: #Tuple[Dict[str, int], float]:
+    def _get_detailed_damages_of_permutation(self, permutation: List[int], stats: Stats, parameters: DamageParameters, previous_data: ComputationData = None, rolls: List[SpellRolls] = None) -> ComputationData: #Tuple[Dict[str, int], float]:
+        """Return the computation data of the permutation (None if the spells cannot be used together).
+
+        If a rolls list is given, the rolls of every computed spell (not the ones of the previous data) are appended to it."""
+        statistics = self.statistics
         spells = [self.spells[index] for index in permutation] # Convert the list of indices into a list of spells
 
-        if not self._is_combination_possible(spells):
-            return None
+        if statistics is None:
+            if not self._is_combination_possible(spells):
+                return None
+        else:
+            start = time.perf_counter()
+            is_combination_possible = self._is_combination_possible(spells)
+            statistics.add_time('range_filter', time.perf_counter() - start)
+            if not is_combination_possible:
+                statistics.increment('permutations_pruned')
+                return None
+
+            statistics.increment('permutations_evaluated')
+            statistics.increment('spells_evaluated', len(spells) - (previous_data.already_computed_count if previous_data is not None else 0))
+            if previous_data is not None:
+                statistics.increment('prefix_reuse_hits')
+                statistics.increment('spells_reused', previous_data.already_computed_count)
 
         if previous_data is None:
             previous_data = ComputationData()
-            previous_data.states = set(parameters.starting_states)
+            previous_data.states = STATES.to_mask(parameters.starting_states)
 
         damages: Dict[str, int] = previous_data.damages.copy()
         average_damages = previous_data.average_damages
-        stats_buff: Dict[str, Stats] = {name: stats for name, stats in previous_data.stats.items()}
-        parameters_buff: Dict[str, DamageParameters] = {name: parameters for name, parameters in previous_data.parameters.items()}
-        current_states: Set[str] = set(previous_data.states)
-
-        for index, spell in enumerate(spells[previous_data.already_computed_count:], start=previous_data.already_computed_count):
-            spell_stats = stats + stats_buff['__all__'] + stats_buff.get(spell.short_name, Stats())
-            spell_parameters = parameters + parameters_buff['__all__'] + parameters_buff.get(spell.short_name, DamageParameters())
-            spell_output = spell.get_damages_and_buffs_with_states(spell_stats, spell_parameters, current_states)
-
-            final_crit_chance = spell.parameters.crit_chance + spell_stats.bonus_crit_chance
+        lowest_damages = previous_data.lowest_damages
+        highest_damages = previous_data.highest_damages
+        # The vectors are never modified in place, so they can be shared with the previous data
+        stats_buff: Dict[str, List[float]] = previous_data.stats.copy()
+        parameters_buff: Dict[str, List[int]] = previous_data.parameters.copy()
+        current_states: int = previous_data.states
+
+        stats_vector = stats_to_vector(stats)
+        parameters_vector = parameters_to_vector(parameters)
+        distance = parameters.distance
+
+        for spell in spells[previous_data.already_computed_count:]:
+            compiled_spell = spell.get_compiled()
+
+            spell_stats = stats_vector
+            spell_parameters = parameters_vector
+            for name in ('__all__', compiled_spell.short_name):
+                if name in stats_buff:
+                    spell_stats = [value + buff_value for value, buff_value in zip(spell_stats, stats_buff[name])]
+                if name in parameters_buff:
+                    spell_parameters = [value + buff_value for value, buff_value in zip(spell_parameters, parameters_buff[name])]
+
+            spell_lines = [] if rolls is not None else None
+            spell_damages, average_damage, average_damage_crit, current_states, output_stats, output_parameters = _evaluate_compiled_spell(compiled_spell, spell_stats, spell_parameters, distance, current_states, statistics, spell_lines)
+
+            final_crit_chance = compiled_spell.crit_chance + spell_stats[BONUS_CRIT_CHANCE_INDEX]
             if final_crit_chance > 1.0:
                 final_crit_chance = 1.0
 
-            current_states = spell_output.states
+            if rolls is not None:
+                rolls.append(SpellRolls(compiled_spell.short_name, max(0.0, final_crit_chance), spell_lines))
 
-            for name in spell_output.stats:
-                stats_buff[name] = stats_buff.get(name, Stats()) + spell_output.stats[name]
+            for name, vector in output_stats.items():
+                stats_buff[name] = [value + buff_value for value, buff_value in zip(stats_buff[name], vector)] if name in stats_buff else vector
 
-            for name in spell_output.parameters:
-                parameters_buff[name] = parameters_buff.get(name, DamageParameters()) + spell_output.parameters[name]
+            for name, vector in output_parameters.items():
+                parameters_buff[name] = [value + buff_value for value, buff_value in zip(parameters_buff[name], vector)] if name in parameters_buff else vector
 
-            for field in damages:
-                damages[field] += spell_output.damages[field]
+            damages['min'] += spell_damages[0]
+            damages['max'] += spell_damages[1]
+            damages['crit_min'] += spell_damages[2]
+            damages['crit_max'] += spell_damages[3]
+            lowest_damages += min(spell_damages[0], spell_damages[2])
+            highest_damages += max(spell_damages[1], spell_damages[3])
 
-            average_damages += (1 - final_crit_chance) * spell_output.average_damage + final_crit_chance * spell_output.average_damage_crit
+            average_damages += (1 - final_crit_chance) * average_damage + final_crit_chance * average_damage_crit
 
         computation_data = ComputationData()
         computation_data.permutation = tuple(self.spells[index].short_name for index in permutation)
         computation_data.already_computed_count = len(permutation)
         computation_data.average_damages = average_damages
         computation_data.damages = damages
+        computation_data.lowest_damages = lowest_damages
+        computation_data.highest_damages = highest_damages
         computation_data.stats = stats_buff
         computation_data.parameters = parameters_buff
         computation_data.states = current_states
@@ -129,47 +390,394 @@ class SpellChains:
         return computation_data
 
 
-    def get_detailed_damages(self, stats: Stats, parameters: DamageParameters, cache: Dict[int, List[Tuple[int, ...]]] = None) -> Dict[Tuple[str], Tuple[float, Dict[str, int]]]:
-        if cache is None:
-            cache = {}
+    def get_combination_damages(self, combination: Sequence[str], stats: Stats, parameters: DamageParameters) -> Optional[ComputationData]:
+        """Return the damages of the combination (short names of added spells, in this order), or None if there is no spell or they cannot be used together."""
+        if len(combination) == 0:
+            return None
+
+        return self._get_detailed_damages_of_permutation([self.indexes[short_name] for short_name in combination], stats, parameters)
+
 
+    def get_rolls(self, combination: Sequence[str], stats: Stats, parameters: DamageParameters) -> Optional[List[SpellRolls]]:
+        """Return the rolls of every spell of the combination (short names of added spells, in this order), or None if the spells cannot be used together."""
+        rolls: List[SpellRolls] = []
+        if len(combination) == 0:
+            return rolls
+
+        if self._get_detailed_damages_of_permutation([self.indexes[short_name] for short_name in combination], stats, parameters, rolls=rolls) is None:
+            return None
+
+        return rolls
+
+
+    def _get_unique_permutations(self, parameters: DamageParameters, cache: Dict[str, PermutationTrie]) -> PermutationTrie:
+        statistics = self.statistics
         computation_hash = self._get_computation_hash(parameters)
 
         if not computation_hash in cache:
+            if statistics is not None:
+                statistics.increment('cache_misses')
+                start = time.perf_counter()
+
             permutations = self._get_permutations(parameters)
-            
-            # If the same spell can be used multiple times, there may be multiple "identical" permutations as they do not have the same index
-            # Example, if self.spells = ["s1", "s2", "s2"] (and there are enough AP), the permutations will have both [0, 1, 2] and [0, 2, 1] which are really the same
-            # So we remove them based on the spells short names
-            unique_permutations = set()
-            for permutation in permutations:
-                unique_permutations.add(tuple(self.spells[index].short_name for index in permutation))
+
+            if statistics is not None:
+                statistics.add_time('permutations', time.perf_counter() - start)
+                start = time.perf_counter()
+
+            # The permutations are already unique by short names: they are sorted by short names so that the ones sharing a prefix are next to each other, after their prefix
+            unique_permutations = [tuple(self.spells[index].short_name for index in permutation) for permutation in permutations]
 
             # The permutations is then once again transformed into indices
-            unique_permutations = [tuple(self.indexes[short_name] for short_name in permutation) for permutation in sorted(unique_permutations)]
+            unique_permutations = PermutationTrie(tuple(self.indexes[short_name] for short_name in permutation) for permutation in sorted(unique_permutations))
             cache[computation_hash] = unique_permutations
+
+            if statistics is not None:
+                statistics.add_time('trie', time.perf_counter() - start)
         else:
             unique_permutations = cache[computation_hash]
 
-        previous_computation_data: Dict[int, ComputationData] = {}
-        permutations_iterator = progress_bar(enumerate(unique_permutations), total=len(unique_permutations), leave=False) if len(unique_permutations) > 20000 else enumerate(unique_permutations)
-
-        damages = dict()
-        for index, permutation in permutations_iterator:
-            permutation_length = len(permutation)
-            if permutation_length == 0:
-                continue
+            if statistics is not None:
+                statistics.increment('cache_hits')
+
+        return unique_permutations
+
+
+    def _iter_detailed_damages(self, stats: Stats, parameters: DamageParameters, unique_permutations: PermutationTrie, progress: ComputationProgress = None,
+                               max_length: int = None) -> Iterator[Tuple[int, ComputationData]]:
+        """Yield the index and the computation data of every possible permutation, walking the trie depth-first so that every prefix is computed once.
+
+        If a progress is given, it is updated regularly and the iteration stops early if it is cancelled (or if the user presses Ctrl+C).
+        If max_length is given, the longer permutations are not computed."""
+        # Spell indices and computation data of the current node and its ancestors, by depth - 1
+        path: List[int] = []
+        path_data: List[ComputationData] = []
+        # Depth of a node which is not possible: its subtree is skipped, as none of its permutations is possible either
+        skipped_depth = None
+        # The empty permutation is not yielded but keeps its index
+        index = unique_permutations.terminals[0]
+
+        if progress is not None:
+            progress.start(len(unique_permutations))
+            update_interval = progress.update_interval
+
+        try:
+            for spell_index, depth, terminal in unique_permutations.iter_nodes():
+                if skipped_depth is not None:
+                    if depth > skipped_depth:
+                        index += terminal
+                        continue
+                    skipped_depth = None
+
+                if max_length is not None and depth > max_length:
+                    index += terminal
+                    continue
+
+                if progress is not None and terminal and index % update_interval == 0 and progress.update(index):
+                    return
+
+                del path[depth - 1:]
+                del path_data[depth - 1:]
+                path.append(spell_index)
+
+                computation_data = self._get_detailed_damages_of_permutation(path, stats, parameters, previous_data=path_data[-1] if depth > 1 else None)
+                if computation_data is None:
+                    skipped_depth = depth
+                    index += terminal
+                    continue
+
+                path_data.append(computation_data)
+                if terminal:
+                    yield index, computation_data
+                    index += 1
+        except KeyboardInterrupt:
+            if progress is None:
+                raise
+            progress.cancel('interrupted')
+            return
+
+        if progress is not None:
+            progress.finish()
+
+
+    def get_detailed_damages(self, stats: Stats, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None) -> Dict[Tuple[str], Tuple[float, Dict[str, int]]]:
+        """Return the damages of every possible combination, sorted by decreasing average damages.
+
+        If the computation is cancelled through the progress, only the combinations computed so far are returned (and progress.cancelled is True)."""
+        if cache is None:
+            cache = {}
 
-            previous_data = previous_computation_data[permutation_length - 1] if permutation_length > 1 else None
+        statistics = self.statistics
+        unique_permutations = self._get_unique_permutations(parameters, cache)
 
-            computation_data = self._get_detailed_damages_of_permutation(permutation, stats, parameters, previous_data=previous_data)
-            if computation_data is None:
-                continue
+        if statistics is not None:
+            start = time.perf_counter()
 
+        damages = dict()
+        for index, computation_data in self._iter_detailed_damages(stats, parameters, unique_permutations, progress=progress):
             damages[index] = (computation_data.average_damages, computation_data.damages.copy())
-            previous_computation_data[len(permutation)] = computation_data
+
+        if statistics is not None:
+            statistics.add_time('evaluation', time.perf_counter() - start)
+            start = time.perf_counter()
 
         # Sort first by damages decreasing, then by permutation length increase
-        damages = {tuple(self.spells[index].short_name for index in unique_permutations[key]): value for key, value in sorted(damages.items(), key=lambda key_value: (key_value[1][0], -len(unique_permutations[key_value[0]])), reverse=True)}
+        damages = {tuple(self.spells[index].short_name for index in unique_permutations[key]): value for key, value in sorted(damages.items(), key=lambda key_value: (key_value[1][0], -unique_permutations.get_length(key_value[0])), reverse=True)}
+
+        if statistics is not None:
+            statistics.add_time('sort', time.perf_counter() - start)
 
         return damages
+
+
+    def iter_detailed_damages(self, stats: Stats, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None,
+                              max_length: int = None) -> Iterator[ComputationData]:
+        """Yield the computation data (combination in its 'permutation', average, detailed and extreme damages) of every possible combination as soon as
+        it is computed, in the order of the enumeration (not sorted), without keeping them in memory.
+
+        If max_length is given, the combinations of more spells are not computed."""
+        if cache is None:
+            cache = {}
+
+        unique_permutations = self._get_unique_permutations(parameters, cache)
+        for _, computation_data in self._iter_detailed_damages(stats, parameters, unique_permutations, progress=progress, max_length=max_length):
+            yield computation_data
+
+    def iter_chains(self, stats: Stats, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None,
+                    max_length: int = None) -> Iterator[Tuple[Tuple[str], int, float, Dict[str, int]]]:
+        """Yield the combination, the AP used, the average damages and the detailed damages of every possible combination, as iter_detailed_damages."""
+        for computation_data in self.iter_detailed_damages(stats, parameters, cache=cache, progress=progress, max_length=max_length):
+            combination = computation_data.permutation
+            used_pa = sum(self.spells[self.indexes[short_name]].get_pa() for short_name in combination)
+            yield (combination, used_pa, computation_data.average_damages, computation_data.damages.copy())
+
+
+    def get_best_damages_by_pa(self, stats: Stats, parameters: DamageParameters, cache: Dict[str, PermutationTrie] = None, progress: ComputationProgress = None) -> Dict[int, Optional[Tuple[Tuple[str], float, Dict[str, int]]]]:
+        """Return, for every AP budget from 1 to parameters.pa, the best combination using at most this budget (or None if no spell can be used).
+
+        Every permutation is evaluated only once, as the enumeration for parameters.pa already contains every lower AP level."""
+        if cache is None:
+            cache = {}
+
+        statistics = self.statistics
+        unique_permutations = self._get_unique_permutations(parameters, cache)
+
+        if statistics is not None:
+            start = time.perf_counter()
+
+        # Best (average damages, -length, index, damages) for each exact AP count
+        best_by_exact_pa: Dict[int, Tuple[float, int, int, Dict[str, int]]] = {}
+        for index, computation_data in self._iter_detailed_damages(stats, parameters, unique_permutations, progress=progress):
+            permutation = unique_permutations[index]
+            used_pa = sum(self.spells[spell_index].get_pa() for spell_index in permutation)
+            key = (computation_data.average_damages, -len(permutation))
+            # Strict comparison so that, as in get_detailed_damages, the first permutation found is kept in case of a tie
+            if not used_pa in best_by_exact_pa or key > best_by_exact_pa[used_pa][:2]:
+                best_by_exact_pa[used_pa] = (*key, index, computation_data.damages.copy())
+
+        if statistics is not None:
+            statistics.add_time('evaluation', time.perf_counter() - start)
+
+        best_by_pa = dict()
+        best = None
+        for pa in range(1, parameters.pa + 1):
+            if pa in best_by_exact_pa and (best is None or best_by_exact_pa[pa][:2] > best[:2]):
+                best = best_by_exact_pa[pa]
+
+            if best is None:
+                best_by_pa[pa] = None
+            else:
+                average_damages, _, index, damages = best
+                best_by_pa[pa] = (tuple(self.spells[spell_index].short_name for spell_index in unique_permutations[index]), average_damages, damages)
+
+        return best_by_pa
+
+
+    def get_min_pa_combination(self, stats: Stats, parameters: DamageParameters, threshold: float, criterion: str = 'average') -> Optional[Tuple[Tuple[str], int, float, Dict[str, int]]]:
+        """Return the combination using the fewest AP (then with the highest average damages, then the shortest) whose damages reach the threshold,
+        with its AP count, average damages and detailed damages, or None if no combination using at most parameters.pa AP reaches it.
+
+        The criterion is either 'average' (average damages) or 'min' (lowest possible damages, whichever spells are critical strikes). The AP counts are searched in increasing order
+        and the search stops at the first one with a combination reaching the threshold."""
+        if not criterion in MIN_PA_CRITERIA:
+            raise ValueError(f"Criterion should be one of {MIN_PA_CRITERIA} ('{criterion}' given instead).")
+
+        statistics = self.statistics
+        if statistics is not None:
+            start = time.perf_counter()
+
+        # Computation data of the evaluated permutations (by short names), to reuse them as prefixes
+        computed_data: Dict[Tuple[str], ComputationData] = {}
+        best = None
+
+        for pa, pa_permutations in self._iter_permutations_by_pa(parameters):
+            if pa == 0:
+                continue
+
+            for permutation in pa_permutations:
+                short_names = tuple(self.spells[index].short_name for index in permutation)
+
+                # The prefix uses fewer AP so it was already computed, unless the spells cannot be used together
+                previous_data = None
+                if len(permutation) > 1:
+                    previous_data = computed_data.get(short_names[:-1], None)
+                    if previous_data is None:
+                        continue
+
+                computation_data = self._get_detailed_damages_of_permutation(permutation, stats, parameters, previous_data=previous_data)
+                if computation_data is None:
+                    continue
+                computed_data[short_names] = computation_data
+
+                if criterion == 'average':
+                    damages = computation_data.average_damages
+                else:
+                    damages = computation_data.lowest_damages
+
+                key = (computation_data.average_damages, -len(permutation))
+                if damages >= threshold and (best is None or key > best[:2]):
+                    best = (*key, short_names, computation_data.damages.copy())
+
+            if best is not None:
+                if statistics is not None:
+                    statistics.add_time('evaluation', time.perf_counter() - start)
+                average_damages, _, short_names, damages = best
+                return (short_names, pa, average_damages, damages)
+
+        if statistics is not None:
+            statistics.add_time('evaluation', time.perf_counter() - start)
+
+        return None
+
+
+    def _get_families(self) -> List[Tuple[int, int]]:
+        """Return the index of one instance and the instances count of every spell family (identical spells present multiple times)."""
+        counts: Dict[str, int] = {}
+        for spell in self.spells:
+            counts[spell.short_name] = counts.get(spell.short_name, 0) + 1
+
+        return [(self.indexes[short_name], count) for short_name, count in counts.items()]
+
+
+    def _get_upper_bound_function(self, stats: Stats, parameters: DamageParameters, families: List[Tuple[int, int]]):
+        """Return a function giving an upper bound of the damages that can be added with the remaining AP and spells, or None if no bound can be computed.
+
+        Without any buff, the damages of a spell do not depend on the previous ones, so the fractional knapsack of the remaining spells is a valid bound."""
+        if any(spell.buffs for spell in self.spells):
+            return None
+
+        values = []
+        for family, (spell_index, _) in enumerate(families):
+            spell = self.spells[spell_index]
+            values.append((spell.get_average_damages(stats, parameters) / spell.get_pa(), spell.get_pa(), family))
+        values.sort(reverse=True)
+
+        def get_upper_bound(remaining_pa: int, remaining_counts: List[int]) -> float:
+            bound = 0.0
+            for ratio, pa, family in values:
+                if remaining_pa <= 0:
+                    break
+                used_pa = min(remaining_pa, pa * remaining_counts[family])
+                bound += ratio * used_pa
+                remaining_pa -= used_pa
+            return bound
+
+        return get_upper_bound
+
+
+    def get_best_damages_anytime(self, stats: Stats, parameters: DamageParameters, timeout: float = None, progress: ComputationProgress = None) -> AnytimeResult:
+        """Search the best combination within a time budget (in seconds, None for no limit).
+
+        A greedy solution is built first, then it is improved by a depth-first search exploring the most damaging spells first.
+        When the budget expires (or the progress is cancelled, or the user presses Ctrl+C if a progress is given), the best combination found so far
+        is returned, with is_optimal set to False."""
+        start_time = time.perf_counter()
+        if progress is not None:
+            # The number of combinations to explore is not known in advance
+            progress.start(0)
+        deadline = start_time + timeout if timeout is not None else None
+
+        families = self._get_families()
+        get_upper_bound = self._get_upper_bound_function(stats, parameters, families)
+
+        result = AnytimeResult()
+
+        def update_result(permutation: List[int], computation_data: ComputationData):
+            result.explored_count += 1
+            if computation_data.average_damages > result.average_damages + 1e-9 or (math.isclose(computation_data.average_damages, result.average_damages, abs_tol=1e-9) and 0 < len(permutation) < len(result.combination)):
+                result.combination = computation_data.permutation
+                result.average_damages = computation_data.average_damages
+                result.damages = computation_data.damages.copy()
+
+        def is_stopped() -> bool:
+            if deadline is not None and time.perf_counter() > deadline:
+                return True
+            if progress is not None and progress.cancellation_token.is_cancelled():
+                progress.cancel('cancelled')
+                return True
+            return False
+
+        def get_children(permutation: List[int], computation_data: Optional[ComputationData], remaining_pa: int, remaining_counts: List[int]) -> List[Tuple[int, ComputationData]]:
+            """Compute every possible extension of the permutation with one more spell, sorted by decreasing damages."""
+            children = []
+            for family, (spell_index, _) in enumerate(families):
+                if remaining_counts[family] == 0 or self.spells[spell_index].get_pa() > remaining_pa:
+                    continue
+
+                child_data = self._get_detailed_damages_of_permutation(permutation + [spell_index], stats, parameters, previous_data=computation_data)
+                if child_data is not None:
+                    update_result(permutation + [spell_index], child_data)
+                    children.append((family, child_data))
+
+            children.sort(key=lambda child: child[1].average_damages, reverse=True)
+            return children
+
+        def search_greedy():
+            """Greedy solutions : add the spell with the best damages (or the best damages per AP) until no spell can be added."""
+            for use_ratio in (False, True):
+                permutation, computation_data, remaining_pa, remaining_counts = [], None, parameters.pa, [count for _, count in families]
+                while True:
+                    children = get_children(permutation, computation_data, remaining_pa, remaining_counts)
+                    if not children:
+                        break
+
+                    previous_damages = computation_data.average_damages if computation_data is not None else 0.0
+                    if use_ratio:
+                        family, computation_data = max(children, key=lambda child: (child[1].average_damages - previous_damages) / self.spells[families[child[0]][0]].get_pa())
+                    else:
+                        family, computation_data = children[0]
+
+                    permutation.append(families[family][0])
+                    remaining_pa -= self.spells[families[family][0]].get_pa()
+                    remaining_counts[family] -= 1
+
+        # Ordered depth-first search, returns False if it was stopped before the end
+        def search(permutation: List[int], computation_data: Optional[ComputationData], remaining_pa: int, remaining_counts: List[int]) -> bool:
+            if is_stopped():
+                return False
+
+            for family, child_data in get_children(permutation, computation_data, remaining_pa, remaining_counts):
+                spell_index = families[family][0]
+                child_remaining_pa = remaining_pa - self.spells[spell_index].get_pa()
+                remaining_counts[family] -= 1
+
+                if get_upper_bound is None or child_data.average_damages + get_upper_bound(child_remaining_pa, remaining_counts) > result.average_damages + 1e-9:
+                    if not search(permutation + [spell_index], child_data, child_remaining_pa, remaining_counts):
+                        remaining_counts[family] += 1
+                        return False
+
+                remaining_counts[family] += 1
+
+            return True
+
+        try:
+            search_greedy()
+            result.is_optimal = search([], None, parameters.pa, [count for _, count in families])
+        except KeyboardInterrupt:
+            if progress is None:
+                raise
+            progress.cancel('interrupted')
+            result.is_optimal = False
+        result.elapsed_time = time.perf_counter() - start_time
+
+        return result
@@ -0,0 +1,117 @@
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+# Huppermage states have reserved bits : the four elements states (bits 0 to 3) then the six combinations (bits 4 to 9)
+HUPPERMAGE_ELEMENTS = ('a', 'e', 'f', 'w')
+HUPPERMAGE_STATES = tuple(f'h:{element}' for element in HUPPERMAGE_ELEMENTS)
+HUPPERMAGE_COMBINATIONS = tuple(f'H:{first}{second}' for index, first in enumerate(HUPPERMAGE_ELEMENTS) for second in HUPPERMAGE_ELEMENTS[index + 1:])
+
+HUPPERMAGE_STATES_MASK = (1 << len(HUPPERMAGE_STATES)) - 1
+HUPPERMAGE_MASK = (1 << (len(HUPPERMAGE_STATES) + len(HUPPERMAGE_COMBINATIONS))) - 1
+
+
+class StateRegistry:
+    """Intern the state names into bit positions, so that a set of states is an integer mask.
+
+    Names are only used at the I/O boundary (files, commands and display), the computations only use masks."""
+
+    def __init__(self) -> None:
+        self._bits: Dict[str, int] = dict()
+        self._names: List[str] = list()
+        self._lock = threading.Lock()
+
+        for name in HUPPERMAGE_STATES + HUPPERMAGE_COMBINATIONS:
+            self.get_bit(name)
+
+
+    def get_bit(self, name: str) -> int:
+        """Return the bit (1 << position) of the state, registering it if it is new."""
+        bit = self._bits.get(name, None)
+        if bit is not None:
+            return bit
+
+        with self._lock:
+            if not name in self._bits:
+                self._bits[name] = 1 << len(self._names)
+                self._names.append(name)
+            return self._bits[name]
+
+    def to_mask(self, names: Iterable[str]) -> int:
+        mask = 0
+        for name in names:
+            mask |= self.get_bit(name)
+        return mask
+
+    def to_names(self, mask: int) -> Set[str]:
+        names = set()
+        position = 0
+        while mask:
+            if mask & 1:
+                names.add(self._names[position])
+            mask >>= 1
+            position += 1
+        return names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+STATES = StateRegistry()
+
+
+def get_huppermage_combination_bit(first_state_bit: int, second_state_bit: int) -> int:
+    """Bit of the combination of two different Huppermage elements states."""
+    first_element = HUPPERMAGE_ELEMENTS[first_state_bit.bit_length() - 1]
+    second_element = HUPPERMAGE_ELEMENTS[second_state_bit.bit_length() - 1]
+    # Letters of the combination are in alphabetical order
+    if first_element > second_element:
+        first_element, second_element = second_element, first_element
+
+    return STATES.get_bit(f'H:{first_element}{second_element}')
+
+
+HUPPERMAGE_POWER_BONUS = 50
+HUPPERMAGE_EARTH_FIRE_VULNERABILITY_BONUS = 15
+
+
+def _get_huppermage_transition(huppermage_state: int, element_bit: int) -> Tuple[int, int, int]:
+    current_bit = (huppermage_state & HUPPERMAGE_STATES_MASK) & -(huppermage_state & HUPPERMAGE_STATES_MASK)  # Lowest element state
+    if current_bit == 0:
+        return (huppermage_state | element_bit, 0, 0)
+    if current_bit == element_bit:  # If element has already been applied, do nothing
+        return (huppermage_state, 0, 0)
+
+    huppermage_state &= ~current_bit
+    combined_bit = get_huppermage_combination_bit(current_bit, element_bit)
+    # If the combination has not been seen yet, add 50 power.
+    # If it is a fire/earth combination, also add 15% vulnerability
+    if huppermage_state & combined_bit:
+        return (huppermage_state, 0, 0)
+
+    vulnerability = HUPPERMAGE_EARTH_FIRE_VULNERABILITY_BONUS if combined_bit == STATES.get_bit('H:ef') else 0
+    return (huppermage_state | combined_bit, HUPPERMAGE_POWER_BONUS, vulnerability)
+
+
+# Huppermage state machine : the state is the Huppermage part of the states mask (current element state and combinations already done),
+# HUPPERMAGE_TRANSITIONS[state][element] is (new state, power bonus, vulnerability bonus) for the elements in the order of HUPPERMAGE_ELEMENTS
+HUPPERMAGE_TRANSITIONS: Tuple[Tuple[Tuple[int, int, int], ...], ...] = tuple(
+    tuple(_get_huppermage_transition(huppermage_state, 1 << element) for element in range(len(HUPPERMAGE_ELEMENTS)))
+    for huppermage_state in range(HUPPERMAGE_MASK + 1)
+)
+
+
+@lru_cache(maxsize=None)
+def get_huppermage_buff_transitions(element_bits: Tuple[int, ...]) -> Tuple[Tuple[int, int, int], ...]:
+    """Transitions of a buff applying the elements states in this order : (new state, total power bonus, total vulnerability bonus) for every state."""
+    transitions = list()
+    for huppermage_state in range(HUPPERMAGE_MASK + 1):
+        power, vulnerability = 0, 0
+        for element_bit in element_bits:
+            huppermage_state, power_bonus, vulnerability_bonus = HUPPERMAGE_TRANSITIONS[huppermage_state][element_bit.bit_length() - 1]
+            power += power_bonus
+            vulnerability += vulnerability_bonus
+        transitions.append((huppermage_state, power, vulnerability))
+
+    return tuple(transitions)
@@ -0,0 +1,351 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Set, Tuple
+
+from damage_parameters import DamageParameters
+from lazy_dict import get_loaded
+from spell import Spell
+from spell_set import SpellSet
+from stats import Stats
+
+
+class Storage(ABC):
+    """Persistence of the data of a Manager: stats pages, spells, spell sets and parameters sets.
+
+    The loading methods raise FileNotFoundError if nothing was saved yet, and call 'on_error' with a message for every object which cannot be read.
+    The spells and the spell sets given to 'save' may be LazyDict: the ones which were never loaded are unchanged, and are kept as they are stored."""
+
+    # Used in the messages of the Manager
+    description: str = 'storage'
+
+    @abstractmethod
+    def load_stats(self, on_error: Callable[[str], Any]) -> Dict[str, Stats]:
+        """Return the saved stats pages by short name."""
+
+    @abstractmethod
+    def load_spells_index(self, on_error: Callable[[str], Any]) -> List[str]:
+        """Return the short names of the saved spells, without loading them."""
+
+    @abstractmethod
+    def load_spell(self, short_name: str) -> Spell:
+        """Load only one spell, raise KeyError if it does not exist."""
+
+    @abstractmethod
+    def load_spell_sets(self) -> List[Dict[str, Any]]:
+        """Return the data of every spell set: its 'name', 'short_name' and 'spells' (short names)."""
+
+    @abstractmethod
+    def load_parameters(self) -> Tuple[Dict[str, Any], str]:
+        """Return the saved parameters sets (to load with DamageParameters.load) by name, and the name of the default one."""
+
+    @abstractmethod
+    def save(self, stats: Dict[str, Stats], spells: MutableMapping[str, Spell], spell_sets: MutableMapping[str, SpellSet], parameters: Dict[str, DamageParameters], default_parameters: str):
+        """Save every object, and the name of the default parameters set."""
+
+    def close(self):
+        pass
+
+
+def _get_spell_set_data(spell_set: SpellSet) -> Dict[str, Any]:
+    return {
+        'spells': [spell.get_short_name() for spell in spell_set],
+        'name': spell_set.get_name(),
+        'short_name': spell_set.get_short_name()
+    }
+
+
+class JsonStorage(Storage):
+    """Storage in the current folder: one JSON file by stats page and by spell, and the 'manager.json' file for the rest.
+
+    'manager.json' holds the filepath of every spell by short name, so they can be loaded one at a time."""
+
+    def __init__(self, filepath: str = 'manager.json') -> None:
+        self.filepath: str = filepath
+        self.description: str = f"'{filepath}' file"
+        self._data: Optional[Dict[str, Any]] = None
+        self._spells_index: Optional[Dict[str, str]] = None
+        # Spells already read to build the index of an old 'manager.json' (list of filepaths)
+        self._read_spells: Dict[str, Spell] = dict()
+
+
+    def _get_data(self) -> Dict[str, Any]:
+        if self._data is None:
+            with open(self.filepath, 'r', encoding='utf-8') as fi:
+                self._data = json.load(fi)
+
+        return self._data
+
+    def _get_spell_filepath(self, short_name: str) -> str:
+        # Same name as Spell.get_safe_name
+        safe_name = re.sub(r'\W', '_', short_name)
+        return f'spells\\{safe_name}.json'
+
+
+    def load_stats(self, on_error: Callable[[str], Any]) -> Dict[str, Stats]:
+        stats_by_short_name = dict()
+        for stats_filepath in self._get_data()['stats']:
+            try:
+                stats = Stats.from_file(stats_filepath)
+                stats_by_short_name[stats.get_short_name()] = stats
+            except (FileNotFoundError, KeyError, TypeError, ValueError):
+                on_error(f"Could not open or read stats page '{stats_filepath}'.")
+
+        return stats_by_short_name
+
+    def _get_spells_index(self, on_error: Callable[[str], Any]) -> Dict[str, str]:
+        if self._spells_index is None:
+            spells_data = self._get_data()['spells']
+            if isinstance(spells_data, dict):
+                self._spells_index = dict(spells_data)
+            else:
+                # Old format: the short names are only in the spell files
+                self._spells_index = dict()
+                for spell_filepath in spells_data:
+                    try:
+                        spell = Spell.from_file(spell_filepath)
+                        self._spells_index[spell.get_short_name()] = spell_filepath
+                        self._read_spells[spell.get_short_name()] = spell
+                    except (FileNotFoundError, KeyError, TypeError, ValueError):
+                        on_error(f"Could not open or read spell '{spell_filepath}'.")
+
+        return self._spells_index
+
+    def load_spells_index(self, on_error: Callable[[str], Any]) -> List[str]:
+        return list(self._get_spells_index(on_error))
+
+    def load_spell(self, short_name: str) -> Spell:
+        if short_name in self._read_spells:
+            return self._read_spells.pop(short_name)
+
+        try:
+            spells_index = self._get_spells_index(lambda message: None)
+        except FileNotFoundError:  # Nothing saved yet
+            spells_index = dict()
+
+        try:
+            return Spell.from_file(spells_index.get(short_name, self._get_spell_filepath(short_name)))
+        except FileNotFoundError:
+            raise KeyError(f"Spell '{short_name}' does not exist.")
+
+    def load_spell_sets(self) -> List[Dict[str, Any]]:
+        return self._get_data()['spell_sets']
+
+    def load_parameters(self) -> Tuple[Dict[str, Any], str]:
+        data = self._get_data()
+        return (data['parameters'], data['default_parameters'])
+
+
+    def save(self, stats: Dict[str, Stats], spells: MutableMapping[str, Spell], spell_sets: MutableMapping[str, SpellSet], parameters: Dict[str, DamageParameters], default_parameters: str):
+        stats_filepaths = list()
+        for stats_page in stats.values():
+            filepath = f'stats\\{stats_page.get_safe_name()}.json'
+            stats_page.save_to_file(filepath)
+            stats_filepaths.append(filepath)
+
+        # The files of the spells which were not loaded are unchanged
+        previous_spells_index = self._spells_index or dict()
+        loaded_spells = get_loaded(spells)
+        spells_index = dict()
+        for short_name in spells:
+            if short_name in loaded_spells:
+                spell = loaded_spells[short_name]
+                filepath = f'spells\\{spell.get_safe_name()}.json'
+                spell.save_to_file(filepath)
+                spells_index[short_name] = filepath
+            else:
+                spells_index[short_name] = previous_spells_index.get(short_name, self._get_spell_filepath(short_name))
+
+        previous_spell_sets_data = {spell_set_data['short_name']: spell_set_data for spell_set_data in self._data['spell_sets']} if self._data is not None else dict()
+        loaded_spell_sets = get_loaded(spell_sets)
+        spell_sets_data = [_get_spell_set_data(loaded_spell_sets[short_name]) if short_name in loaded_spell_sets else previous_spell_sets_data[short_name] for short_name in spell_sets]
+
+        json_valid_data = {
+            'stats': stats_filepaths,
+            'spells': spells_index,
+            'spell_sets': spell_sets_data,
+            'parameters': {parameters_name: parameters_set.to_dict() for parameters_name, parameters_set in parameters.items()},
+            'default_parameters': default_parameters
+        }
+
+        with open(self.filepath, 'w', encoding='utf-8') as fo:
+            json.dump(json_valid_data, fo)
+
+        self._data = json_valid_data
+        self._spells_index = dict(spells_index)
+
+
+SQLITE_SCHEMA_VERSION = 1
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stats (short_name TEXT PRIMARY KEY, name TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS spells (short_name TEXT PRIMARY KEY, name TEXT NOT NULL, pa INTEGER NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS buffs (
+    spell_short_name TEXT NOT NULL REFERENCES spells(short_name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (spell_short_name, position)
+);
+CREATE TABLE IF NOT EXISTS spell_sets (short_name TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS spell_set_spells (
+    spell_set_short_name TEXT NOT NULL REFERENCES spell_sets(short_name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    spell_short_name TEXT NOT NULL,
+    PRIMARY KEY (spell_set_short_name, position)
+);
+CREATE INDEX IF NOT EXISTS spell_set_spells_spell_index ON spell_set_spells (spell_short_name);
+CREATE TABLE IF NOT EXISTS parameters (name TEXT PRIMARY KEY, data TEXT NOT NULL);
+'''
+
+
+class SqliteStorage(Storage):
+    """Storage in a SQLite database, with one table by type of object (and one for the buffs of the spells and one for the spells of the spell sets).
+
+    Every save is a single transaction which only writes the objects changed since the last load or save."""
+
+    def __init__(self, filepath: str = 'manager.db') -> None:
+        # Imported on first use, as only the users of a SQLite database need it
+        import sqlite3
+
+        self.filepath: str = filepath
+        self.description: str = f"SQLite database '{filepath}'"
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        with self.connection:
+            self.connection.executescript(SQLITE_SCHEMA)
+
+        # Serialized data of every loaded object, as it is in the database, to only write the changed ones
+        self._saved: Dict[str, Dict[str, str]] = {'stats': {}, 'spells': {}, 'spell_sets': {}, 'parameters': {}}
+        # Keys of every object in the database, loaded or not, to delete the removed ones
+        self._stored_keys: Dict[str, Set[str]] = {'stats': set(), 'spells': set(), 'spell_sets': set(), 'parameters': set()}
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def _get_metadata(self, key: str) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _check_saved(self):
+        if self._get_metadata('default_parameters') is None:
+            raise FileNotFoundError(f"No data saved in '{self.filepath}'.")
+
+
+    def load_stats(self, on_error: Callable[[str], Any]) -> Dict[str, Stats]:
+        self._check_saved()
+
+        stats_by_short_name = dict()
+        for short_name, data in self.connection.execute('SELECT short_name, data FROM stats'):
+            try:
+                stats_by_short_name[short_name] = Stats.from_json_string(data)
+                self._saved['stats'][short_name] = data
+                self._stored_keys['stats'].add(short_name)
+            except (KeyError, TypeError, ValueError):
+                on_error(f"Could not read stats page '{short_name}'.")
+
+        return stats_by_short_name
+
+    def _get_spell(self, data: str, buffs_data: List[str]) -> Spell:
+        spell_data = json.loads(data)
+        spell_data['buffs'] = [json.loads(buff_data) for buff_data in buffs_data]
+        return Spell.from_dict(spell_data)
+
+    def load_spells_index(self, on_error: Callable[[str], Any]) -> List[str]:
+        self._check_saved()
+
+        short_names = [short_name for short_name, in self.connection.execute('SELECT short_name FROM spells')]
+        self._stored_keys['spells'].update(short_names)
+        return short_names
+
+    def load_spell(self, short_name: str) -> Spell:
+        row = self.connection.execute('SELECT data FROM spells WHERE short_name = ?', (short_name,)).fetchone()
+        if row is None:
+            raise KeyError(f"Spell '{short_name}' does not exist.")
+
+        buffs_data = [data for data, in self.connection.execute('SELECT data FROM buffs WHERE spell_short_name = ? ORDER BY position', (short_name,))]
+        spell = self._get_spell(row[0], buffs_data)
+        self._saved['spells'][short_name] = json.dumps(spell.to_dict())
+        self._stored_keys['spells'].add(short_name)
+
+        return spell
+
+    def load_spell_sets(self) -> List[Dict[str, Any]]:
+        self._check_saved()
+
+        spells_by_spell_set: Dict[str, List[str]] = dict()
+        for spell_set_short_name, spell_short_name in self.connection.execute('SELECT spell_set_short_name, spell_short_name FROM spell_set_spells ORDER BY spell_set_short_name, position'):
+            spells_by_spell_set.setdefault(spell_set_short_name, []).append(spell_short_name)
+
+        spell_sets = list()
+        for short_name, name in self.connection.execute('SELECT short_name, name FROM spell_sets'):
+            spell_set_data = {'spells': spells_by_spell_set.get(short_name, []), 'name': name, 'short_name': short_name}
+            spell_sets.append(spell_set_data)
+            self._saved['spell_sets'][short_name] = json.dumps(spell_set_data)
+            self._stored_keys['spell_sets'].add(short_name)
+
+        return spell_sets
+
+    def load_parameters(self) -> Tuple[Dict[str, Any], str]:
+        self._check_saved()
+
+        parameters = dict()
+        for name, data in self.connection.execute('SELECT name, data FROM parameters'):
+            parameters[name] = json.loads(data)
+            self._saved['parameters'][name] = data
+            self._stored_keys['parameters'].add(name)
+
+        return (parameters, self._get_metadata('default_parameters'))
+
+
+    def _get_changes(self, table: str, serialized: Dict[str, str], keys: Set[str]) -> Tuple[List[str], List[str]]:
+        """Return the keys of the changed (or new) and of the deleted objects of the table, from the serialized loaded objects and the keys of all of them."""
+        saved = self._saved[table]
+        changed = [key for key, data in serialized.items() if saved.get(key, None) != data]
+        deleted = [key for key in self._stored_keys[table] if not key in keys]
+        return (changed, deleted)
+
+    def save(self, stats: Dict[str, Stats], spells: MutableMapping[str, Spell], spell_sets: MutableMapping[str, SpellSet], parameters: Dict[str, DamageParameters], default_parameters: str):
+        keys = {'stats': set(stats), 'spells': set(spells), 'spell_sets': set(spell_sets), 'parameters': set(parameters)}
+        serialized_stats = {stats_page.get_short_name(): json.dumps(stats_page.to_dict()) for stats_page in stats.values()}
+        serialized_spells = {spell.get_short_name(): json.dumps(spell.to_dict()) for spell in get_loaded(spells).values()}
+        spell_sets_data = {spell_set.get_short_name(): _get_spell_set_data(spell_set) for spell_set in get_loaded(spell_sets).values()}
+        serialized_spell_sets = {short_name: json.dumps(spell_set_data) for short_name, spell_set_data in spell_sets_data.items()}
+        serialized_parameters = {name: json.dumps(parameters_set.to_dict()) for name, parameters_set in parameters.items()}
+
+        with self.connection:
+            changed, deleted = self._get_changes('stats', serialized_stats, keys['stats'])
+            self.connection.executemany('DELETE FROM stats WHERE short_name = ?', ((short_name,) for short_name in deleted))
+            self.connection.executemany('INSERT OR REPLACE INTO stats (short_name, name, data) VALUES (?, ?, ?)',
+                                        ((short_name, stats[short_name].get_name(), serialized_stats[short_name]) for short_name in changed))
+
+            # The buffs are deleted with their spell
+            changed, deleted = self._get_changes('spells', serialized_spells, keys['spells'])
+            self.connection.executemany('DELETE FROM spells WHERE short_name = ?', ((short_name,) for short_name in deleted + changed))
+            for short_name in changed:
+                spell_data = spells[short_name].to_dict()
+                buffs_data = spell_data.pop('buffs')
+                self.connection.execute('INSERT INTO spells (short_name, name, pa, data) VALUES (?, ?, ?, ?)', (short_name, spell_data['name'], spell_data['pa'], json.dumps(spell_data)))
+                self.connection.executemany('INSERT INTO buffs (spell_short_name, position, data) VALUES (?, ?, ?)',
+                                            ((short_name, position, json.dumps(buff_data)) for position, buff_data in enumerate(buffs_data)))
+
+            changed, deleted = self._get_changes('spell_sets', serialized_spell_sets, keys['spell_sets'])
+            self.connection.executemany('DELETE FROM spell_sets WHERE short_name = ?', ((short_name,) for short_name in deleted + changed))
+            for short_name in changed:
+                self.connection.execute('INSERT INTO spell_sets (short_name, name) VALUES (?, ?)', (short_name, spell_sets_data[short_name]['name']))
+                self.connection.executemany('INSERT INTO spell_set_spells (spell_set_short_name, position, spell_short_name) VALUES (?, ?, ?)',
+                                            ((short_name, position, spell_short_name) for position, spell_short_name in enumerate(spell_sets_data[short_name]['spells'])))
+
+            changed, deleted = self._get_changes('parameters', serialized_parameters, keys['parameters'])
+            self.connection.executemany('DELETE FROM parameters WHERE name = ?', ((name,) for name in deleted))
+            self.connection.executemany('INSERT OR REPLACE INTO parameters (name, data) VALUES (?, ?)', ((name, serialized_parameters[name]) for name in changed))
+
+            self.connection.executemany('INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
+                                        (('schema_version', str(SQLITE_SCHEMA_VERSION)), ('default_parameters', default_parameters)))
+
+        for table, serialized in (('stats', serialized_stats), ('spells', serialized_spells), ('spell_sets', serialized_spell_sets), ('parameters', serialized_parameters)):
+            self._saved[table] = {key: data for key, data in self._saved[table].items() if key in keys[table]}
+            self._saved[table].update(serialized)
+        self._stored_keys = keys
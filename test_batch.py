@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import batch
+from batch import BatchRunner, load_jobs, run_job_file
+from characteristics_damages import *
+from manager import Manager
+from spell import Spell
+from spell_set import SpellSet
+from stats import Stats
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.current_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+        self.manager = Manager(lambda code, message: None)
+
+        spell_set = SpellSet()
+        spell_set.set_name('Set')
+        spell_set.set_short_name('set')
+        for index, (pa, base_damage) in enumerate(((2, 20), (3, 35), (4, 50))):
+            spell = Spell()
+            spell.set_short_name(f's{index}')
+            spell.set_pa(pa)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': base_damage, 'max': base_damage, 'crit_min': base_damage, 'crit_max': base_damage})
+            spell.set_uses_per_target(2)
+            self.manager.spells[spell.get_short_name()] = spell
+            spell_set.add_spell(spell)
+        self.manager.spell_sets['set'] = spell_set
+
+        stats = Stats()
+        stats.set_short_name('agi')
+        stats.set_characteristic(AGILITY, 100)
+        self.manager.stats['agi'] = stats
+
+    def tearDown(self):
+        os.chdir(self.current_directory)
+        self.directory.cleanup()
+
+    def test_load_jobs(self):
+        with open('jobs.jsonl', 'w', encoding='utf-8') as fo:
+            fo.write('{"spell_set": "set"}\n\n{"spell_set": "set", "parameters": "-pa 3"}\n')
+        with open('jobs.json', 'w', encoding='utf-8') as fo:
+            json.dump({'jobs': [{'spell_set': 'set'}]}, fo)
+
+        self.assertEqual(len(load_jobs('jobs.jsonl')), 2)
+        self.assertEqual(len(load_jobs('jobs.json')), 1)
+
+    def test_run(self):
+        jobs = [
+            {'id': 'a', 'spell_set': 'set', 'parameters': '-pa 8'},
+            {'id': 'b', 'spell_set': 'set', 'parameters': '-pa 8', 'stats': ['agi']},
+            {'id': 'c', 'spell_set': 'set', 'parameters': '-pa 8', 'mode': 'dmgs'},
+            {'id': 'd', 'spell_set': 'unknown'},
+        ]
+
+        results = list(BatchRunner(self.manager).run(jobs))
+
+        self.assertListEqual([result['id'] for result in results], ['a', 'b', 'c', 'd'])
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertListEqual(results[0]['best_combination'], ['s2', 's2'])
+        self.assertAlmostEqual(results[0]['average_damages'], 100.0)
+        self.assertDictEqual(results[0]['damages'], {'min': 100, 'max': 100, 'crit_min': 100, 'crit_max': 100})
+        self.assertAlmostEqual(results[1]['average_damages'], 200.0)
+        self.assertAlmostEqual(results[2]['average_damages'], 100.0)
+        self.assertEqual(results[3]['status'], 'error')
+        self.assertEqual(results[3]['error'], "Spell set 'unknown' does not exist.")
+
+    def test_identical_jobs_are_deduplicated(self):
+        jobs = [
+            {'id': 'a', 'spell_set': 'set', 'parameters': '-pa 6'},
+            # Same computation, the name of the parameters is not used
+            {'id': 'b', 'spell_set': 'set', 'parameters': '-pa 6 -name other'},
+            {'id': 'c', 'spell_set': 'set', 'parameters': '-pa 7'},
+        ]
+
+        results = list(BatchRunner(self.manager).run(jobs))
+
+        self.assertNotIn('duplicate_of', results[0])
+        self.assertEqual(results[1]['duplicate_of'], 'a')
+        self.assertNotIn('duplicate_of', results[2])
+        self.assertListEqual(results[0]['best_combination'], results[1]['best_combination'])
+
+    def test_unexpected_errors_are_recorded(self):
+        jobs = [
+            {'id': 'a', 'spell_set': 'set', 'parameters': '-pa 6'},
+            {'id': 'b', 'spell_set': 'set', 'parameters': '-pa 7'},
+        ]
+        compute_job = batch._compute_job_with_permutations
+
+        def failing_compute_job(mode, spell_list, stats, parameters, permutations_cache):
+            if parameters.pa == 7:
+                raise ZeroDivisionError('division by zero')
+            return compute_job(mode, spell_list, stats, parameters, permutations_cache)
+
+        batch._compute_job_with_permutations = failing_compute_job
+        try:
+            results = list(BatchRunner(self.manager).run(jobs))
+        finally:
+            batch._compute_job_with_permutations = compute_job
+
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertDictEqual({key: results[1][key] for key in ('status', 'error')}, {'status': 'error', 'error': 'ZeroDivisionError: division by zero'})
+
+        class BrokenExecutor(Executor):
+            def submit(self, function, *args, **kwargs):
+                future = Future()
+                future.set_exception(BrokenProcessPool('A worker process terminated abruptly.'))
+                return future
+
+        results = list(BatchRunner(self.manager).run(jobs, executor=BrokenExecutor()))
+        self.assertTrue(all(result['status'] == 'error' and result['error'].startswith('BrokenProcessPool') for result in results))
+
+    def test_run_job_file_with_workers(self):
+        with open('jobs.jsonl', 'w', encoding='utf-8') as fo:
+            for pa in range(4, 9):
+                fo.write(json.dumps({'id': pa, 'spell_set': 'set', 'parameters': f'-pa {pa}'}) + '\n')
+
+        errors_count = run_job_file(self.manager, 'jobs.jsonl', 'results.jsonl', workers=2)
+
+        with open('results.jsonl', 'r', encoding='utf-8') as fi:
+            results = [json.loads(line) for line in fi]
+
+        self.assertEqual(errors_count, 0)
+        self.assertListEqual([result['id'] for result in results], [4, 5, 6, 7, 8])
+        self.assertTrue(all(result['status'] == 'ok' for result in results))
+        self.assertEqual(len(self.manager.cache), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import random
+import tempfile
+import unittest
+
+from benchmark import SCENARIOS, generate_spell_set, generate_stats, run_chain_benchmarks, run_startup
+from damage_parameters import DamageParameters
+from manager import Manager
+from spell_chain import SpellChains
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generator_is_deterministic(self):
+        spell_set1 = generate_spell_set(random.Random(42), 6)
+        spell_set2 = generate_spell_set(random.Random(42), 6)
+
+        self.assertListEqual([spell.to_dict() for spell in spell_set1], [spell.to_dict() for spell in spell_set2])
+
+    def test_generated_spell_set_is_computable(self):
+        rng = random.Random(0)
+        spell_set = generate_spell_set(rng, 5)
+        stats = generate_stats(rng)
+        parameters = DamageParameters.from_string('-pa 6')
+
+        chain = SpellChains()
+        for spell in spell_set.get_spell_list_single_target(parameters):
+            chain.add_spell(spell)
+
+        damages = chain.get_detailed_damages(stats, parameters)
+
+        self.assertGreater(len(damages), 0)
+
+    def test_run_chain_benchmarks(self):
+        results = run_chain_benchmarks(SCENARIOS[0], seed=0, repeat=1)
+
+        self.assertSetEqual({result['benchmark'] for result in results}, {'get_detailed_damages_cold_cache', 'get_detailed_damages_warm_cache', 'get_best_combination'})
+        for result in results:
+            self.assertEqual(len(result['times']), 1)
+            self.assertGreaterEqual(result['min'], 0.0)
+
+    def test_startup_does_not_import_deferred_modules(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertListEqual(run_startup(directory), [])
+
+    def test_cache_is_loaded_on_first_use(self):
+        current_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                with open('cache.txt', 'w', encoding='ascii') as fo:
+                    fo.write('hash:0,1;1\n')
+                manager = Manager(lambda code, message: None)
+                self.assertIsNone(manager._cache)
+                # Saving an unused cache does not rewrite it
+                manager.save(print_message=False, save_cache=True)
+                self.assertIsNone(manager._cache)
+
+                self.assertListEqual(list(manager.cache['hash']), [(0, 1), (1,)])
+
+                # Saved as a trie in the current version of the file
+                manager.save_cache()
+                with open('cache.txt', 'r', encoding='ascii') as fi:
+                    self.assertEqual(fi.read(), 'version:2\nhash:0|1,0,0;2,1;1,1\n')
+                self.assertListEqual(list(Manager(lambda code, message: None).cache['hash']), [(0, 1), (1,)])
+            finally:
+                os.chdir(current_directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import csv
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from benchmark import generate_spell, generate_stats
+from chain_export import export_chains, get_export_format, write_chains
+from damage_parameters import DamageParameters
+from spell_chain import SpellChains
+
+
+class TestChainExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        rng = random.Random(3)
+        short_names = [f's{index}' for index in range(4)]
+        self.spell_chain = SpellChains()
+        for short_name in short_names:
+            self.spell_chain.add_spell(generate_spell(rng, short_name, short_names))
+        self.stats = generate_stats(rng)
+        self.parameters = DamageParameters.from_string('-pa 8 -pomin 0 -pomax 8')
+        self.damages = self.spell_chain.get_detailed_damages(self.stats, self.parameters)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_path(self, filename: str) -> str:
+        return os.path.join(self.directory.name, filename)
+
+    def test_export_format(self):
+        self.assertEqual(get_export_format('chains.csv'), 'csv')
+        self.assertEqual(get_export_format('chains.JSONL'), 'jsonl')
+        self.assertEqual(get_export_format('chains.json'), 'jsonl')
+        with self.assertRaises(ValueError):
+            get_export_format('chains.txt')
+        with self.assertRaises(ValueError):
+            write_chains([], self._get_path('chains.csv'), export_format='xml')
+
+    def test_iter_chains_same_as_detailed_damages(self):
+        chains = {combination: (average_damages, damages) for combination, _, average_damages, damages in self.spell_chain.iter_chains(self.stats, self.parameters)}
+        self.assertDictEqual(chains, dict(self.damages))
+
+        for combination, used_pa, _, _ in self.spell_chain.iter_chains(self.stats, self.parameters):
+            self.assertEqual(used_pa, sum(self.spell_chain.spells[self.spell_chain.indexes[short_name]].get_pa() for short_name in combination))
+
+    def test_export_jsonl(self):
+        filepath = self._get_path('chains.jsonl')
+        count = export_chains(self.spell_chain, self.stats, self.parameters, filepath)
+
+        with open(filepath, 'r', encoding='utf-8') as fi:
+            rows = [json.loads(line) for line in fi]
+
+        self.assertEqual(count, len(self.damages))
+        self.assertEqual(len(rows), count)
+        for row in rows:
+            average_damages, damages = self.damages[tuple(row['spells'])]
+            self.assertEqual(row['average'], average_damages)
+            self.assertDictEqual({key: row[key] for key in damages}, damages)
+
+    def test_export_csv_with_filters(self):
+        filepath = self._get_path('chains.csv')
+        min_damages = sorted(average_damages for average_damages, _ in self.damages.values())[len(self.damages) // 2]
+        count = export_chains(self.spell_chain, self.stats, self.parameters, filepath, min_damages=min_damages, max_length=2)
+
+        with open(filepath, 'r', encoding='utf-8', newline='') as fi:
+            rows = list(csv.DictReader(fi))
+
+        expected = {combination: value for combination, value in self.damages.items() if value[0] >= min_damages and len(combination) <= 2}
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(count, len(expected))
+        self.assertSetEqual({tuple(row['spells'].split(' ')) for row in rows}, set(expected))
+        for row in rows:
+            average_damages, damages = expected[tuple(row['spells'].split(' '))]
+            self.assertAlmostEqual(float(row['average']), average_damages)
+            self.assertEqual(int(row['crit_max']), damages['crit_max'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+from characteristics_damages import *
+from computation_statistics import ComputationStatistics
+from damage_parameters import DamageParameters
+from spell import Spell, SpellBuff
+from spell_chain import SpellChains
+from stats import Stats
+
+
+class TestComputationStatistics(unittest.TestCase):
+
+    def _get_chain(self, statistics: ComputationStatistics = None) -> SpellChains:
+        chain = SpellChains(statistics=statistics)
+
+        spell1 = Spell()
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 1, 'max': 2, 'crit_min': 3, 'crit_max': 4})
+        spell1.set_pa(2)
+        spell1.set_po(0, 5)
+        spell1.set_short_name('s1')
+        buff_spell1 = SpellBuff()
+        buff_spell1.add_new_output_state('st1')
+        spell1.add_buff(buff_spell1)
+
+        spell2 = Spell()
+        spell2.add_damaging_characteristic(AGILITY)
+        spell2.set_base_damages(AGILITY, {'min': 10, 'max': 20, 'crit_min': 30, 'crit_max': 40})
+        spell2.set_pa(2)
+        spell2.set_po(6, 8)
+        spell2.set_short_name('s2')
+
+        chain.add_spell(spell1)
+        chain.add_spell(spell1)
+        chain.add_spell(spell2)
+
+        return chain
+
+    def test_increment_and_reset(self):
+        statistics = ComputationStatistics()
+
+        statistics.increment('spells_evaluated')
+        statistics.increment('spells_evaluated', 3)
+        statistics.add_time('sort', 0.5)
+
+        self.assertEqual(statistics.counters['spells_evaluated'], 4)
+        self.assertAlmostEqual(statistics.timings['sort'], 0.5)
+
+        statistics.reset()
+
+        self.assertEqual(statistics.counters['spells_evaluated'], 0)
+        self.assertAlmostEqual(statistics.timings['sort'], 0.0)
+
+    def test_merge(self):
+        statistics1 = ComputationStatistics()
+        statistics1.increment('buffs_checked', 2)
+        statistics2 = ComputationStatistics()
+        statistics2.increment('buffs_checked', 5)
+        statistics2.add_time('evaluation', 1.0)
+
+        statistics1.merge(statistics2)
+
+        self.assertEqual(statistics1.counters['buffs_checked'], 7)
+        self.assertAlmostEqual(statistics1.timings['evaluation'], 1.0)
+
+    def test_timer(self):
+        statistics = ComputationStatistics()
+
+        with statistics.timer('permutations'):
+            pass
+
+        self.assertGreaterEqual(statistics.timings['permutations'], 0.0)
+
+    def test_chain_counters(self):
+        statistics = ComputationStatistics()
+        chain = self._get_chain(statistics)
+        parameters = DamageParameters.from_string('-pa 4')
+        cache = {}
+
+        damages = chain.get_detailed_damages(Stats(), parameters, cache=cache)
+
+        # Unique permutations: (s1), (s2), (s1, s1), (s1, s2), (s2, s1), the two last ones being out of range
+        self.assertEqual(len(damages), 3)
+        self.assertEqual(statistics.counters['permutations_evaluated'], 3)
+        self.assertEqual(statistics.counters['permutations_pruned'], 2)
+        self.assertEqual(statistics.counters['prefix_reuse_hits'], 1)
+        self.assertEqual(statistics.counters['spells_reused'], 1)
+        self.assertEqual(statistics.counters['cache_misses'], 1)
+        self.assertEqual(statistics.counters['buffs_triggered'], 2)
+
+        chain.get_detailed_damages(Stats(), parameters, cache=cache)
+
+        self.assertEqual(statistics.counters['cache_hits'], 1)
+
+    def test_same_results_with_and_without_statistics(self):
+        parameters = DamageParameters.from_string('-pa 6')
+
+        damages1 = self._get_chain().get_detailed_damages(Stats(), parameters)
+        damages2 = self._get_chain(ComputationStatistics()).get_detailed_damages(Stats(), parameters)
+
+        self.assertDictEqual(damages1, damages2)
+
+if __name__ == '__main__':
+    unittest.main()
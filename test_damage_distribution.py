@@ -0,0 +1,308 @@
+import unittest
+import unittest.mock
+
+import damage_distribution
+from characteristics_damages import *
+from damage_distribution import DamageDistribution, get_best_kill_probability, get_exact_distribution, get_kill_probabilities, simulate_damages
+from damage_parameters import DamageParameters
+from spell import Spell
+from spell_chain import SpellChains, SpellRolls
+from stats import Stats
+
+
+@unittest.skipIf(damage_distribution.np is None, "The 'numpy' package is not installed.")
+class TestDamageDistribution(unittest.TestCase):
+
+    def test_distribution(self):
+        distribution = DamageDistribution([4, 1, 3, 2, 5, 5], percentiles=(0, 50, 100), bins=4)
+
+        self.assertEqual(distribution.trials, 6)
+        self.assertEqual(distribution.min, 1)
+        self.assertEqual(distribution.max, 5)
+        self.assertAlmostEqual(distribution.mean, 20 / 6)
+        self.assertDictEqual(distribution.percentiles, {0: 1.0, 50: 3.5, 100: 5.0})
+        self.assertListEqual(distribution.histogram[0], [1, 1, 1, 3])
+        self.assertListEqual(distribution.histogram[1], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+        self.assertAlmostEqual(distribution.get_probability_at_least(0), 1.0)
+        self.assertAlmostEqual(distribution.get_probability_at_least(3), 4 / 6)
+        self.assertAlmostEqual(distribution.get_probability_at_least(5), 2 / 6)
+        self.assertAlmostEqual(distribution.get_probability_at_least(6), 0.0)
+
+        self.assertEqual(distribution.to_dict()['percentiles'], {'0': 1.0, '50': 3.5, '100': 5.0})
+
+    def test_simulate_fixed_damages(self):
+        rolls = [SpellRolls('spell1', 0.0, [([10], [20])]), SpellRolls('spell2', 1.0, [([10], [15]), ([1], [2])])]
+
+        distribution = simulate_damages(rolls, trials=1000)
+
+        self.assertEqual(distribution.trials, 1000)
+        self.assertEqual(distribution.min, 27)
+        self.assertEqual(distribution.max, 27)
+
+    def test_simulate_crit_chance(self):
+        rolls = [SpellRolls('spell1', 0.25, [([0], [1])])]
+
+        distribution = simulate_damages(rolls, trials=200_000, seed=1)
+
+        self.assertAlmostEqual(distribution.mean, 0.25, delta=0.005)
+        self.assertAlmostEqual(distribution.get_probability_at_least(1), 0.25, delta=0.005)
+
+    def test_simulate_uniform_rolls(self):
+        rolls = [SpellRolls('spell1', 0.0, [([1, 2, 3, 4], [1, 2, 3, 4])])]
+
+        distribution = simulate_damages(rolls, trials=200_000, seed=1)
+
+        self.assertEqual(distribution.min, 1)
+        self.assertEqual(distribution.max, 4)
+        self.assertAlmostEqual(distribution.mean, 2.5, delta=0.02)
+        for damages in range(1, 5):
+            self.assertAlmostEqual(distribution.get_probability_at_least(damages), (5 - damages) / 4, delta=0.01)
+
+    def test_simulate_seed(self):
+        rolls = [SpellRolls('spell1', 0.3, [(list(range(10, 20)), list(range(20, 30)))])]
+
+        distribution1 = simulate_damages(rolls, trials=10_000, seed=42)
+        distribution2 = simulate_damages(rolls, trials=10_000, seed=42)
+        distribution3 = simulate_damages(rolls, trials=10_000, seed=43)
+
+        self.assertListEqual(distribution1.samples.tolist(), distribution2.samples.tolist())
+        self.assertNotEqual(distribution1.samples.tolist(), distribution3.samples.tolist())
+
+    def test_simulate_adaptive_trials(self):
+        rolls = [SpellRolls('spell1', 0.0, [(list(range(100, 111)), list(range(100, 111)))])]
+        wide_rolls = [SpellRolls('spell1', 0.5, [(list(range(0, 1001)), list(range(1000, 3001)))])]
+
+        # Small relative spread: the minimum number of trials is enough
+        distribution = simulate_damages(rolls, seed=1, batch_size=1000, min_trials=1000, max_trials=100_000)
+        self.assertEqual(distribution.trials, 1000)
+
+        wide_distribution = simulate_damages(wide_rolls, seed=1, batch_size=1000, min_trials=1000, max_trials=100_000)
+        self.assertGreater(wide_distribution.trials, 1000)
+        self.assertLessEqual(wide_distribution.trials, 100_000)
+
+        capped_distribution = simulate_damages(wide_rolls, seed=1, batch_size=1000, min_trials=1000, max_trials=5000, tolerance=1e-9)
+        self.assertEqual(capped_distribution.trials, 5000)
+
+    def test_simulate_invalid_trials(self):
+        with self.assertRaises(ValueError):
+            simulate_damages([], trials=0)
+
+    def test_simulate_spell_chain(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.set_crit_chance(0.2)
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 14, 'crit_min': 13, 'crit_max': 16})
+        chain.add_spell(spell1)
+
+        stats = Stats()
+        stats.set_characteristic(AGILITY, 150)
+        stats.set_bonus_crit_chance(0.1)
+        parameters = DamageParameters.from_string('-pa 6')
+
+        computation_data = chain._get_detailed_damages_of_permutation([0, 0], stats, parameters)
+        distribution = simulate_damages(chain.get_rolls(('spell1', 'spell1'), stats, parameters), seed=3)
+
+        self.assertGreaterEqual(distribution.min, computation_data.damages['min'])
+        self.assertLessEqual(distribution.max, computation_data.damages['crit_max'])
+        self.assertAlmostEqual(distribution.mean, computation_data.average_damages, delta=0.5)
+
+
+
+class TestExactDamageDistribution(unittest.TestCase):
+
+    def test_exact_distribution_fixed_damages(self):
+        rolls = [SpellRolls('spell1', 0.0, [([10], [20])]), SpellRolls('spell2', 1.0, [([10], [15]), ([1], [2])]), SpellRolls('spell3', 0.5, [])]
+
+        distribution = get_exact_distribution(rolls)
+
+        self.assertEqual(distribution.min, 27)
+        self.assertEqual(distribution.max, 27)
+        self.assertListEqual(distribution.probabilities, [1.0])
+        self.assertAlmostEqual(distribution.get_kill_probability(27), 1.0)
+        self.assertAlmostEqual(distribution.get_kill_probability(28), 0.0)
+
+    def test_exact_distribution(self):
+        # Two lines of 2 equally likely rolls without crit, 1 roll with crit
+        rolls = [SpellRolls('spell1', 0.25, [([1, 2], [10]), ([0, 1], [10])])]
+
+        distribution = get_exact_distribution(rolls)
+
+        self.assertEqual(distribution.min, 1)
+        self.assertEqual(distribution.max, 20)
+        self.assertAlmostEqual(distribution.probabilities[0], 0.75 / 4)
+        self.assertAlmostEqual(distribution.probabilities[1], 0.75 / 2)
+        self.assertAlmostEqual(distribution.probabilities[2], 0.75 / 4)
+        self.assertAlmostEqual(distribution.probabilities[-1], 0.25)
+        self.assertAlmostEqual(sum(distribution.probabilities), 1.0)
+        self.assertAlmostEqual(distribution.mean, 0.75 * 2 + 0.25 * 20)
+
+        self.assertAlmostEqual(distribution.get_kill_probability(0), 1.0)
+        self.assertAlmostEqual(distribution.get_kill_probability(2), 0.75 * 3 / 4 + 0.25)
+        self.assertAlmostEqual(distribution.get_probability_at_least(2.5), 0.75 / 4 + 0.25)
+        self.assertAlmostEqual(distribution.get_kill_probability(21), 0.0)
+        self.assertEqual(distribution.get_percentile(50), 2)
+        self.assertEqual(distribution.get_percentile(100), 20)
+
+    def test_exact_distribution_same_values_rolls(self):
+        # Floor steps can give the same damages for different rolls
+        distribution = get_exact_distribution([SpellRolls('spell1', 0.0, [([5, 5, 6], [5, 5, 6])])])
+
+        self.assertAlmostEqual(distribution.probabilities[0], 2 / 3)
+        self.assertAlmostEqual(distribution.probabilities[1], 1 / 3)
+
+    def test_exact_distribution_fft(self):
+        rolls = [SpellRolls(f'spell{index}', 0.3, [(list(range(100, 400)), list(range(300, 700)))]) for index in range(3)]
+
+        previous_threshold = damage_distribution.FFT_THRESHOLD
+        try:
+            damage_distribution.FFT_THRESHOLD = 1 << 30
+            direct_distribution = get_exact_distribution(rolls)
+            damage_distribution.FFT_THRESHOLD = 0
+            fft_distribution = get_exact_distribution(rolls)
+        finally:
+            damage_distribution.FFT_THRESHOLD = previous_threshold
+
+        self.assertEqual(fft_distribution.min, direct_distribution.min)
+        self.assertEqual(len(fft_distribution.probabilities), len(direct_distribution.probabilities))
+        for fft_probability, direct_probability in zip(fft_distribution.probabilities, direct_distribution.probabilities):
+            self.assertAlmostEqual(fft_probability, direct_probability)
+
+    def test_exact_distribution_without_numpy(self):
+        rolls = [SpellRolls(f'spell{index}', 0.3, [(list(range(10, 40)), list(range(30, 70))), ([3, 4], [5, 6])]) for index in range(3)]
+
+        distribution = get_exact_distribution(rolls)
+        with unittest.mock.patch.object(damage_distribution, 'np', None):
+            python_distribution = get_exact_distribution(rolls)
+
+        self.assertEqual(python_distribution.min, distribution.min)
+        self.assertEqual(len(python_distribution.probabilities), len(distribution.probabilities))
+        for python_probability, probability in zip(python_distribution.probabilities, distribution.probabilities):
+            self.assertAlmostEqual(python_probability, probability)
+
+    def test_kill_probabilities(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.set_pa(3)
+        spell1.set_crit_chance(0.2)
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 14, 'crit_min': 13, 'crit_max': 16})
+        chain.add_spell(spell1)
+
+        spell2 = Spell()
+        spell2.set_short_name('spell2')
+        spell2.set_pa(2)
+        spell2.add_damaging_characteristic(AGILITY)
+        spell2.set_base_damages(AGILITY, {'min': 1, 'max': 30, 'crit_min': 1, 'crit_max': 30})
+        chain.add_spell(spell2)
+
+        stats = Stats()
+        stats.set_characteristic(AGILITY, 150)
+        parameters = DamageParameters.from_string('-pa 6')
+
+        damages = chain.get_detailed_damages(stats, parameters)
+        kill_probabilities = get_kill_probabilities(chain, damages, stats, parameters, 60)
+
+        self.assertListEqual(list(kill_probabilities), list(damages))
+        for combination, kill_probability in kill_probabilities.items():
+            distribution = get_exact_distribution(chain.get_rolls(combination, stats, parameters))
+            # The average damages use the middle of the extreme rolls, which is close to the exact mean
+            self.assertAlmostEqual(distribution.mean, damages[combination][0], delta=1.0)
+            self.assertAlmostEqual(kill_probability, distribution.get_kill_probability(60))
+
+        self.assertAlmostEqual(kill_probabilities[('spell1',)], 0.0)
+        self.assertGreater(kill_probabilities[('spell2',)], 0.0)
+
+
+    def test_kill_probability_upper_bound(self):
+        rolls = [SpellRolls('spell1', 0.25, [([1, 2], [10]), ([0, 1], [10])]), SpellRolls('spell2', 0.0, [(list(range(0, 50)), list(range(0, 50)))])]
+        distribution = get_exact_distribution(rolls)
+
+        for hp in (0, 10, 30, 40, 50, 60, 80):
+            self.assertGreaterEqual(damage_distribution._get_kill_probability_upper_bound(rolls, hp, {}) + 1e-12, distribution.get_kill_probability(hp))
+
+        # Fixed damages
+        self.assertEqual(damage_distribution._get_kill_probability_upper_bound([SpellRolls('spell1', 0.0, [([10], [10])])], 11, {}), 0.0)
+
+    def test_best_kill_probability(self):
+        chain = SpellChains()
+
+        # Constant damages
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.set_pa(3)
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 20, 'max': 20, 'crit_min': 20, 'crit_max': 20})
+        chain.add_spell(spell1)
+        chain.add_spell(spell1)
+
+        # Lower average damages but higher variance
+        spell2 = Spell()
+        spell2.set_short_name('spell2')
+        spell2.set_pa(3)
+        spell2.set_crit_chance(0.3)
+        spell2.add_damaging_characteristic(AGILITY)
+        spell2.set_base_damages(AGILITY, {'min': 1, 'max': 20, 'crit_min': 20, 'crit_max': 40})
+        chain.add_spell(spell2)
+
+        spell3 = Spell()
+        spell3.set_short_name('spell3')
+        spell3.set_pa(2)
+        spell3.add_damaging_characteristic(AGILITY)
+        spell3.set_base_damages(AGILITY, {'min': 5, 'max': 10, 'crit_min': 5, 'crit_max': 10})
+        chain.add_spell(spell3)
+
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 6')
+        damages = chain.get_detailed_damages(stats, parameters)
+
+        for hp in (1, 20, 25, 35, 45, 55, 100):
+            kill_probabilities = get_kill_probabilities(chain, damages, stats, parameters, hp)
+            best_combination = max(kill_probabilities, key=lambda combination: (kill_probabilities[combination], damages[combination][0], -len(combination)))
+
+            result = get_best_kill_probability(chain, stats, parameters, hp)
+
+            self.assertTupleEqual(result.combination, best_combination)
+            self.assertAlmostEqual(result.kill_probability, kill_probabilities[best_combination])
+            self.assertAlmostEqual(result.average_damages, damages[best_combination][0])
+            self.assertEqual(result.combinations_count, len(damages))
+
+        # The combination with the highest average damages cannot reach 45 HP without crit
+        result = get_best_kill_probability(chain, stats, parameters, 45)
+        self.assertEqual(next(iter(damages)), ('spell1', 'spell1'))
+        self.assertIn('spell2', result.combination)
+
+        # Every combination is decided by the bounds
+        result = get_best_kill_probability(chain, stats, parameters, 1000)
+        self.assertEqual(result.exact_count, 0)
+        self.assertTupleEqual(result.combination, next(iter(damages)))
+
+    def test_best_kill_probability_critical_strikes_with_lower_damages(self):
+        chain = SpellChains()
+
+        # The first spell deals less damages with a critical strike, the second one more
+        for short_name, damages, crit_damages in (('spell1', 50, 10), ('spell2', 10, 50)):
+            spell = Spell()
+            spell.set_short_name(short_name)
+            spell.set_pa(3)
+            spell.set_crit_chance(0.5)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': damages, 'max': damages, 'crit_min': crit_damages, 'crit_max': crit_damages})
+            chain.add_spell(spell)
+
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 6')
+
+        # Both totals are 60 damages, but 100 damages are dealt when only the second spell is a critical strike
+        result = get_best_kill_probability(chain, stats, parameters, 90)
+        self.assertSetEqual(set(result.combination), {'spell1', 'spell2'})
+        self.assertAlmostEqual(result.kill_probability, 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
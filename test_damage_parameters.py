@@ -88,6 +88,53 @@ class TestDamageParameters(unittest.TestCase):
 
         self.assertEqual(damage_parameters.to_string(), string)
 
+    def test_timeout(self):
+        self.assertEqual(DamageParameters.from_string('').timeout, 0)
+        self.assertEqual(DamageParameters.from_string('-timeout 200').timeout, 200)
+        self.assertEqual(DamageParameters.from_string('-timeout 200').copy().timeout, 200)
+        self.assertTrue(DamageParameters.from_string('-timeout 200').to_string().endswith(' -timeout 200'))
+
+        with self.assertRaises(ValueError):
+            DamageParameters.from_string('-timeout -1')
+
+    def test_hp(self):
+        self.assertEqual(DamageParameters.from_string('').hp, 0)
+        self.assertEqual(DamageParameters.from_string('-hp 2500').hp, 2500)
+        self.assertEqual(DamageParameters.from_string('-hp 2500').copy().hp, 2500)
+        self.assertTrue(DamageParameters.from_string('-hp 2500').to_string().endswith(' -hp 2500'))
+
+        with self.assertRaises(ValueError):
+            DamageParameters.from_string('-hp -1')
+
+    def test_from_string_returns_copies(self):
+        damage_parameters1 = DamageParameters.from_string('-s a -r 1 2 3 4 5 -states x')
+        damage_parameters1.stats.append('b')
+        damage_parameters1.resistances[0] = 10
+        damage_parameters1.starting_states.add('y')
+
+        damage_parameters2 = DamageParameters.from_string('-s a -r 1 2 3 4 5 -states x')
+
+        self.assertListEqual(damage_parameters2.stats, ['a'])
+        self.assertListEqual(damage_parameters2.resistances, [1, 2, 3, 4, 5])
+        self.assertSetEqual(damage_parameters2.starting_states, {'x'})
+
+    def test_to_dict(self):
+        damage_parameters = DamageParameters.from_string('-s a b -pa 3 -pomin 1 -pomax 6 -t multi -r 1 2 3 4 5 -v 15 -name nom -bdmg 1 2 3 4 5 -states y x -p diag -timeout 20 -hp 1000')
+
+        loaded_parameters = DamageParameters.from_dict(damage_parameters.to_dict())
+
+        self.assertDictEqual(vars(loaded_parameters), vars(damage_parameters))
+        self.assertListEqual(damage_parameters.to_dict()['starting_states'], ['x', 'y'])
+
+    def test_load(self):
+        string = '-s a -pa 3 -v 15'
+
+        self.assertDictEqual(vars(DamageParameters.load(string)), vars(DamageParameters.from_string(string)))
+        self.assertDictEqual(vars(DamageParameters.load({'pa': 3})), vars(DamageParameters.from_string('-pa 3')))
+
+        with self.assertRaises(ValueError):
+            DamageParameters.load({'pa': 0})
+
     def test_get_resistances_dict(self):
         string = '-r -10 0 10 20 30'
 
@@ -0,0 +1,168 @@
+import math
+import random
+import unittest
+
+from benchmark import generate_spell, generate_stats
+from characteristics_damages import *
+from damage_parameters import DamageParameters
+from dominance import prune_dominated_spells
+from spell import Spell, SpellBuff
+from spell_chain import SpellChains
+from spell_set import SpellSet
+from stats import Stats
+
+
+class TestDominance(unittest.TestCase):
+
+    def _get_spell(self, short_name: str, pa: int, damages: int, min_po: int = 0, max_po: int = 10) -> Spell:
+        spell = Spell()
+        spell.set_name(short_name.upper())
+        spell.set_short_name(short_name)
+        spell.set_pa(pa)
+        spell.set_po(min_po=min_po, max_po=max_po)
+        spell.add_damaging_characteristic(AGILITY)
+        spell.set_base_damages(AGILITY, {'min': damages, 'max': damages + 5, 'crit_min': damages + 5, 'crit_max': damages + 10})
+        return spell
+
+    def _get_short_names(self, spell_list):
+        return [spell.get_short_name() for spell in spell_list]
+
+    def test_dominated_spell(self):
+        strong = self._get_spell('strong', 3, 30)
+        weak = self._get_spell('weak', 4, 20, min_po=1, max_po=5)
+        parameters = DamageParameters.from_string('-pa 6')
+
+        spell_list, dominated_spells = prune_dominated_spells([strong, weak, weak], Stats(), parameters)
+
+        self.assertListEqual(self._get_short_names(spell_list), ['strong'])
+        self.assertEqual(len(dominated_spells), 1)
+        self.assertIs(dominated_spells[0].spell, weak)
+        self.assertIs(dominated_spells[0].dominating_spell, strong)
+        self.assertEqual(dominated_spells[0].pruned_count, 2)
+        self.assertIn("'STRONG' costs 3 PA (instead of 4)", dominated_spells[0].get_reason())
+
+    def test_uses_are_kept_if_all_dominating_uses_are_taken(self):
+        strong = self._get_spell('strong', 2, 30)
+        weak = self._get_spell('weak', 2, 20)
+        parameters = DamageParameters.from_string('-pa 8')
+
+        # A combination can use both uses of the strong spell and two uses of the weak one
+        spell_list, dominated_spells = prune_dominated_spells([strong, strong, weak, weak, weak], Stats(), parameters)
+
+        self.assertListEqual(self._get_short_names(spell_list), ['strong', 'strong', 'weak', 'weak'])
+        self.assertEqual(dominated_spells[0].pruned_count, 1)
+        self.assertEqual(dominated_spells[0].kept_count, 2)
+
+    def test_not_dominated(self):
+        parameters = DamageParameters.from_string('-pa 6')
+        strong = self._get_spell('strong', 3, 30, max_po=5)
+
+        for spell in (self._get_spell('cheap', 2, 20), self._get_spell('range', 3, 20, max_po=6), self._get_spell('damages', 3, 31)):
+            spell_list, dominated_spells = prune_dominated_spells([strong, spell], Stats(), parameters)
+            self.assertEqual(len(spell_list), 2)
+            self.assertListEqual(dominated_spells, [])
+
+    def test_identical_spells(self):
+        spell1 = self._get_spell('s1', 3, 30)
+        spell2 = self._get_spell('s2', 3, 30)
+
+        spell_list, dominated_spells = prune_dominated_spells([spell1, spell2], Stats(), DamageParameters.from_string('-pa 3'))
+
+        self.assertListEqual(self._get_short_names(spell_list), ['s1'])
+        self.assertIs(dominated_spells[0].spell, spell2)
+
+    def test_buffs(self):
+        strong = self._get_spell('strong', 3, 30)
+        weak = self._get_spell('weak', 3, 20)
+        buffing = self._get_spell('buffing', 3, 10)
+        parameters = DamageParameters.from_string('-pa 6')
+
+        # The weak spell is buffed: it may be better in a combination
+        buff = SpellBuff()
+        stats = Stats()
+        stats.set_characteristic(AGILITY, 500)
+        buff.add_stats(stats, spell='weak')
+        buffing.add_buff(buff)
+        spell_list, dominated_spells = prune_dominated_spells([strong, weak, buffing], Stats(), parameters)
+        self.assertEqual(len(spell_list), 3)
+        self.assertListEqual(dominated_spells, [])
+
+        # Every spell is buffed
+        buff.stats = {}
+        buff.add_stats(stats)
+        spell_list, dominated_spells = prune_dominated_spells([strong, weak, buffing], Stats(), parameters)
+        self.assertEqual(len(spell_list), 3)
+
+        # The spell with a buff is never removed
+        weak.add_buff(SpellBuff())
+        buffing.buffs = []
+        spell_list, dominated_spells = prune_dominated_spells([strong, weak, buffing], Stats(), DamageParameters.from_string('-pa 5'))
+        self.assertListEqual(self._get_short_names(spell_list), ['strong', 'weak'])
+        self.assertEqual(len(dominated_spells), 1)
+        self.assertIs(dominated_spells[0].spell, buffing)
+
+    def test_huppermage_states(self):
+        spells = []
+        for short_name, characteristic, pa, damages, element in (('h1', STRENGTH, 1, 0, 'e'), ('h2', INTELLIGENCE, 1, 0, 'f'), ('a', STRENGTH, 3, 10, None), ('b', INTELLIGENCE, 3, 50, None)):
+            spell = Spell()
+            spell.set_short_name(short_name)
+            spell.set_pa(pa)
+            spell.add_damaging_characteristic(characteristic)
+            spell.set_base_damages(characteristic, {'min': damages, 'max': damages, 'crit_min': damages, 'crit_max': damages})
+            if element is not None:
+                buff = SpellBuff()
+                buff.set_huppermage_states(True)
+                buff.add_new_output_state(f'h:{element}')
+                spell.add_buff(buff)
+            spells.append(spell)
+
+        stats = Stats()
+        stats.set_characteristic(STRENGTH, 900)
+        stats.set_characteristic(INTELLIGENCE, 100)
+        parameters = DamageParameters.from_string('-pa 5')
+
+        # Without the buffs, 'a' dominates 'b', but the Huppermage states add power to every spell so nothing is removed
+        spell_list, dominated_spells = prune_dominated_spells(spells, stats, parameters)
+        self.assertListEqual(self._get_short_names(spell_list), ['h1', 'h2', 'a', 'b'])
+        self.assertListEqual(dominated_spells, [])
+
+        spell_chain = SpellChains()
+        for spell in spell_list:
+            spell_chain.add_spell(spell)
+        damages = spell_chain.get_detailed_damages(stats, parameters)
+        best_combination = next(iter(damages))
+        self.assertSetEqual(set(best_combination), {'h1', 'h2', 'b'})
+        self.assertGreater(damages[best_combination][0], max(value[0] for combination, value in damages.items() if 'a' in combination))
+
+    def test_best_damages_are_kept(self):
+        pruned_count = 0
+        for seed in range(40):
+            rng = random.Random(seed)
+            short_names = [f's{index}' for index in range(rng.randint(3, 6))]
+            spell_set = SpellSet()
+            for short_name in short_names:
+                spell_set.add_spell(generate_spell(rng, short_name, short_names, buff_probability=rng.choice((0, 0.3))))
+            stats = generate_stats(rng)
+            parameters = DamageParameters.from_string(f'-pa {rng.randint(4, 8)} -pomin 0 -pomax 8')
+
+            spell_list = spell_set.get_spell_list_single_target(parameters)
+            pruned_spell_list, _ = prune_dominated_spells(spell_list, stats, parameters)
+            pruned_count += len(spell_list) - len(pruned_spell_list)
+
+            best_damages = []
+            for spells in (spell_list, pruned_spell_list):
+                chain = SpellChains()
+                for spell in spells:
+                    chain.add_spell(spell)
+                best_damages.append([best[1] if best is not None else None for best in chain.get_best_damages_by_pa(stats, parameters).values()])
+
+            for damages, pruned_damages in zip(*best_damages):
+                self.assertEqual(damages is None, pruned_damages is None)
+                if damages is not None:
+                    self.assertTrue(math.isclose(damages, pruned_damages))
+
+        self.assertGreater(pruned_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from lazy_dict import LazyDict, get_loaded
+
+
+class TestLazyDict(unittest.TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        self.errors = []
+
+    def _loader(self, key):
+        self.loaded.append(key)
+        if key == 'bad':
+            raise ValueError('Cannot load.')
+        return key.upper()
+
+    def _get_lazy_dict(self):
+        return LazyDict(['a', 'b', 'bad'], self._loader, self.errors.append)
+
+    def test_lazy_loading(self):
+        lazy_dict = self._get_lazy_dict()
+        self.assertEqual(len(lazy_dict), 3)
+        self.assertListEqual(list(lazy_dict), ['a', 'b', 'bad'])
+        self.assertListEqual(self.loaded, [])
+
+        self.assertEqual(lazy_dict['a'], 'A')
+        self.assertEqual(lazy_dict['a'], 'A')
+        self.assertListEqual(self.loaded, ['a'])
+        self.assertTrue(lazy_dict.is_loaded('a'))
+        self.assertFalse(lazy_dict.is_loaded('b'))
+        self.assertDictEqual(lazy_dict.get_loaded(), {'a': 'A'})
+
+    def test_set_and_delete(self):
+        lazy_dict = self._get_lazy_dict()
+        lazy_dict['c'] = 'C'
+        del lazy_dict['b']
+
+        self.assertListEqual(list(lazy_dict), ['a', 'bad', 'c'])
+        self.assertDictEqual(get_loaded(lazy_dict), {'c': 'C'})
+        self.assertListEqual(self.loaded, [])
+        with self.assertRaises(KeyError):
+            del lazy_dict['b']
+
+    def test_loading_error(self):
+        lazy_dict = self._get_lazy_dict()
+        self.assertNotIn('bad', lazy_dict)
+        self.assertListEqual(self.errors, ['bad'])
+        with self.assertRaises(KeyError):
+            lazy_dict['bad']
+
+        self.assertListEqual(list(lazy_dict), ['a', 'b'])
+        self.assertNotIn('unknown', lazy_dict)
+
+    def test_values(self):
+        lazy_dict = self._get_lazy_dict()
+        self.assertListEqual(lazy_dict.values(), ['A', 'B'])
+        self.assertListEqual(lazy_dict.items(), [('a', 'A'), ('b', 'B')])
+        self.assertListEqual(self.errors, ['bad'])
+
+    def test_get_loaded_dict(self):
+        self.assertDictEqual(get_loaded({'a': 1}), {'a': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
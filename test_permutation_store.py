@@ -0,0 +1,80 @@
+import pickle
+import unittest
+
+from permutation_store import PermutationTrie
+
+
+class TestPermutationTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.permutations = [(), (0,), (0, 1), (0, 1, 2), (0, 2), (1, 0), (2, 1, 0)]
+        self.trie = PermutationTrie(self.permutations)
+
+    def test_sequence(self):
+        self.assertEqual(len(self.trie), 7)
+        self.assertListEqual(list(self.trie), self.permutations)
+        self.assertListEqual([self.trie[index] for index in range(7)], self.permutations)
+        self.assertEqual(self.trie[-1], (2, 1, 0))
+
+        with self.assertRaises(IndexError):
+            self.trie[7]
+
+    def test_prefixes_are_stored_once(self):
+        # Root, 0, 01, 012, 02, 1, 10, 2, 21, 210
+        self.assertEqual(len(self.trie.depths), 10)
+        self.assertListEqual(list(self.trie.iter_nodes()), [(0, 1, 1), (1, 2, 1), (2, 3, 1), (2, 2, 1), (1, 1, 0), (0, 2, 1), (2, 1, 0), (1, 2, 0), (0, 3, 1)])
+
+    def test_get_length(self):
+        self.assertListEqual([self.trie.get_length(index) for index in range(7)], [0, 1, 2, 3, 2, 2, 3])
+        self.assertEqual(self.trie.get_length(-1), 3)
+
+    def test_append(self):
+        trie = PermutationTrie()
+        self.assertEqual(len(trie), 0)
+        self.assertListEqual(list(trie), [])
+        for permutation in self.permutations:
+            trie.append(permutation)
+        self.assertEqual(trie, self.trie)
+
+        # After a permutation sharing a longer prefix
+        for permutation in ((0, 1), (2, 1), ()):
+            with self.assertRaises(ValueError):
+                trie.append(permutation)
+
+        trie.append((2, 2))
+        self.assertEqual(trie[-1], (2, 2))
+
+    def test_string(self):
+        string = self.trie.to_string()
+        self.assertEqual(string, '1|1,0;2,1;3,2;2,2;1,1,0;2,0;1,2,0;2,1,0;3,0')
+
+        trie = PermutationTrie.from_string(string)
+        self.assertEqual(trie, self.trie)
+        self.assertListEqual(list(trie), self.permutations)
+        trie.append((3,))
+        self.assertEqual(len(trie), 8)
+
+        self.assertEqual(PermutationTrie.from_string('0|'), PermutationTrie())
+        with self.assertRaises(ValueError):
+            PermutationTrie.from_string('0|2,1')
+
+    def test_memory_size(self):
+        trie = PermutationTrie(self.permutations)
+        self.assertEqual(trie.get_memory_size(), 10 * (2 + 1 + 1))
+        # With the index of the permutations
+        trie[0]
+        self.assertEqual(trie.get_memory_size(), 10 * (2 + 1 + 1) + (7 + 10) * trie._parents.itemsize)
+
+    def test_pickle(self):
+        # The permutations are sent to the worker processes of the batch jobs
+        trie = pickle.loads(pickle.dumps(self.trie))
+        self.assertEqual(trie, self.trie)
+        self.assertListEqual([trie[index] for index in range(7)], self.permutations)
+
+    def test_invalid_index(self):
+        with self.assertRaises(OverflowError):
+            PermutationTrie([(1 << 16,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
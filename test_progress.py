@@ -0,0 +1,77 @@
+import unittest
+
+from characteristics_damages import *
+from damage_parameters import DamageParameters
+from progress import CancellationToken, ComputationProgress
+from spell import Spell
+from spell_chain import SpellChains
+from stats import Stats
+
+
+class TestProgress(unittest.TestCase):
+
+    def _get_chain(self) -> SpellChains:
+        chain = SpellChains()
+
+        for pa in range(1, 5):
+            spell = Spell()
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': 10 * pa, 'max': 10 * pa, 'crit_min': 10 * pa, 'crit_max': 10 * pa})
+            spell.set_pa(pa)
+            spell.set_short_name(f's{pa}')
+            chain.add_spell(spell)
+
+        return chain
+
+    def test_callback_called_until_total(self):
+        calls = []
+        progress = ComputationProgress(callback=lambda processed, total, eta: calls.append((processed, total)), update_interval=1)
+
+        damages = self._get_chain().get_detailed_damages(Stats(), DamageParameters.from_string('-pa 6'), progress=progress)
+
+        self.assertFalse(progress.cancelled)
+        self.assertEqual(calls[0][0], 0)
+        self.assertEqual(calls[-1][0], calls[-1][1])
+        self.assertGreater(len(damages), 0)
+
+    def test_cancellation_returns_partial_result(self):
+        parameters = DamageParameters.from_string('-pa 6')
+        all_damages = self._get_chain().get_detailed_damages(Stats(), parameters)
+
+        token = CancellationToken()
+        def callback(processed, total, eta):
+            if processed >= 5:
+                token.cancel()
+
+        progress = ComputationProgress(callback=callback, cancellation_token=token, update_interval=1)
+        damages = self._get_chain().get_detailed_damages(Stats(), parameters, progress=progress)
+
+        self.assertTrue(progress.cancelled)
+        self.assertEqual(progress.cancel_reason, 'cancelled')
+        self.assertGreater(len(damages), 0)
+        self.assertLess(len(damages), len(all_damages))
+        # The result is still sorted by decreasing damages
+        averages = [value[0] for value in damages.values()]
+        self.assertListEqual(averages, sorted(averages, reverse=True))
+
+    def test_time_budget(self):
+        progress = ComputationProgress(time_budget=0.0, update_interval=1)
+
+        damages = self._get_chain().get_detailed_damages(Stats(), DamageParameters.from_string('-pa 6'), progress=progress)
+
+        self.assertTrue(progress.cancelled)
+        self.assertEqual(progress.cancel_reason, 'timeout')
+        self.assertEqual(len(damages), 0)
+
+    def test_eta(self):
+        progress = ComputationProgress()
+        progress.start(10)
+
+        self.assertIsNone(progress.get_eta())
+
+        progress.update(5)
+
+        self.assertGreaterEqual(progress.get_eta(), 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
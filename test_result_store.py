@@ -0,0 +1,103 @@
+import random
+import tempfile
+import unittest
+
+import result_store
+from benchmark import generate_spell, generate_stats
+from damage_parameters import DamageParameters
+from result_store import ResultStore
+from spell_chain import SpellChains
+
+
+@unittest.skipIf(result_store.np is None, "The 'numpy' package is not installed.")
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        rng = random.Random(5)
+        short_names = [f's{index}' for index in range(4)]
+        self.spell_chain = SpellChains()
+        for short_name in short_names:
+            spell = generate_spell(rng, short_name, short_names)
+            spell.set_po(min_po=rng.randint(0, 3), max_po=rng.randint(3, 8))
+            self.spell_chain.add_spell(spell)
+        self.stats = generate_stats(rng)
+        self.parameters = DamageParameters.from_string('-pa 8 -pomin 0 -pomax 8')
+        self.chains = list(self.spell_chain.iter_chains(self.stats, self.parameters))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_po(self, combination):
+        spells = [self.spell_chain.spells[self.spell_chain.indexes[short_name]] for short_name in combination]
+        return (max(spell.get_min_po() for spell in spells), min(spell.get_max_po() for spell in spells))
+
+    def test_write_and_read(self):
+        # Small chunks, so that the chains are written and read in several chunks
+        chunk_size = result_store.CHUNK_SIZE
+        result_store.CHUNK_SIZE = 7
+        try:
+            store = ResultStore(self.directory.name)
+            run = store.add_run(self.spell_chain, self.stats, self.parameters, spell_set='set', name='test')
+            stored_chains = list(ResultStore(self.directory.name).iter_chains())
+        finally:
+            result_store.CHUNK_SIZE = chunk_size
+
+        self.assertEqual(run, 0)
+        self.assertEqual(store.runs[0]['count'], len(self.chains))
+        self.assertEqual(len(stored_chains), len(self.chains))
+        for stored_chain, (combination, used_pa, average_damages, damages) in zip(stored_chains, self.chains):
+            self.assertTupleEqual(stored_chain.combination, combination)
+            self.assertEqual(stored_chain.pa, used_pa)
+            self.assertEqual(stored_chain.average_damages, average_damages)
+            self.assertDictEqual(stored_chain.damages, damages)
+            self.assertTupleEqual(stored_chain.po, self._get_po(combination))
+
+        # The spells column is only as wide as the longest chain
+        self.assertEqual(store.get_columns(0)['spells'].shape, (len(self.chains), max(len(chain[0]) for chain in self.chains)))
+
+    def test_best_chain(self):
+        store = ResultStore(self.directory.name)
+        store.add_run(self.spell_chain, self.stats, self.parameters, spell_set='set')
+        store.add_run(self.spell_chain, self.stats, DamageParameters.from_string('-pa 5 -d melee'), spell_set='other', max_length=2)
+
+        for spell in ('s0', 's2'):
+            for po in range(0, 9, 2):
+                expected = [chain for chain in self.chains if spell in chain[0] and self._get_po(chain[0])[0] <= po <= self._get_po(chain[0])[1]]
+                best_chain = store.get_best_chain(spell=spell, po=po, runs=[0])
+                if not expected:
+                    self.assertIsNone(best_chain)
+                    continue
+
+                # Highest average damages, then shortest chain, then first chain
+                best_expected = max(expected, key=lambda chain: (chain[2], -len(chain[0])))
+                self.assertEqual(best_chain.average_damages, best_expected[2])
+                self.assertEqual(len(best_chain.combination), len(best_expected[0]))
+
+        best_chain = store.get_best_chain(max_pa=4, runs=[0], criterion='min')
+        self.assertEqual(best_chain.damages['min'], max(chain[3]['min'] for chain in self.chains if chain[1] <= 4))
+        self.assertIsNone(store.get_best_chain(spell='unknown'))
+        with self.assertRaises(ValueError):
+            store.get_best_chain(criterion='unknown')
+
+    def test_find_runs_and_filters(self):
+        store = ResultStore(self.directory.name)
+        store.add_run(self.spell_chain, self.stats, self.parameters, spell_set='set')
+        store.add_run(self.spell_chain, self.stats, DamageParameters.from_string('-pa 5 -d melee'), spell_set='set', min_damages=200, max_length=2)
+        store.add_run(self.spell_chain, self.stats, self.parameters, spell_set='other', min_damages=10**9)
+
+        store = ResultStore(self.directory.name)
+        self.assertListEqual(store.find_runs(spell_set='set'), [0, 1])
+        self.assertListEqual(store.find_runs(spell_set='set', distance='melee'), [1])
+        self.assertListEqual(store.find_runs(pa=8), [0, 2])
+
+        self.assertEqual(store.runs[2]['count'], 0)
+        self.assertListEqual(list(store.iter_chains(runs=[2])), [])
+        self.assertTrue(all(chain.average_damages >= 200 and len(chain.combination) <= 2 for chain in store.iter_chains(runs=[1])))
+        self.assertListEqual([chain.combination for chain in store.iter_chains(max_length=2, min_damages=200, runs=[0])],
+                             [chain[0] for chain in self.chains if len(chain[0]) <= 2 and chain[2] >= 200])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from characteristics_damages import *
+from manager import Manager
+from server import OptimizationService, create_server
+from spell import Spell
+from spell_set import SpellSet
+from stats import Stats
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.current_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+        self.manager = Manager(lambda code, message: None)
+
+        spell_set = SpellSet()
+        spell_set.set_name('Set')
+        spell_set.set_short_name('set')
+        for index, (pa, base_damage) in enumerate(((2, 20), (3, 35), (4, 50))):
+            spell = Spell()
+            spell.set_short_name(f's{index}')
+            spell.set_pa(pa)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': base_damage, 'max': base_damage, 'crit_min': base_damage, 'crit_max': base_damage})
+            spell.set_uses_per_target(2)
+            self.manager.spells[spell.get_short_name()] = spell
+            spell_set.add_spell(spell)
+        self.manager.spell_sets['set'] = spell_set
+
+        stats = Stats()
+        stats.set_short_name('agi')
+        stats.set_characteristic(AGILITY, 100)
+        self.manager.stats['agi'] = stats
+
+        self.server = create_server(self.manager, port=0, quiet=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        os.chdir(self.current_directory)
+        self.directory.cleanup()
+
+    def _request(self, path, data=None):
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        request = Request(self.url + path, data=body, headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=10) as response:
+                return (response.status, json.loads(response.read().decode('utf-8')))
+        except HTTPError as e:
+            return (e.code, json.loads(e.read().decode('utf-8')))
+
+    def test_health(self):
+        self.assertEqual(self._request('/health'), (200, {'status': 'ok'}))
+        self.assertEqual(self._request('/spell_sets'), (200, {'status': 'ok', 'spell_sets': {'set': ['s0', 's1', 's2']}}))
+
+    def test_damages(self):
+        code, result = self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 8'})
+
+        self.assertEqual(code, 200)
+        self.assertListEqual(result['best_combination'], ['s2', 's2'])
+        self.assertAlmostEqual(result['average_damages'], 100.0)
+        self.assertFalse(result['cached'])
+
+        code, result = self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 8', 'stats': ['agi']})
+        self.assertAlmostEqual(result['average_damages'], 200.0)
+
+        code, result = self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 8', 'mode': 'dmgs'})
+        self.assertAlmostEqual(result['average_damages'], 100.0)
+
+    def test_caches_are_shared(self):
+        self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 6'})
+        self.assertEqual(len(self.manager.cache), 1)
+
+        # Same computation, the name of the parameters is not used
+        code, result = self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 6 -name other'})
+        self.assertEqual(code, 200)
+        self.assertTrue(result['cached'])
+
+        # Same permutations, different stats
+        code, result = self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 6', 'stats': ['agi']})
+        self.assertFalse(result['cached'])
+        self.assertEqual(len(self.manager.cache), 1)
+        self.assertEqual(len(self.server.service.results_cache), 2)
+
+    def test_combination(self):
+        code, result = self._request('/combination', {'spells': ['s0', 's1'], 'parameters': '-pa 8', 'stats': ['agi']})
+
+        self.assertEqual(code, 200)
+        self.assertListEqual(result['combination'], ['s0', 's1'])
+        self.assertEqual(result['pa'], 5)
+        self.assertAlmostEqual(result['average_damages'], 110.0)
+        self.assertNotIn('kill_probability', result)
+
+        self.assertAlmostEqual(self._request('/combination', {'spells': ['s0', 's1'], 'parameters': '-hp 110', 'stats': ['agi']})[1]['kill_probability'], 1.0)
+        self.assertAlmostEqual(self._request('/combination', {'spells': ['s0', 's1'], 'parameters': '-hp 111', 'stats': ['agi']})[1]['kill_probability'], 0.0)
+
+    def test_errors(self):
+        self.assertEqual(self._request('/damages', {'spell_set': 'unknown'}), (400, {'status': 'error', 'error': "Spell set 'unknown' does not exist."}))
+        self.assertEqual(self._request('/damages', {'spell_set': 'set', 'mode': 'other'})[0], 400)
+        self.assertEqual(self._request('/damages', [1, 2])[0], 400)
+        self.assertEqual(self._request('/combination', {'spells': ['unknown']}), (400, {'status': 'error', 'error': "Spell 'unknown' does not exist."}))
+        self.assertEqual(self._request('/unknown', {})[0], 404)
+        self.assertEqual(self._request('/unknown')[0], 404)
+
+    def test_unexpected_error(self):
+        def failing_combination(query):
+            raise ZeroDivisionError('division by zero')
+
+        self.server.service.combination = failing_combination
+        self.assertEqual(self._request('/combination', {'spells': ['s0']}), (500, {'status': 'error', 'error': 'Internal error: ZeroDivisionError: division by zero'}))
+        # The server still answers after the error
+        self.assertEqual(self._request('/health'), (200, {'status': 'ok'}))
+
+    def test_identical_requests_are_coalesced(self):
+        service = self.server.service
+        compute_damages = service._compute_damages
+        calls = []
+        release = threading.Event()
+
+        def slow_compute_damages(*args):
+            calls.append(1)
+            release.wait(5)
+            return compute_damages(*args)
+
+        service._compute_damages = slow_compute_damages
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._request('/damages', {'spell_set': 'set', 'parameters': '-pa 8'})[1])) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while service.single_flight.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.1)  # Let the other requests wait on the computation
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(result['coalesced'] for result in results), 3)
+        self.assertTrue(all(result['average_damages'] == 100.0 for result in results))
+
+    def test_worker_pool(self):
+        service = OptimizationService(self.manager, workers=2)
+        try:
+            result = service.damages({'spell_set': 'set', 'parameters': '-pa 8'})
+        finally:
+            service.close()
+
+        self.assertListEqual(result['best_combination'], ['s2', 's2'])
+        self.assertAlmostEqual(result['average_damages'], 100.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
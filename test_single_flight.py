@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+from single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_are_coalesced(self):
+        single_flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def function():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', function))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while single_flight.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)  # Let the other threads wait on the call
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertListEqual(sorted(results), [(42, False)] + [(42, True)] * 4)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def function():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(single_flight.do('key', function), (1, False))
+        self.assertEqual(single_flight.do('key', function), (2, False))
+        self.assertEqual(single_flight.do('other', function), (3, False))
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        errors = []
+
+        def function():
+            release.wait(5)
+            raise ValueError('error')
+
+        def call():
+            try:
+                single_flight.do('key', function)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while single_flight.in_flight() == 0:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual(errors, ['error'] * 3)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,7 @@ import unittest
 
 from characteristics_damages import *
 from damage_parameters import DamageParameters
-from spell import Spell
+from spell import Spell, SpellBuff
 from stats import Stats
 
 
@@ -397,6 +397,57 @@ class TestSpell(unittest.TestCase):
         self.assertEqual(spell.buffs[0].stats['__all__'].get_characteristic(STRENGTH), 100)
         self.assertEqual(spell.buffs[0].damage_parameters['__all__'].vulnerability, 30)
 
+    def test_compiled_cache(self):
+        spell = Spell()
+        spell.add_damaging_characteristic(AGILITY)
+        buff = SpellBuff()
+        buff.add_trigger_state('st1')
+        spell.add_buff(buff)
+
+        compiled_spell = spell.get_compiled()
+        self.assertIs(spell.get_compiled(), compiled_spell)
+        self.assertTupleEqual(compiled_spell.damaging_characteristics, (AGILITY,))
+
+        spell.set_crit_chance(0.5)
+        self.assertIsNot(spell.get_compiled(), compiled_spell)
+        self.assertEqual(spell.get_compiled().crit_chance, 0.5)
+
+        # Modifying a buff already added to the spell also invalidates it
+        compiled_spell = spell.get_compiled()
+        buff.set_deactivate_damages(True)
+        self.assertIsNot(spell.get_compiled(), compiled_spell)
+        self.assertTrue(spell.get_compiled().buffs[0].deactivate_damages)
+
+        compiled_spell = spell.get_compiled()
+        buff.set_stats(Stats(), spell='other')
+        self.assertIsNot(spell.get_compiled(), compiled_spell)
+        self.assertTrue(buff.has_stats)
+
+        # Building or modifying another buff does not
+        compiled_spell = spell.get_compiled()
+        other_buff = SpellBuff()
+        other_buff.add_trigger_state('st2')
+        self.assertIs(spell.get_compiled(), compiled_spell)
+
+        # Removing a buff from the list directly is detected too
+        del spell.buffs[0]
+        self.assertTupleEqual(spell.get_compiled().buffs, ())
+
+    def test_buff_damage_parameters_to_dict(self):
+        buff = SpellBuff()
+        buff.add_damage_parameters(DamageParameters.from_string('-v 30 -bdmg 1 2 3 4 5'), spell='spell1')
+
+        data = buff.to_dict()
+        loaded_buff = SpellBuff.from_dict(data)
+
+        self.assertIsInstance(data['damage_parameters']['spell1'], dict)
+        self.assertEqual(loaded_buff.damage_parameters['spell1'].vulnerability, 30)
+        self.assertListEqual(loaded_buff.damage_parameters['spell1'].base_damages, [1, 2, 3, 4, 5])
+
+        # Older saves store the parameters as strings
+        data['damage_parameters']['spell1'] = '-v 10'
+        self.assertEqual(SpellBuff.from_dict(data).damage_parameters['spell1'].vulnerability, 10)
+
 
 if __name__ == '__main__':
     unittest.main()
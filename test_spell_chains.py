@@ -1,9 +1,11 @@
+import itertools
 import os
 import shutil
 import unittest
 
 from characteristics_damages import *
 from damage_parameters import DamageParameters
+from progress import CancellationToken, ComputationProgress
 from spell import Spell, SpellBuff
 from spell_chain import SpellChains
 from stats import Stats
@@ -104,6 +106,35 @@ class TestSpellChain(unittest.TestCase):
 
         self.assertEqual(len(permutations), 35)
 
+    def test_get_sub_permutation_spell_families(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('s1')
+        spell1.set_pa(2)
+        spell2 = Spell()
+        spell2.set_short_name('s2')
+        spell2.set_pa(1)
+        for spell in (spell1, spell2, spell1, spell2, spell2):
+            chain.add_spell(spell)
+
+        parameters = DamageParameters.from_string('-pa 4')
+
+        permutations = chain._get_permutations(parameters)
+        short_names = [tuple(chain.spells[index].short_name for index in permutation) for permutation in permutations]
+
+        # Every sequence of short names is generated once, using the instances of a spell in the order they were added
+        expected_short_names = {()}
+        for length in range(1, 5):
+            for sequence in itertools.product(('s1', 's2'), repeat=length):
+                if 2 * sequence.count('s1') + sequence.count('s2') <= 4 and sequence.count('s1') <= 2 and sequence.count('s2') <= 3:
+                    expected_short_names.add(sequence)
+
+        self.assertEqual(len(short_names), len(expected_short_names))
+        self.assertSetEqual(set(short_names), expected_short_names)
+        self.assertIn((1, 0, 3), permutations)
+        self.assertNotIn((3, 0, 1), permutations)
+
 
     def test_detailed_damages_one_permutation_no_buffs_no_stats_no_parameters(self):
         chain = SpellChains()
@@ -781,6 +812,91 @@ class TestSpellChain(unittest.TestCase):
 
         self.assertDictEqual(computation_data.damages, {'min': 11, 'max': 22, 'crit_min': 33, 'crit_max': 44})
 
+    def test_compiled_evaluation_matches_spell_evaluation(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.add_damaging_characteristic(STRENGTH)
+        spell1.set_base_damages(STRENGTH, {'min': 10, 'max': 15, 'crit_min': 12, 'crit_max': 18})
+        spell1.set_crit_chance(0.2)
+        buff_spell1 = SpellBuff()
+        buff_spell1.add_new_output_state('st1')
+        buff_stats = Stats()
+        buff_stats.set_damage(POWER, 40)
+        buff_stats.set_bonus_crit_chance(0.1)
+        buff_spell1.add_stats(buff_stats, spell='spell2')
+        buff_spell1.add_damage_parameters(DamageParameters.from_string('-v 20 -bdmg 0 5 0 0 0'))
+        spell1.add_buff(buff_spell1)
+
+        spell2 = Spell()
+        spell2.set_short_name('spell2')
+        spell2.add_damaging_characteristic(INTELLIGENCE)
+        spell2.set_base_damages(INTELLIGENCE, {'min': 20, 'max': 30, 'crit_min': 25, 'crit_max': 35})
+        spell2.set_base_damages(AGILITY, {'min': 5, 'max': 5, 'crit_min': 6, 'crit_max': 6})
+        spell2.set_crit_chance(0.3)
+        buff_spell2 = SpellBuff()
+        buff_spell2.add_trigger_state('st1')
+        buff_spell2.set_base_damages(INTELLIGENCE, 7)
+        buff_spell2.add_additional_damaging_characteristic(AGILITY)
+        spell2.add_buff(buff_spell2)
+
+        stats = Stats()
+        stats.set_characteristic(STRENGTH, 250)
+        stats.set_characteristic(INTELLIGENCE, 180)
+        stats.set_damage(CRIT, 12)
+        stats.set_damage(FINAL, 10)
+        parameters = DamageParameters.from_string('-r 10 0 -5 20 0 -v 5')
+
+        chain.add_spell(spell1)
+        chain.add_spell(spell2)
+        computation_data = chain._get_detailed_damages_of_permutation([0, 1], stats, parameters)
+
+        # Reference computation with the (uncompiled) spells
+        output1 = spell1.get_damages_and_buffs_with_states(stats, parameters, parameters.starting_states)
+        stats2 = stats + output1.stats['__all__'] + output1.stats['spell2']
+        parameters2 = parameters + output1.parameters['__all__']
+        output2 = spell2.get_damages_and_buffs_with_states(stats2, parameters2, output1.states)
+        crit_chance1 = spell1.get_crit_chance() + stats.get_bonus_crit_chance()
+        crit_chance2 = spell2.get_crit_chance() + stats2.get_bonus_crit_chance()
+
+        self.assertDictEqual(computation_data.damages, {field: output1.damages[field] + output2.damages[field] for field in ('min', 'max', 'crit_min', 'crit_max')})
+        self.assertEqual(computation_data.average_damages, (1 - crit_chance1) * output1.average_damage + crit_chance1 * output1.average_damage_crit
+                                                           + (1 - crit_chance2) * output2.average_damage + crit_chance2 * output2.average_damage_crit)
+        self.assertEqual(computation_data.states, output2.states)
+
+    def test_detailed_damages_impossible_prefix(self):
+        chain = SpellChains()
+
+        for short_name, po in (('a', (0, 2)), ('b', (5, 8)), ('c', (0, 2))):
+            spell = Spell()
+            spell.set_short_name(short_name)
+            spell.set_pa(1)
+            spell.set_uses_per_target(1)
+            spell.set_po(min_po=po[0], max_po=po[1])
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': 10, 'max': 10, 'crit_min': 10, 'crit_max': 10})
+            chain.add_spell(spell)
+
+        # ('a', 'b') is not possible, so ('a', 'b', 'c') has no computed prefix
+        damages = chain.get_detailed_damages(Stats(), DamageParameters.from_string('-pa 3'))
+
+        self.assertSetEqual(set(damages), {('a',), ('b',), ('c',), ('a', 'c'), ('c', 'a')})
+        self.assertAlmostEqual(damages[('a', 'c')][0], 20.0)
+
+    def test_missing_base_damages(self):
+        chain = SpellChains()
+
+        spell = Spell()
+        spell.set_short_name('a')
+        spell.set_pa(1)
+        spell.add_damaging_characteristic(AGILITY)
+        spell.parameters.base_damages[AGILITY] = {}
+        chain.add_spell(spell)
+
+        with self.assertRaisesRegex(ValueError, "Spell 'a' has no base damages for the characteristic AGILITY"):
+            chain.get_detailed_damages(Stats(), DamageParameters.from_string('-pa 1'))
+
     def test_forbidden_states(self):
         chain = SpellChains()
 
@@ -843,6 +959,176 @@ class TestSpellChain(unittest.TestCase):
         self.assertDictEqual(computation_data1.damages, {'min': 1, 'max': 2, 'crit_min': 3, 'crit_max': 4})
         self.assertDictEqual(computation_data2.damages, {'min': 1001, 'max': 2002, 'crit_min': 3003, 'crit_max': 4004})
 
+    def test_best_damages_by_pa(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 10, 'crit_min': 10, 'crit_max': 10})
+        spell1.set_pa(1)
+        spell1.set_short_name('s1')
+
+        spell2 = Spell()
+        spell2.add_damaging_characteristic(AGILITY)
+        spell2.set_base_damages(AGILITY, {'min': 35, 'max': 35, 'crit_min': 35, 'crit_max': 35})
+        spell2.set_pa(3)
+        spell2.set_short_name('s2')
+
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 5')
+
+        chain.add_spell(spell1)
+        chain.add_spell(spell2)
+
+        best_damages_by_pa = chain.get_best_damages_by_pa(stats, parameters)
+
+        self.assertListEqual(list(best_damages_by_pa.keys()), [1, 2, 3, 4, 5])
+        self.assertTupleEqual(best_damages_by_pa[1][0], ('s1',))
+        self.assertAlmostEqual(best_damages_by_pa[1][1], 10.0)
+        self.assertAlmostEqual(best_damages_by_pa[2][1], 10.0)
+        self.assertTupleEqual(best_damages_by_pa[3][0], ('s2',))
+        self.assertSetEqual(set(best_damages_by_pa[4][0]), {'s1', 's2'})
+        self.assertAlmostEqual(best_damages_by_pa[5][1], 45.0)
+        self.assertDictEqual(best_damages_by_pa[5][2], {'min': 45, 'max': 45, 'crit_min': 45, 'crit_max': 45})
+
+    def test_best_damages_by_pa_same_as_detailed_damages(self):
+        chain = SpellChains()
+
+        for pa, base_damage in ((1, 7), (2, 15), (3, 24), (4, 30)):
+            spell = Spell()
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': base_damage, 'max': base_damage + 2, 'crit_min': base_damage, 'crit_max': base_damage + 2})
+            spell.set_pa(pa)
+            spell.set_short_name(f's{pa}')
+            chain.add_spell(spell)
+
+        stats = Stats()
+        best_damages_by_pa = chain.get_best_damages_by_pa(stats, DamageParameters.from_string('-pa 8'))
+
+        for pa in range(1, 8 + 1):
+            damages = chain.get_detailed_damages(stats, DamageParameters.from_string(f'-pa {pa}'))
+            self.assertAlmostEqual(best_damages_by_pa[pa][1], next(iter(damages.values()))[0])
+
+    def test_best_damages_by_pa_no_possible_combination(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_pa(2)
+        chain.add_spell(spell1)
+
+        best_damages_by_pa = chain.get_best_damages_by_pa(Stats(), DamageParameters.from_string('-pa 2'))
+
+        self.assertIsNone(best_damages_by_pa[1])
+        self.assertIsNotNone(best_damages_by_pa[2])
+
+    def test_anytime_same_as_detailed_damages(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 0, 'max': 0, 'crit_min': 0, 'crit_max': 0})
+        buff_spell1 = SpellBuff()
+        buff_spell1.add_new_output_state('st1')
+        spell1.add_buff(buff_spell1)
+        spell1.set_pa(1)
+        spell1.set_short_name('s1')
+
+        spell2 = Spell()
+        spell2.add_damaging_characteristic(AGILITY)
+        spell2.set_base_damages(AGILITY, {'min': 10, 'max': 20, 'crit_min': 30, 'crit_max': 40})
+        buff_spell2 = SpellBuff()
+        buff_spell2.add_trigger_state('st1')
+        buff_spell2.set_base_damages(AGILITY, 100)
+        spell2.add_buff(buff_spell2)
+        spell2.set_pa(2)
+        spell2.set_short_name('s2')
+
+        spell3 = Spell()
+        spell3.add_damaging_characteristic(AGILITY)
+        spell3.set_base_damages(AGILITY, {'min': 40, 'max': 45, 'crit_min': 50, 'crit_max': 55})
+        spell3.set_pa(2)
+        spell3.set_short_name('s3')
+
+        for spell in (spell1, spell2, spell2, spell3):
+            chain.add_spell(spell)
+
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 5')
+
+        damages = chain.get_detailed_damages(stats, parameters)
+        result = chain.get_best_damages_anytime(stats, parameters)
+
+        self.assertTrue(result.is_optimal)
+        self.assertTupleEqual(result.combination, ('s1', 's2', 's2'))
+        self.assertAlmostEqual(result.average_damages, next(iter(damages.values()))[0])
+
+    def test_anytime_with_bound_same_as_detailed_damages(self):
+        chain = SpellChains()
+
+        for pa, base_damage in ((1, 7), (2, 15), (3, 24), (4, 30)):
+            spell = Spell()
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': base_damage, 'max': base_damage + 2, 'crit_min': base_damage, 'crit_max': base_damage + 2})
+            spell.set_pa(pa)
+            spell.set_short_name(f's{pa}')
+            chain.add_spell(spell)
+            chain.add_spell(spell)
+
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 9')
+
+        damages = chain.get_detailed_damages(stats, parameters)
+        result = chain.get_best_damages_anytime(stats, parameters)
+
+        self.assertTrue(result.is_optimal)
+        self.assertAlmostEqual(result.average_damages, next(iter(damages.values()))[0])
+        self.assertLess(result.explored_count, len(damages))
+
+    def test_anytime_timeout(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 10, 'crit_min': 10, 'crit_max': 10})
+        spell1.add_buff(SpellBuff())
+        chain.add_spell(spell1)
+
+        result = chain.get_best_damages_anytime(Stats(), DamageParameters.from_string('-pa 3'), timeout=0.0)
+
+        # The greedy solution is always computed
+        self.assertFalse(result.is_optimal)
+        self.assertAlmostEqual(result.average_damages, 10.0)
+
+    def test_anytime_interrupted(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 10, 'crit_min': 10, 'crit_max': 10})
+        spell1.add_buff(SpellBuff())
+        chain.add_spell(spell1)
+
+        class InterruptingToken(CancellationToken):
+            # Ctrl+C pressed during the depth-first search
+            def is_cancelled(self):
+                raise KeyboardInterrupt
+
+        progress = ComputationProgress(cancellation_token=InterruptingToken())
+        result = chain.get_best_damages_anytime(Stats(), DamageParameters.from_string('-pa 3'), progress=progress)
+
+        # The greedy solution is returned
+        self.assertFalse(result.is_optimal)
+        self.assertAlmostEqual(result.average_damages, 10.0)
+        self.assertEqual(progress.cancel_reason, 'interrupted')
+
+        # A cancelled token stops the search too
+        token = CancellationToken()
+        token.cancel()
+        progress = ComputationProgress(cancellation_token=token)
+        result = chain.get_best_damages_anytime(Stats(), DamageParameters.from_string('-pa 3'), progress=progress)
+        self.assertFalse(result.is_optimal)
+        self.assertEqual(progress.cancel_reason, 'cancelled')
+
     def test_computation_hash(self):
         chain = SpellChains()
 
@@ -858,5 +1144,153 @@ class TestSpellChain(unittest.TestCase):
 
         self.assertEqual(chain._get_computation_hash(parameters), 'eecf0f05b5077b6152bc8e850d9a447ae2d583a7')
 
+        # Only the permutations of these parameters are returned, and they are added to the given cache
+        cache = {'other': None}
+        permutations_cache = chain.get_permutations_cache(parameters, cache)
+        self.assertListEqual(list(permutations_cache), ['eecf0f05b5077b6152bc8e850d9a447ae2d583a7'])
+        self.assertIs(cache['eecf0f05b5077b6152bc8e850d9a447ae2d583a7'], permutations_cache['eecf0f05b5077b6152bc8e850d9a447ae2d583a7'])
+        self.assertIs(chain.get_permutations_cache(parameters, cache)['eecf0f05b5077b6152bc8e850d9a447ae2d583a7'], cache['eecf0f05b5077b6152bc8e850d9a447ae2d583a7'])
+
+    def test_get_rolls(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.set_pa(3)
+        spell1.set_crit_chance(0.2)
+        spell1.add_damaging_characteristic(AGILITY)
+        spell1.add_damaging_characteristic(STRENGTH)
+        spell1.set_base_damages(AGILITY, {'min': 10, 'max': 14, 'crit_min': 13, 'crit_max': 16})
+        spell1.set_base_damages(STRENGTH, {'min': 5, 'max': 5, 'crit_min': 6, 'crit_max': 7})
+        chain.add_spell(spell1)
+
+        spell2 = Spell()
+        spell2.set_short_name('spell2')
+        spell2.set_pa(2)
+        spell2.add_damaging_characteristic(FIRE)
+        spell2.set_base_damages(FIRE, {'min': 20, 'max': 22, 'crit_min': 25, 'crit_max': 27})
+        chain.add_spell(spell2)
+
+        stats = Stats()
+        stats.set_characteristic(AGILITY, 123)
+        stats.set_characteristic(INTELLIGENCE, 57)
+        stats.set_damage(CRIT, 11)
+        stats.set_bonus_crit_chance(0.15)
+        parameters = DamageParameters.from_string('-pa 6 -r 10 0 25 0 -5')
+
+        rolls = chain.get_rolls(('spell1', 'spell2'), stats, parameters)
+        computation_data = chain._get_detailed_damages_of_permutation([0, 1], stats, parameters)
+
+        self.assertEqual([spell_rolls.short_name for spell_rolls in rolls], ['spell1', 'spell2'])
+        self.assertAlmostEqual(rolls[0].crit_chance, 0.35)
+        self.assertEqual([len(damages) for damages, _ in rolls[0].lines], [1, 5])
+        self.assertEqual([len(damages_crit) for _, damages_crit in rolls[0].lines], [2, 4])
+
+        # The spell cannot crit: the crit damages are the normal ones
+        self.assertEqual(rolls[1].lines[0][0], rolls[1].lines[0][1])
+
+        # The extreme rolls give the detailed damages
+        self.assertEqual(sum(damages[0] for spell_rolls in rolls for damages, _ in spell_rolls.lines), computation_data.damages['min'])
+        self.assertEqual(sum(damages[-1] for spell_rolls in rolls for damages, _ in spell_rolls.lines), computation_data.damages['max'])
+        self.assertEqual(sum(damages_crit[0] for spell_rolls in rolls for _, damages_crit in spell_rolls.lines), computation_data.damages['crit_min'])
+        self.assertEqual(sum(damages_crit[-1] for spell_rolls in rolls for _, damages_crit in spell_rolls.lines), computation_data.damages['crit_max'])
+
+    def test_get_rolls_impossible_combination(self):
+        chain = SpellChains()
+
+        spell1 = Spell()
+        spell1.set_short_name('spell1')
+        spell1.set_po(1, 2)
+        chain.add_spell(spell1)
+
+        spell2 = Spell()
+        spell2.set_short_name('spell2')
+        spell2.set_po(5, 6)
+        chain.add_spell(spell2)
+
+        self.assertIsNone(chain.get_rolls(('spell1', 'spell2'), Stats(), DamageParameters.from_string('-pa 6')))
+        self.assertListEqual(chain.get_rolls((), Stats(), DamageParameters.from_string('-pa 6')), [])
+
+
+    def _get_min_pa_chain(self):
+        chain = SpellChains()
+
+        for short_name, pa, base_damages in (('spell1', 2, {'min': 10, 'max': 30, 'crit_min': 10, 'crit_max': 30}),
+                                             ('spell2', 3, {'min': 25, 'max': 25, 'crit_min': 25, 'crit_max': 25}),
+                                             ('spell3', 4, {'min': 45, 'max': 55, 'crit_min': 45, 'crit_max': 55})):
+            spell = Spell()
+            spell.set_short_name(short_name)
+            spell.set_pa(pa)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, base_damages)
+            chain.add_spell(spell)
+            chain.add_spell(spell)
+
+        return chain
+
+    def test_min_pa_combination(self):
+        chain = self._get_min_pa_chain()
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 8')
+
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 20), (('spell1',), 2, 20.0, {'min': 10, 'max': 30, 'crit_min': 10, 'crit_max': 30}))
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 25)[:3], (('spell2',), 3, 25.0))
+        # 4 PA : spell3 (50) is better than spell1, spell1 (40)
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 40)[:3], (('spell3',), 4, 50.0))
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 100)[:3], (('spell3', 'spell3'), 8, 100.0))
+        self.assertIsNone(chain.get_min_pa_combination(stats, parameters, 101))
+
+    def test_min_pa_combination_min_criterion(self):
+        chain = self._get_min_pa_chain()
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 8')
+
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 20, criterion='min')[:3], (('spell2',), 3, 25.0))
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 45, criterion='min')[:3], (('spell3',), 4, 50.0))
+        # 6 PA : spell3 and spell1 (minimum 55) is better than spell2, spell2 (minimum 50)
+        self.assertEqual(set(chain.get_min_pa_combination(stats, parameters, 50, criterion='min')[0]), {'spell1', 'spell3'})
+        self.assertEqual(chain.get_min_pa_combination(stats, parameters, 50, criterion='min')[1:3], (6, 70.0))
+
+        with self.assertRaises(ValueError):
+            chain.get_min_pa_combination(stats, parameters, 50, criterion='max')
+
+    def test_min_pa_combination_min_criterion_mixed_critical_strikes(self):
+        chain = SpellChains()
+        # The first spell deals less damages with a critical strike, the second one more
+        for short_name, min_damages, crit_min_damages in (('spell1', 30, 10), ('spell2', 10, 30)):
+            spell = Spell()
+            spell.set_short_name(short_name)
+            spell.set_pa(3)
+            spell.set_crit_chance(0.5)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': min_damages, 'max': min_damages, 'crit_min': crit_min_damages, 'crit_max': crit_min_damages})
+            chain.add_spell(spell)
+        stats = Stats()
+        parameters = DamageParameters.from_string('-pa 6')
+
+        # Both totals are 40 damages, but only 20 damages are guaranteed (the first spell is a critical strike and not the second one)
+        self.assertIsNone(chain.get_min_pa_combination(stats, parameters, 40, criterion='min'))
+        self.assertEqual(set(chain.get_min_pa_combination(stats, parameters, 20, criterion='min')[0]), {'spell1', 'spell2'})
+
+    def test_min_pa_combination_same_as_detailed_damages(self):
+        chain = self._get_min_pa_chain()
+        stats = Stats()
+        stats.set_characteristic(AGILITY, 120)
+        parameters = DamageParameters.from_string('-pa 9')
+
+        damages = chain.get_detailed_damages(stats, parameters)
+
+        for threshold in (0, 50, 100, 150, 200, 250):
+            expected_pa = min((sum(chain.spells[chain.indexes[short_name]].get_pa() for short_name in combination) for combination, (average_damages, _) in damages.items() if average_damages >= threshold), default=None)
+            result = chain.get_min_pa_combination(stats, parameters, threshold)
+
+            if expected_pa is None:
+                self.assertIsNone(result)
+                continue
+
+            self.assertEqual(result[1], expected_pa)
+            self.assertAlmostEqual(result[2], max(average_damages for combination, (average_damages, _) in damages.items()
+                                                  if sum(chain.spells[chain.indexes[short_name]].get_pa() for short_name in combination) == expected_pa))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import pickle
+import unittest
+
+from spell import SpellBuff
+from states import HUPPERMAGE_COMBINATIONS, HUPPERMAGE_ELEMENTS, HUPPERMAGE_STATES, HUPPERMAGE_TRANSITIONS, STATES, StateRegistry, get_huppermage_buff_transitions, get_huppermage_combination_bit
+
+
+class TestStates(unittest.TestCase):
+
+    def test_registry(self):
+        registry = StateRegistry()
+
+        # Huppermage states are reserved on the first bits
+        self.assertListEqual([registry.get_bit(state) for state in HUPPERMAGE_STATES + HUPPERMAGE_COMBINATIONS], [1 << position for position in range(10)])
+
+        bit = registry.get_bit('new_state')
+        self.assertEqual(bit, 1 << 10)
+        self.assertEqual(registry.get_bit('new_state'), bit)
+        self.assertEqual(len(registry), 11)
+
+        mask = registry.to_mask({'h:e', 'new_state'})
+        self.assertEqual(mask, 0b10000000010)
+        self.assertSetEqual(registry.to_names(mask), {'h:e', 'new_state'})
+        self.assertEqual(registry.to_mask([]), 0)
+        self.assertSetEqual(registry.to_names(0), set())
+
+    def test_huppermage_combination_bit(self):
+        earth, fire = STATES.get_bit('h:e'), STATES.get_bit('h:f')
+
+        self.assertEqual(get_huppermage_combination_bit(earth, fire), STATES.get_bit('H:ef'))
+        self.assertEqual(get_huppermage_combination_bit(fire, earth), STATES.get_bit('H:ef'))
+
+    def test_huppermage_transitions(self):
+        earth, fire, water = (HUPPERMAGE_ELEMENTS.index(element) for element in ('e', 'f', 'w'))
+        earth_bit, fire_bit = STATES.get_bit('h:e'), STATES.get_bit('h:f')
+        earth_fire_bit = STATES.get_bit('H:ef')
+
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[0][earth], (earth_bit, 0, 0))
+        # Same element : nothing happens
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[earth_bit][earth], (earth_bit, 0, 0))
+        # New combination : power and vulnerability for earth/fire
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[earth_bit][fire], (earth_fire_bit, 50, 15))
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[fire_bit][earth], (earth_fire_bit, 50, 15))
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[fire_bit][water], (STATES.get_bit('H:fw'), 50, 0))
+        # Combination already done : no bonus
+        self.assertTupleEqual(HUPPERMAGE_TRANSITIONS[earth_bit | earth_fire_bit][fire], (earth_fire_bit, 0, 0))
+
+    def test_huppermage_buff_transitions(self):
+        earth_bit, fire_bit, water_bit = STATES.get_bit('h:e'), STATES.get_bit('h:f'), STATES.get_bit('h:w')
+
+        transitions = get_huppermage_buff_transitions((earth_bit, fire_bit))
+        self.assertTupleEqual(transitions[0], (STATES.get_bit('H:ef'), 50, 15))
+        # The water/earth combination removes the element state, so the fire state becomes the current one
+        self.assertTupleEqual(transitions[water_bit], (STATES.get_bit('H:ew') | fire_bit, 50, 0))
+        self.assertIs(get_huppermage_buff_transitions((earth_bit, fire_bit)), transitions)
+
+    def test_buff_trigger(self):
+        buff = SpellBuff()
+        buff.add_trigger_states({'st1', 'st2'})
+        buff.add_forbidden_state('st3')
+
+        self.assertTrue(buff.trigger({'st1', 'st2'}))
+        self.assertTrue(buff.trigger(STATES.to_mask({'st1', 'st2', 'st4'})))
+        self.assertFalse(buff.trigger({'st1'}))
+        self.assertFalse(buff.trigger({'st1', 'st2', 'st3'}))
+
+        buff.remove_forbidden_state('st3')
+        self.assertTrue(buff.trigger({'st1', 'st2', 'st3'}))
+
+    def test_buff_masks_are_computed_again_when_unpickled(self):
+        buff = SpellBuff()
+        buff.add_trigger_state('st1')
+        buff.add_new_output_state('st2')
+
+        state = buff.__getstate__()
+        self.assertNotIn('trigger_mask', state)
+
+        loaded_buff = pickle.loads(pickle.dumps(buff))
+        self.assertEqual(loaded_buff.trigger_mask, STATES.get_bit('st1'))
+        self.assertEqual(loaded_buff.new_output_mask, STATES.get_bit('st2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
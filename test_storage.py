@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from characteristics_damages import *
+from damage_parameters import DamageParameters
+from manager import Manager
+from spell import Spell, SpellBuff
+from spell_set import SpellSet
+from stats import Stats
+from storage import JsonStorage, SqliteStorage, Storage
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.current_directory = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.errors = []
+
+    def tearDown(self):
+        os.chdir(self.current_directory)
+        self.directory.cleanup()
+
+    def _get_manager(self, storage=None):
+        return Manager(lambda code, message: self.errors.append(message) if code == 1 else None, storage=storage)
+
+    def _fill_manager(self, manager: Manager):
+        spell_set = SpellSet()
+        spell_set.set_name('Set')
+        spell_set.set_short_name('set')
+        for index in range(3):
+            spell = Spell()
+            spell.set_name(f'Spell {index}')
+            spell.set_short_name(f's{index}')
+            spell.set_pa(index + 2)
+            spell.add_damaging_characteristic(AGILITY)
+            spell.set_base_damages(AGILITY, {'min': 10 * index, 'max': 10 * index + 5, 'crit_min': 10 * index + 5, 'crit_max': 10 * index + 10})
+            if index == 1:
+                buff = SpellBuff()
+                buff.add_trigger_state('x')
+                buff.add_new_output_state('y')
+                spell.add_buff(buff)
+                spell.add_buff(SpellBuff())
+            manager.spells[spell.get_short_name()] = spell
+            spell_set.add_spell(spell)
+        manager.spell_sets['set'] = spell_set
+
+        stats = Stats()
+        stats.set_name('Agility')
+        stats.set_short_name('agi')
+        stats.set_characteristic(AGILITY, 100)
+        manager.stats['agi'] = stats
+
+        manager.parameters['p'] = DamageParameters.from_string('-s agi -pa 6 -hp 100')
+        manager.default_parameters = 'p'
+
+        # Nothing was saved before
+        self.errors.clear()
+
+    def _assert_same_data(self, manager: Manager, loaded_manager: Manager):
+        self.assertListEqual(self.errors, [])
+        self.assertDictEqual({short_name: spell.to_dict() for short_name, spell in loaded_manager.spells.items()}, {short_name: spell.to_dict() for short_name, spell in manager.spells.items()})
+        self.assertDictEqual({short_name: stats.to_dict() for short_name, stats in loaded_manager.stats.items()}, {short_name: stats.to_dict() for short_name, stats in manager.stats.items()})
+        self.assertDictEqual({short_name: [spell.get_short_name() for spell in spell_set] for short_name, spell_set in loaded_manager.spell_sets.items()},
+                             {short_name: [spell.get_short_name() for spell in spell_set] for short_name, spell_set in manager.spell_sets.items()})
+        self.assertDictEqual({name: parameters.to_dict() for name, parameters in loaded_manager.parameters.items()}, {name: parameters.to_dict() for name, parameters in manager.parameters.items()})
+        self.assertEqual(loaded_manager.default_parameters, manager.default_parameters)
+
+    def test_json_storage(self):
+        manager = self._get_manager()
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+
+        self._assert_same_data(manager, self._get_manager())
+        self.assertEqual(JsonStorage().load_spell('s1').to_dict(), manager.spells['s1'].to_dict())
+        with self.assertRaises(KeyError):
+            JsonStorage().load_spell('unknown')
+
+    def test_incomplete_storage(self):
+        class IncompleteStorage(Storage):
+            def load_stats(self, on_error):
+                return {}
+
+        # A backend missing some methods cannot even be created
+        with self.assertRaises(TypeError):
+            IncompleteStorage()
+
+    def test_json_storage_lazy_loading(self):
+        manager = self._get_manager()
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+
+        loaded_manager = self._get_manager()
+        self.assertListEqual(list(loaded_manager.spells), ['s0', 's1', 's2'])
+        self.assertDictEqual(loaded_manager.spells.get_loaded(), {})
+        self.assertDictEqual(loaded_manager.spell_sets.get_loaded(), {})
+
+        # Saving does not need the spells which were not loaded, and keeps them
+        loaded_manager.spells['s0'].set_pa(5)
+        del loaded_manager.spells['s2']
+        loaded_manager.save(print_message=False)
+        self.assertListEqual(list(loaded_manager.spells.get_loaded()), ['s0'])
+        self.assertDictEqual(loaded_manager.spell_sets.get_loaded(), {})
+
+        reloaded_manager = self._get_manager()
+        self.assertListEqual(list(reloaded_manager.spells), ['s0', 's1'])
+        self.assertEqual(reloaded_manager.spells['s0'].get_pa(), 5)
+        self.assertEqual(reloaded_manager.spells['s1'].to_dict(), manager.spells['s1'].to_dict())
+        # The spell set still references the deleted spell
+        self.assertListEqual([spell.get_short_name() for spell in reloaded_manager.spell_sets['set']], ['s0', 's1'])
+        self.assertListEqual(self.errors, ["Cannot add spell 's2' to spell set 'set': it does not exist."])
+
+    def test_json_storage_old_format(self):
+        manager = self._get_manager()
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+
+        # The spells were a list of filepaths
+        with open('manager.json', 'r', encoding='utf-8') as fi:
+            data = json.load(fi)
+        data['spells'] = list(data['spells'].values())
+        with open('manager.json', 'w', encoding='utf-8') as fo:
+            json.dump(data, fo)
+
+        loaded_manager = self._get_manager()
+        self._assert_same_data(manager, loaded_manager)
+        loaded_manager.save(print_message=False)
+        with open('manager.json', 'r', encoding='utf-8') as fi:
+            self.assertListEqual(list(json.load(fi)['spells']), ['s0', 's1', 's2'])
+
+    def test_sqlite_storage(self):
+        manager = self._get_manager(SqliteStorage('data.db'))
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+        manager.storage.close()
+
+        loaded_manager = self._get_manager(SqliteStorage('data.db'))
+        self._assert_same_data(manager, loaded_manager)
+        # The spells are not stored in JSON files
+        self.assertFalse(os.path.exists('manager.json'))
+
+        self.assertEqual(loaded_manager.storage.load_spell('s1').to_dict(), manager.spells['s1'].to_dict())
+        with self.assertRaises(KeyError):
+            loaded_manager.storage.load_spell('unknown')
+        loaded_manager.storage.close()
+
+    def test_sqlite_storage_empty(self):
+        manager = self._get_manager(SqliteStorage('data.db'))
+
+        self.assertEqual(len(self.errors), 1)
+        self.assertIn("SQLite database 'data.db'", self.errors[0])
+        self.assertListEqual(list(manager.parameters), ['__default__'])
+        manager.storage.close()
+
+    def test_sqlite_storage_updates(self):
+        manager = self._get_manager(SqliteStorage('data.db'))
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+        connection = manager.storage.connection
+
+        # Nothing changed: only the metadata is written
+        changes = connection.total_changes
+        manager.save(print_message=False)
+        self.assertEqual(connection.total_changes - changes, 2)
+
+        manager.spells['s0'].set_pa(5)
+        manager.spell_sets['set'].remove_spell(manager.spells['s1'])
+        del manager.spells['s1']
+        manager.stats['agi'].set_characteristic(AGILITY, 200)
+        manager.parameters['q'] = DamageParameters.from_string('-pa 3')
+        manager.save(print_message=False)
+        manager.storage.close()
+
+        loaded_manager = self._get_manager(SqliteStorage('data.db'))
+        self._assert_same_data(manager, loaded_manager)
+        # The buffs are deleted with their spell
+        self.assertEqual(loaded_manager.storage.connection.execute('SELECT COUNT(*) FROM buffs').fetchone()[0], 0)
+        loaded_manager.storage.close()
+
+    def test_sqlite_storage_lazy_loading(self):
+        manager = self._get_manager(SqliteStorage('data.db'))
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+        manager.storage.close()
+
+        loaded_manager = self._get_manager(SqliteStorage('data.db'))
+        self.assertDictEqual(loaded_manager.spells.get_loaded(), {})
+        loaded_manager.spells['s0'].set_pa(5)
+        del loaded_manager.spells['s2']
+        loaded_manager.save(print_message=False)
+        loaded_manager.storage.close()
+
+        reloaded_manager = self._get_manager(SqliteStorage('data.db'))
+        self.assertListEqual(sorted(reloaded_manager.spells), ['s0', 's1'])
+        self.assertEqual(reloaded_manager.spells['s0'].get_pa(), 5)
+        self.assertEqual(reloaded_manager.spells['s1'].to_dict(), manager.spells['s1'].to_dict())
+        reloaded_manager.storage.close()
+
+    def test_sqlite_storage_transaction(self):
+        manager = self._get_manager(SqliteStorage('data.db'))
+        self._fill_manager(manager)
+        manager.save(print_message=False)
+
+        # The spell sets are written after the stats and the spells: a spell set which cannot be written cancels the whole save
+        manager.spells['s0'].set_pa(5)
+        manager.stats['agi'].set_characteristic(AGILITY, 200)
+        manager.spell_sets['set'].name = None
+        with self.assertRaises(sqlite3.IntegrityError):
+            manager.save(print_message=False)
+        manager.storage.close()
+
+        loaded_manager = self._get_manager(SqliteStorage('data.db'))
+        self.assertEqual(loaded_manager.spells['s0'].get_pa(), 2)
+        self.assertEqual(loaded_manager.stats['agi'].characteristics[AGILITY], 100)
+        loaded_manager.storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()